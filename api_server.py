@@ -6,6 +6,7 @@ import time
 import uuid
 import logging
 from logging.handlers import RotatingFileHandler
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional
 from pathlib import Path
 
@@ -104,8 +105,16 @@ sys.path.append(current_dir)
 sys.path.append(os.path.join(current_dir, "indextts"))
 
 from indextts.infer_v2 import IndexTTS2
+from indextts.utils.cancellation import CancellationToken
+from indextts.utils.progress_bus import ProgressBus
+from indextts.utils.prompt_audio import prepare_prompt_file
+from app.routers.outputs import router as outputs_router, set_output_store
+from app.services.output_store import OutputStore
 from tools.i18n.i18n import I18nAuto
 
+# 单个TTS任务的最长合成时间（秒），超时后在下一个检查点（分句/扩散步/GPT解码步）取消合成
+TTS_REQUEST_TIMEOUT = float(os.environ.get("TTS_REQUEST_TIMEOUT", 600))
+
 # 数据模型
 class TTSRequest(BaseModel):
     text: str
@@ -123,6 +132,10 @@ class TTSRequest(BaseModel):
     num_beams: int = 3
     repetition_penalty: float = 10.0
     max_mel_tokens: int = 1500
+    # s2mel 扩散参数, latency_budget: 延迟预算（秒）
+    diffusion_steps: int = 25
+    inference_cfg_rate: float = 0.7
+    latency_budget: Optional[float] = None
     # 情感向量参数
     emo_vec: Optional[List[float]] = None
 
@@ -141,6 +154,9 @@ class ConnectionManager:
         self.max_connections = max_connections  # 最大连接数限制
         self.heartbeat_timeout = heartbeat_timeout  # 心跳超时时间（秒）- 增加到120秒
         self._cleanup_task = None  # 清理任务
+        self.cancel_tokens: Dict[str, tuple] = {}  # task_id -> (client_id, CancellationToken)
+        # 推理线程 -> 事件循环的进度消息，按任务合并，每个任务最多每0.2秒发送一条
+        self.progress_bus = ProgressBus(min_interval=float(os.environ.get("TTS_PROGRESS_INTERVAL", 0.2)))
 
     async def start_cleanup_task(self):
         """启动定期清理任务"""
@@ -210,7 +226,22 @@ class ConnectionManager:
         await self.start_cleanup_task()
         return True
 
+    def register_task(self, task_id: str, client_id: str, token: CancellationToken):
+        """登记任务的取消令牌，客户端断开时取消其正在合成的任务"""
+        self.cancel_tokens[task_id] = (client_id, token)
+
+    def unregister_task(self, task_id: str):
+        self.cancel_tokens.pop(task_id, None)
+        self.progress_bus.discard(task_id)
+
+    def cancel_client_tasks(self, client_id: str, reason: str = "client disconnected"):
+        for task_id, (owner, token) in list(self.cancel_tokens.items()):
+            if owner == client_id:
+                token.cancel(reason)
+                logger.info(f"Cancelled task {task_id} of client {client_id}: {reason}")
+
     async def disconnect(self, client_id: str):
+        self.cancel_client_tasks(client_id)
         if client_id not in self.active_connections:
             logger.debug(f"Client {client_id} not found, skipping disconnect")
             return
@@ -324,6 +355,9 @@ class ConnectionManager:
 app = FastAPI(title="IndexTTS API Server", version="2.0.0")
 manager = ConnectionManager()
 tts_engine: Optional[IndexTTS2] = None
+# IndexTTS2的说话人/情感条件缓存、GPT前缀KV缓存、DiT缓存等是实例状态，不是线程安全的：
+# 所有合成在这个单线程执行器中依次运行
+tts_infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-infer")
 i18n = I18nAuto(language="Auto")
 active_tasks: Dict[str, dict] = {}
 
@@ -371,10 +405,23 @@ os.makedirs("uploads", exist_ok=True)
 os.makedirs("audio_samples", exist_ok=True)
 os.makedirs("audio_samples/voice_samples", exist_ok=True)
 os.makedirs("audio_samples/emotion_samples", exist_ok=True)
-app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
 app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
 app.mount("/audio-samples", StaticFiles(directory="audio_samples"), name="audio_samples")
 
+# 合成结果按内容存放在 outputs/blobs 下，过期索引 outputs/index.sqlite3，/outputs/{task_id}.wav 支持Range请求
+output_store = OutputStore("outputs", ttl=float(os.environ.get("TTS_OUTPUT_TTL", 24 * 3600)))
+set_output_store(output_store)
+app.include_router(outputs_router)
+output_cleanup_task = None
+
+def prepare_uploaded_audio(file_path: str) -> str:
+    """上传音频预处理：去除首尾静音、响度归一化，保存为同名wav，失败时返回原路径"""
+    try:
+        return prepare_prompt_file(file_path)
+    except Exception as e:
+        logger.warning(f"音频预处理失败，使用原始文件: {file_path}, 错误: {e}")
+        return file_path
+
 def resolve_sample_path(sample_id: str) -> Optional[str]:
     """
     根据样本ID解析实际的文件路径
@@ -463,15 +510,14 @@ class ProgressCallback:
         """发送任务完成消息，包含额外的连接验证"""
         # 确保文件已完全写入
         if result.startswith('/outputs/'):
-            file_path = f"./outputs/{result.split('/')[-1]}"
-            # 等待文件写入完成
+            output_name = result.split('/')[-1]
+            # 等待输出入库
             for i in range(10):  # 最多等待5秒
-                if os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+                if output_store.resolve(output_name) is not None:
                     break
                 await asyncio.sleep(0.5)
-            
-            if not os.path.exists(file_path):
-                print(f"警告: 音频文件不存在 {file_path}")
+            else:
+                print(f"警告: 音频文件不存在 {output_name}")
         
         complete_message = {
             "type": "complete",
@@ -525,6 +571,14 @@ async def shutdown_event():
     # 停止连接清理任务
     await manager.stop_cleanup_task()
 
+    # 停止输出清理任务
+    if output_cleanup_task:
+        output_cleanup_task.cancel()
+        try:
+            await output_cleanup_task
+        except asyncio.CancelledError:
+            pass
+
     # 关闭所有活跃连接
     if manager.active_connections:
         print(f"🔌 关闭 {len(manager.active_connections)} 个活跃连接")
@@ -545,7 +599,11 @@ async def get_stats():
 
 @app.on_event("startup")
 async def startup_event():
-    global tts_engine
+    global tts_engine, output_cleanup_task
+    # 后台按过期索引清理输出
+    output_cleanup_task = asyncio.create_task(
+        output_store.run_cleanup(float(os.environ.get("TTS_OUTPUT_CLEANUP_INTERVAL", 600)))
+    )
     try:
         # 初始化TTS引擎
         model_dir = "./checkpoints"
@@ -665,12 +723,19 @@ async def generate_tts(
     prompt_text: str = "",
     prompt_lang: str = "zh",
     text_lang: str = "zh",
-    cut_method: str = "cut5"
+    cut_method: str = "cut5",
+    diffusion_steps: int = 25,
+    inference_cfg_rate: float = 0.7,
+    latency_budget: Optional[float] = None
 ):
     """生成TTS音频的异步函数"""
 
     # 创建进度回调对象
     progress_callback = ProgressCallback(client_id, task_id, manager)
+    output_path = None
+    # 客户端断开或超时后取消合成，释放GPU
+    cancel_token = CancellationToken(timeout=TTS_REQUEST_TIMEOUT)
+    manager.register_task(task_id, client_id, cancel_token)
 
     try:
         # 发送任务开始消息
@@ -709,6 +774,9 @@ async def generate_tts(
             with open(prompt_audio_path, "wb") as f:
                 content = await prompt_audio.read()
                 f.write(content)
+            # 解码、去静音、响度归一化较慢，在线程池中进行，不阻塞事件循环
+            prompt_audio_path = await asyncio.get_event_loop().run_in_executor(
+                None, prepare_uploaded_audio, prompt_audio_path)
             print(f"提示音频保存到: {prompt_audio_path}")
 
         # 处理情绪音频
@@ -726,6 +794,9 @@ async def generate_tts(
             with open(emo_audio_path, "wb") as f:
                 content = await emo_audio.read()
                 f.write(content)
+            # 解码、去静音、响度归一化较慢，在线程池中进行，不阻塞事件循环
+            emo_audio_path = await asyncio.get_event_loop().run_in_executor(
+                None, prepare_uploaded_audio, emo_audio_path)
             print(f"情感音频保存到: {emo_audio_path}")
         
         # 检查连接状态
@@ -735,27 +806,30 @@ async def generate_tts(
             
         await progress_callback.send_progress(15, "初始化TTS模型")
         
-        # 创建一个简单的进度回调函数，用于兼容现有的TTS接口
+        # 进度回调在推理线程中调用：经ProgressBus合并后由事件循环发送，不阻塞推理
+        publish_progress = manager.progress_bus.publisher(task_id, progress_callback.send_progress)
+
         def sync_progress_callback(progress: float, desc: str = ""):
-            progress_percent = int(progress * 100)
-            # 使用asyncio.create_task异步发送进度
-            try:
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    asyncio.create_task(progress_callback.send_progress(progress_percent, desc))
-            except Exception as e:
-                print(f"进度回调错误: {e}")
+            publish_progress(int(progress * 100), desc)
         
-        # 调用TTS生成函数
-        output_path = f"./outputs/{task_id}.wav"
+        # 调用TTS生成函数：先合成到临时文件，完成后移入输出存储
+        output_path = str(output_store.staging_path())
         
         await progress_callback.send_progress(20, "开始语音合成")
         
         # 这里调用实际的TTS生成函数
         # 注意：需要根据实际的TTS函数接口进行调整
-        success = await asyncio.get_event_loop().run_in_executor(
-            None,
-            lambda: tts_generate_with_callback(
+        submitted_at = time.monotonic()
+
+        def run_tts():
+            # 排队期间已取消或超时的任务不再开始合成
+            if cancel_token.cancelled:
+                return False
+            # 延迟预算从提交时算起：扣除排队等待推理线程的时间，剩余部分交给引擎规划
+            remaining_budget = None
+            if latency_budget is not None:
+                remaining_budget = max(0.0, latency_budget - (time.monotonic() - submitted_at))
+            return tts_generate_with_callback(
                 text=text,
                 voice_name=voice_name,
                 output_path=output_path,
@@ -772,10 +846,25 @@ async def generate_tts(
                 prompt_lang=prompt_lang,
                 text_lang=text_lang,
                 cut_method=cut_method,
+                diffusion_steps=diffusion_steps,
+                inference_cfg_rate=inference_cfg_rate,
+                latency_budget=remaining_budget,
+                cancel_token=cancel_token,
                 progress_callback=sync_progress_callback
             )
-        )
-        
+
+        success = await asyncio.get_event_loop().run_in_executor(tts_infer_executor, run_tts)
+        # 合成已结束：先送出（或丢弃）进度总线中尚未发送的更新，之后的完成/错误消息不会被旧进度追上
+        await manager.progress_bus.close(task_id, flush=not cancel_token.cancelled)
+
+        if cancel_token.cancelled:
+            print(f"=== TTS任务已取消 ===")
+            print(f"任务ID: {task_id}")
+            print(f"原因: {cancel_token.reason}")
+            if manager.get_connection_info(client_id).get("connected"):
+                await progress_callback.send_error(f"任务已取消: {cancel_token.reason}")
+            return
+
         # 检查生成是否成功
         if not success or not os.path.exists(output_path):
             error_msg = "TTS生成失败或输出文件不存在"
@@ -786,21 +875,23 @@ async def generate_tts(
             await progress_callback.send_error(error_msg)
             return
         
+        # 移入输出存储（临时文件被移走）
+        stored_path = await asyncio.get_event_loop().run_in_executor(
+            None, lambda: output_store.put(output_path, f"{task_id}.wav")
+        )
+        
         # 最终检查连接状态
         connection_info = manager.get_connection_info(client_id)
         if not connection_info.get("connected"):
             print(f"=== 生成完成但连接已断开 ===")
             print(f"任务ID: {task_id}")
             print(f"客户端ID: {client_id}")
-            print(f"输出文件: {output_path}")
+            print(f"输出文件: {stored_path}")
             return
-        
+
         # 发送100%进度
         await progress_callback.send_progress(100, "语音合成完成")
         
-        # 等待文件完全写入
-        await asyncio.sleep(0.5)
-        
         # 发送完成消息
         audio_url = f"/outputs/{task_id}.wav"
         success = await progress_callback.send_complete(audio_url)
@@ -808,9 +899,9 @@ async def generate_tts(
         if success:
             print(f"=== TTS任务完成 ===")
             print(f"任务ID: {task_id}")
-            print(f"输出文件: {output_path}")
+            print(f"输出文件: {stored_path}")
             print(f"音频URL: {audio_url}")
-            print(f"文件大小: {os.path.getsize(output_path)} bytes")
+            print(f"文件大小: {os.path.getsize(stored_path)} bytes")
         else:
             print(f"=== 完成消息发送失败 ===")
             print(f"任务ID: {task_id}")
@@ -826,13 +917,17 @@ async def generate_tts(
         
         # 尝试发送错误消息
         try:
+            await manager.progress_bus.close(task_id, flush=False)
             await progress_callback.send_error(error_msg)
         except Exception as send_error:
             print(f"发送错误消息失败: {send_error}")
     
     finally:
+        manager.unregister_task(task_id)
         # 清理临时文件
         try:
+            if output_path and os.path.exists(output_path):
+                os.remove(output_path)
             if prompt_audio_path and os.path.exists(prompt_audio_path):
                 os.remove(prompt_audio_path)
             if emo_audio_path and os.path.exists(emo_audio_path):
@@ -870,6 +965,10 @@ def tts_generate_with_callback(
     emo_control_method: str = "audio",
     emo_text: str = None,
     emo_vector: list = None,
+    diffusion_steps: int = 25,
+    inference_cfg_rate: float = 0.7,
+    latency_budget: Optional[float] = None,
+    cancel_token: Optional[CancellationToken] = None,
     progress_callback=None
 ) -> bool:
     """
@@ -899,8 +998,16 @@ def tts_generate_with_callback(
             'spk_audio_prompt': prompt_audio_path,
             'text': text.strip(),
             'output_path': output_path,
-            'verbose': True
+            'verbose': True,
+            'diffusion_steps': diffusion_steps,
+            'inference_cfg_rate': inference_cfg_rate,
+            'latency_budget': latency_budget,
+            'cancel_token': cancel_token,
+            'progress_callback': progress_callback,
         }
+        # infer_seed < 0: 不固定随机种子
+        if infer_seed is not None and infer_seed >= 0:
+            infer_kwargs['seed'] = infer_seed
 
         # 添加情感控制参数
         if emo_audio_path and os.path.exists(emo_audio_path):
@@ -953,11 +1060,8 @@ async def segment_text(text: str = Form(...), max_tokens: int = Form(120)):
         raise HTTPException(status_code=500, detail="TTS Engine not initialized")
     
     try:
-        text_tokens_list = tts_engine.tokenizer.tokenize(text)
-        segments = tts_engine.tokenizer.split_segments(
-            text_tokens_list, 
-            max_text_tokens_per_segment=max_tokens
-        )
+        # 与合成时相同的流式分句（逐段正则化/分词）
+        segments = tts_engine.tokenizer.iter_segments(text, max_text_tokens_per_segment=max_tokens)
         
         result = []
         for i, segment in enumerate(segments):
@@ -1172,8 +1276,8 @@ async def upload_audio_sample(
         save_dir.mkdir(parents=True, exist_ok=True)
         save_path = save_dir / filename
 
-        # 检查文件是否已存在
-        if save_path.exists():
+        # 检查文件是否已存在（预处理后会保存为同名wav）
+        if save_path.exists() or save_path.with_suffix(".wav").exists():
             # 添加时间戳避免冲突
             timestamp = int(time.time())
             stem = save_path.stem
@@ -1184,6 +1288,9 @@ async def upload_audio_sample(
         content = await file.read()
         with open(save_path, "wb") as f:
             f.write(content)
+        save_path = Path(await asyncio.get_event_loop().run_in_executor(
+            None, prepare_uploaded_audio, str(save_path)))
+        filename = save_path.name
 
         logger.info(f"音频样本上传成功: {save_path}")
 
@@ -3,6 +3,7 @@ IndexTTS API Server v2
 重构后的模块化API服务器
 """
 
+import asyncio
 import os
 import sys
 import logging
@@ -24,8 +25,11 @@ sys.path.insert(0, os.path.join(current_dir, "indextts"))
 # 导入应用模块
 from app.core.websocket_manager import WebSocketManager
 from app.services.tts_service import TTSService
+from app.services.output_store import OutputStore
+from app.services.response_cache import ResponseCache
 from app.services.audio_samples_service import AudioSamplesService
-from app.routers import audio_samples_router, tts_router, websocket_router
+from app.routers import audio_samples_router, outputs_router, tts_router, websocket_router
+from app.routers.outputs import set_output_store
 from app.routers.tts import set_services as set_tts_services
 from app.routers.websocket import set_ws_manager
 
@@ -135,6 +139,18 @@ async def lifespan(app: FastAPI):
         audio_service = AudioSamplesService()
         logger.info("✓ 音频样本服务初始化成功")
 
+        # 初始化输出存储，后台按过期索引清理
+        logger.info("初始化输出存储...")
+        output_store = OutputStore(
+            root="outputs",
+            ttl=float(os.environ.get("TTS_OUTPUT_TTL", 24 * 3600))
+        )
+        set_output_store(output_store)
+        app.state.output_cleanup_task = asyncio.create_task(
+            output_store.run_cleanup(float(os.environ.get("TTS_OUTPUT_CLEANUP_INTERVAL", 600)))
+        )
+        logger.info("✓ 输出存储初始化成功")
+
         # 初始化TTS服务
         logger.info("初始化TTS服务...")
         tts_service = TTSService(
@@ -142,7 +158,14 @@ async def lifespan(app: FastAPI):
             output_dir="outputs",
             use_fp16=False,
             use_cuda_kernel=False,
-            use_deepspeed=False
+            use_deepspeed=False,
+            response_cache=ResponseCache(
+                cache_dir="outputs/cache",
+                max_entries=int(os.environ.get("TTS_RESPONSE_CACHE_ENTRIES", 1000)),
+                max_bytes=int(os.environ.get("TTS_RESPONSE_CACHE_BYTES", 2 << 30)),
+                ttl=float(os.environ.get("TTS_RESPONSE_CACHE_TTL", 7 * 24 * 3600))
+            ),
+            output_store=output_store
         )
         logger.info("✓ TTS服务初始化成功")
 
@@ -153,6 +176,7 @@ async def lifespan(app: FastAPI):
         app.state.ws_manager = ws_manager
         app.state.tts_service = tts_service
         app.state.audio_service = audio_service
+        app.state.output_store = output_store
 
         logger.info("=" * 60)
         logger.info("✓ 所有服务初始化完成")
@@ -173,6 +197,15 @@ async def lifespan(app: FastAPI):
         for client_id in list(app.state.ws_manager.active_connections.keys()):
             app.state.ws_manager.disconnect(client_id)
 
+    if hasattr(app.state, "output_cleanup_task"):
+        app.state.output_cleanup_task.cancel()
+        try:
+            await app.state.output_cleanup_task
+        except asyncio.CancelledError:
+            pass
+    if hasattr(app.state, "output_store"):
+        app.state.output_store.close()
+
     logger.info("✓ 服务已关闭")
 
 
@@ -211,8 +244,7 @@ def create_app() -> FastAPI:
     os.makedirs("audio_samples/voice_samples", exist_ok=True)
     os.makedirs("audio_samples/emotion_samples", exist_ok=True)
     
-    # 挂载静态文件目录
-    app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
+    # 挂载静态文件目录（合成结果由outputs路由从输出存储中读取，支持Range请求）
     app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
     app.mount("/audio-samples", StaticFiles(directory="audio_samples"), name="audio_samples")
     
@@ -221,6 +253,7 @@ def create_app() -> FastAPI:
     # 注册路由
     app.include_router(websocket_router)
     app.include_router(audio_samples_router)
+    app.include_router(outputs_router)
     app.include_router(tts_router)
     
     # ==================== 基础路由 ====================
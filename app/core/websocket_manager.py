@@ -8,19 +8,26 @@ import logging
 from typing import Dict, Optional, Callable, Any
 from fastapi import WebSocket
 
+from indextts.utils.cancellation import CancellationToken
+from indextts.utils.progress_bus import ProgressBus
+
 logger = logging.getLogger(__name__)
 
 
 class WebSocketManager:
     """WebSocket连接管理器"""
     
-    def __init__(self):
+    def __init__(self, progress_interval: float = 0.2):
         # 存储活动连接: client_id -> WebSocket
         self.active_connections: Dict[str, WebSocket] = {}
         # 存储任务映射: task_id -> client_id
         self.task_to_client: Dict[str, str] = {}
+        # 存储任务的取消令牌: task_id -> CancellationToken
+        self.cancel_tokens: Dict[str, CancellationToken] = {}
         # 心跳任务
         self.heartbeat_tasks: Dict[str, asyncio.Task] = {}
+        # 推理线程 -> 事件循环的进度消息，每个任务最多每 progress_interval 秒发送一条
+        self.progress_bus = ProgressBus(min_interval=progress_interval)
     
     async def connect(self, websocket: WebSocket, client_id: str) -> None:
         """接受新的WebSocket连接"""
@@ -50,14 +57,25 @@ class WebSocketManager:
         ]
         for task_id in tasks_to_remove:
             del self.task_to_client[task_id]
-    
-    def register_task(self, task_id: str, client_id: str) -> None:
-        """注册任务与客户端的映射关系"""
+            self.progress_bus.discard(task_id)
+            # 客户端已断开，取消其正在进行的合成
+            token = self.cancel_tokens.pop(task_id, None)
+            if token is not None:
+                token.cancel("client disconnected")
+                logger.info(f"任务已取消: {task_id}（客户端断开）")
+    
+    def register_task(self, task_id: str, client_id: str,
+                      cancel_token: Optional[CancellationToken] = None) -> None:
+        """注册任务与客户端的映射关系，以及任务的取消令牌（可选）"""
         self.task_to_client[task_id] = client_id
+        if cancel_token is not None:
+            self.cancel_tokens[task_id] = cancel_token
         logger.debug(f"任务已注册: {task_id} -> {client_id}")
     
     def unregister_task(self, task_id: str) -> None:
         """注销任务"""
+        self.cancel_tokens.pop(task_id, None)
+        self.progress_bus.discard(task_id)
         if task_id in self.task_to_client:
             del self.task_to_client[task_id]
             logger.debug(f"任务已注销: {task_id}")
@@ -130,26 +148,16 @@ class WebSocketManager:
         return client_id in self.active_connections
     
     def create_progress_callback(self, task_id: str) -> Callable[[float, str], None]:
-        """创建进度回调函数"""
-        def callback(progress: float, message: str) -> None:
-            """进度回调"""
-            try:
-                # 使用asyncio在事件循环中发送消息
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    asyncio.create_task(self.send_to_task(task_id, {
-                        "type": "progress",
-                        "task_id": task_id,
-                        "progress": progress,
-                        "message": message,
-                        "status": "processing"
-                    }))
-                else:
-                    logger.warning("事件循环未运行，无法发送进度消息")
-            except Exception as e:
-                logger.error(f"进度回调失败: {task_id}, 错误: {e}")
-        
-        return callback
+        """
+        创建进度回调函数（需在事件循环中调用）
+
+        返回的回调可以在任意线程（如推理线程）中调用，不会阻塞：
+        更新经 ProgressBus 合并后在事件循环中发送
+        """
+        async def send(progress: float, message: str) -> None:
+            await self.send_progress_message(task_id, progress, message)
+
+        return self.progress_bus.publisher(task_id, send)
     
     async def send_start_message(self, task_id: str) -> bool:
         """发送任务开始消息"""
@@ -181,6 +189,8 @@ class WebSocketManager:
         result: str
     ) -> bool:
         """发送任务完成消息"""
+        # 先发出尚未发送的最新进度，保证进度消息在完成消息之前
+        await self.progress_bus.close(task_id)
         success = await self.send_to_task(task_id, {
             "type": "complete",
             "task_id": task_id,
@@ -199,6 +209,7 @@ class WebSocketManager:
         error: str
     ) -> bool:
         """发送错误消息"""
+        await self.progress_bus.close(task_id, flush=False)
         success = await self.send_to_task(task_id, {
             "type": "error",
             "task_id": task_id,
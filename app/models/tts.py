@@ -24,6 +24,13 @@ class TTSRequest(BaseModel):
     num_beams: int = Field(default=3, description="束搜索数量")
     repetition_penalty: float = Field(default=10.0, description="重复惩罚")
     max_mel_tokens: int = Field(default=1500, description="最大mel token数")
+    seed: Optional[int] = Field(None, ge=0, description="随机种子，相同请求+相同种子生成相同音频；None表示不固定")
+
+    # s2mel 扩散参数
+    diffusion_steps: int = Field(default=25, ge=1, description="扩散步数")
+    inference_cfg_rate: float = Field(default=0.7, ge=0.0, description="CFG强度，0表示关闭CFG")
+    latency_budget: Optional[float] = Field(
+        None, gt=0, description="延迟预算（秒），设置后按本机实测开销自动降低扩散步数/CFG/束搜索数量")
     
     # 情感向量参数
     emo_vec: Optional[List[float]] = Field(None, description="情感向量")
@@ -3,6 +3,7 @@ Audio Samples Router
 音频样本管理路由
 """
 
+import asyncio
 import logging
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException
 from typing import Optional
@@ -66,12 +67,15 @@ async def upload_audio_sample(
         
         logger.info(f"上传音频样本: {file.filename}, 分类: {category}, 大小: {len(file_content)} bytes")
         
-        # 保存文件
-        sample_info = audio_service.save_uploaded_file(
-            file_content=file_content,
-            filename=file.filename or "unknown.wav",
-            category=category,
-            custom_name=name
+        # 保存文件（含音频预处理，在线程池中进行，不阻塞事件循环）
+        sample_info = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: audio_service.save_uploaded_file(
+                file_content=file_content,
+                filename=file.filename or "unknown.wav",
+                category=category,
+                custom_name=name
+            )
         )
         
         logger.info(f"音频样本上传成功: {sample_info.id}")
@@ -0,0 +1,114 @@
+"""
+Outputs Router
+合成结果下载（支持Range请求）
+"""
+
+import logging
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from ..services.output_store import OutputStore
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(tags=["outputs"])
+
+# 全局输出存储（将在应用启动时注入）
+output_store: Optional[OutputStore] = None
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+CHUNK_SIZE = 64 * 1024
+
+
+def set_output_store(store: OutputStore):
+    """设置输出存储"""
+    global output_store
+    output_store = store
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    解析单段 ``Range: bytes=start-end``（含 ``bytes=start-`` 与后缀形式 ``bytes=-n``），返回闭区间。
+    没有或无法解析的Range返回None（按整个文件响应），范围无法满足时抛出416。
+    """
+    if not range_header:
+        return None
+    match = RANGE_PATTERN.match(range_header.strip())
+    if match is None:
+        # 多段Range等不支持的形式，按整个文件响应
+        return None
+    start, end = match.groups()
+    if start == "" and end == "":
+        return None
+    if start == "":
+        length = int(end)
+        if length == 0:
+            raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = size - 1 if end == "" else min(int(end), size - 1)
+    if start >= size or start > end:
+        raise HTTPException(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+def _iter_file(f, start: int, length: int):
+    with f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def _resolve(name: str) -> Tuple[Path, Optional[str], int]:
+    if Path(name).name != name or not name.endswith(".wav"):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    stored = output_store.resolve(name) if output_store else None
+    if stored is not None:
+        return stored
+    # 迁移前直接写在输出目录下的旧文件
+    if output_store is not None:
+        legacy_path = output_store.root / name
+        if legacy_path.is_file():
+            return legacy_path, None, legacy_path.stat().st_size
+    raise HTTPException(status_code=404, detail="文件不存在")
+
+
+@router.api_route("/outputs/{name}", methods=["GET", "HEAD"])
+async def get_output(name: str, request: Request):
+    """下载合成结果，支持 ``Range`` 断点/拖动播放与基于内容哈希的 ``ETag``"""
+    path, digest, size = _resolve(name)
+    headers = {"Accept-Ranges": "bytes", "Cache-Control": "private, max-age=3600"}
+    if digest is not None:
+        etag = f'"{digest}"'
+        headers["ETag"] = etag
+        if request.headers.get("if-none-match") == etag:
+            return Response(status_code=304, headers=headers)
+
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        start, end = byte_range
+        status_code = 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type="audio/wav")
+    try:
+        # 先打开文件：之后即使过期清理删除了内容文件，本次下载仍可读完
+        f = open(path, "rb")
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return StreamingResponse(
+        _iter_file(f, start, length), status_code=status_code, headers=headers, media_type="audio/wav"
+    )
@@ -3,6 +3,7 @@ TTS Router
 TTS生成路由
 """
 
+import asyncio
 import os
 import uuid
 import logging
@@ -10,6 +11,7 @@ from pathlib import Path
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from typing import Optional
 
+from indextts.utils.cancellation import CancellationToken, SynthesisCancelled
 from ..models.tts import TTSRequest
 from ..services.tts_service import TTSService
 from ..services.audio_samples_service import AudioSamplesService
@@ -19,6 +21,9 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/tts", tags=["tts"])
 
+# 单个任务的最长合成时间（秒），超时后合成在下一个检查点取消
+TTS_REQUEST_TIMEOUT = float(os.environ.get("TTS_REQUEST_TIMEOUT", 600))
+
 # 全局服务实例（将在应用启动时注入）
 tts_service: Optional[TTSService] = None
 audio_service: Optional[AudioSamplesService] = None
@@ -61,6 +66,10 @@ async def generate_tts(
     num_beams: int = Form(3),
     repetition_penalty: float = Form(10.0),
     max_mel_tokens: int = Form(1500),
+    seed: Optional[int] = Form(None),
+    diffusion_steps: int = Form(25),
+    inference_cfg_rate: float = Form(0.7),
+    latency_budget: Optional[float] = Form(None),
 ):
     """
     生成TTS语音
@@ -79,8 +88,9 @@ async def generate_tts(
         
         logger.info(f"收到TTS生成请求: task_id={task_id}, client_id={client_id}")
         
-        # 注册任务
-        ws_manager.register_task(task_id, client_id)
+        # 注册任务，客户端断开或超时后取消合成
+        cancel_token = CancellationToken(timeout=TTS_REQUEST_TIMEOUT)
+        ws_manager.register_task(task_id, client_id, cancel_token)
         
         # 发送开始消息
         await ws_manager.send_start_message(task_id)
@@ -103,6 +113,9 @@ async def generate_tts(
             with open(temp_prompt_file, "wb") as f:
                 f.write(await prompt_audio.read())
             
+            # 解码、去静音、响度归一化较慢，在线程池中进行，不阻塞事件循环
+            temp_prompt_file = await asyncio.get_running_loop().run_in_executor(
+                None, audio_service.prepare_file, temp_prompt_file)
             prompt_audio_path = temp_prompt_file
             logger.info(f"使用上传的音色文件: {prompt_audio.filename}")
         else:
@@ -126,6 +139,9 @@ async def generate_tts(
             with open(temp_emo_file, "wb") as f:
                 f.write(await emo_audio.read())
             
+            # 解码、去静音、响度归一化较慢，在线程池中进行，不阻塞事件循环
+            temp_emo_file = await asyncio.get_running_loop().run_in_executor(
+                None, audio_service.prepare_file, temp_emo_file)
             emo_audio_path = temp_emo_file
             logger.info(f"使用上传的情绪文件: {emo_audio.filename}")
         
@@ -144,25 +160,30 @@ async def generate_tts(
             length_penalty=length_penalty,
             num_beams=num_beams,
             repetition_penalty=repetition_penalty,
-            max_mel_tokens=max_mel_tokens
+            max_mel_tokens=max_mel_tokens,
+            seed=seed,
+            diffusion_steps=diffusion_steps,
+            inference_cfg_rate=inference_cfg_rate,
+            latency_budget=latency_budget
         )
         
-        # 创建进度回调
-        async def progress_callback(progress: float, message: str):
-            await ws_manager.send_progress_message(task_id, progress, message)
+        # 创建进度回调（推理线程中调用，经ProgressBus合并后发送）
+        progress_callback = ws_manager.create_progress_callback(task_id)
         
         # 生成语音
+        output_filename = f"{task_id}.wav"
         try:
             output_path = await tts_service.generate_speech(
                 request=tts_request,
                 prompt_audio_path=prompt_audio_path,
                 emo_audio_path=emo_audio_path,
-                output_filename=f"{task_id}.wav",
-                progress_callback=progress_callback
+                output_filename=output_filename,
+                progress_callback=progress_callback,
+                cancel_token=cancel_token
             )
             
             # 获取输出URL
-            output_url = tts_service.get_output_url(output_path)
+            output_url = tts_service.get_output_url(output_filename)
             
             # 发送完成消息
             await ws_manager.send_complete_message(task_id, output_url)
@@ -176,6 +197,12 @@ async def generate_tts(
                 "message": "生成成功"
             }
             
+        except SynthesisCancelled as e:
+            logger.info(f"TTS生成已取消: {task_id}, 原因: {e}")
+            await ws_manager.send_error_message(task_id, f"任务已取消: {e}")
+            status_code = 504 if cancel_token.reason == "deadline exceeded" else 499
+            raise HTTPException(status_code=status_code, detail=f"任务已取消: {e}")
+
         except Exception as e:
             logger.error(f"TTS生成失败: {task_id}, 错误: {e}", exc_info=True)
             await ws_manager.send_error_message(task_id, str(e))
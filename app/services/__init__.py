@@ -3,10 +3,14 @@ Services Package
 """
 
 from .audio_samples_service import AudioSamplesService
+from .output_store import OutputStore
+from .response_cache import ResponseCache
 from .tts_service import TTSService
 
 __all__ = [
     "AudioSamplesService",
+    "OutputStore",
+    "ResponseCache",
     "TTSService",
 ]
 
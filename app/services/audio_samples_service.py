@@ -9,6 +9,7 @@ import logging
 from pathlib import Path
 from typing import List, Optional
 
+from indextts.utils.prompt_audio import prepare_prompt_file
 from ..models.audio_samples import AudioSampleInfo, AudioScanResult
 
 logger = logging.getLogger(__name__)
@@ -17,8 +18,10 @@ logger = logging.getLogger(__name__)
 class AudioSamplesService:
     """音频样本管理服务"""
     
-    def __init__(self, base_dir: str = "audio_samples"):
+    def __init__(self, base_dir: str = "audio_samples", prepare_audio: bool = True):
         self.base_dir = Path(base_dir)
+        # 入库时去除首尾静音并做响度归一化（保存为wav），推理时不再重复处理
+        self.prepare_audio = prepare_audio
         self.voice_dir = self.base_dir / "voice_samples"
         self.emotion_dir = self.base_dir / "emotion_samples"
         
@@ -147,8 +150,8 @@ class AudioSamplesService:
         
         save_path = save_dir / final_filename
         
-        # 检查文件是否已存在
-        if save_path.exists():
+        # 检查文件是否已存在（预处理后会保存为同名wav）
+        if save_path.exists() or (self.prepare_audio and save_path.with_suffix(".wav").exists()):
             timestamp = int(time.time())
             stem = save_path.stem
             final_filename = f"{stem}_{timestamp}{file_ext}"
@@ -157,12 +160,27 @@ class AudioSamplesService:
         # 保存文件
         with open(save_path, "wb") as f:
             f.write(file_content)
+        if self.prepare_audio:
+            save_path = Path(self.prepare_file(str(save_path)))
         
         logger.info(f"音频样本上传成功: {save_path}")
         
         # 返回样本信息
         return self._create_sample_info(save_path, category)
     
+    def prepare_file(self, file_path: str) -> str:
+        """
+        音频入库预处理：去除首尾静音、响度归一化，保存为同名wav
+        
+        Returns:
+            处理后的文件路径，处理失败时返回原路径
+        """
+        try:
+            return prepare_prompt_file(file_path)
+        except Exception as e:
+            logger.warning(f"音频预处理失败，使用原始文件: {file_path}, 错误: {e}")
+            return file_path
+    
     def delete_sample(self, sample_id: str) -> bool:
         """删除音频样本"""
         # 解析sample_id
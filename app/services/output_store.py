@@ -0,0 +1,187 @@
+"""
+Output Store
+按内容寻址的合成结果存储（分片目录 + SQLite过期索引）
+"""
+
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Optional, Tuple
+
+from .response_cache import file_digest
+
+logger = logging.getLogger(__name__)
+
+
+class OutputStore:
+    """
+    合成结果存储，替代 ``outputs/{task_id}.wav`` 平铺目录 + glob扫描清理：
+
+    - 音频按内容sha256存放在分片目录 ``<root>/blobs/<h[:2]>/<h[2:4]>/<h>.wav``，
+      内容相同的结果（如响应缓存命中）只占一份空间，单个目录的文件数保持很小；
+    - 输出名（``{task_id}.wav``）到内容的映射、过期时间和引用计数记录在 ``<root>/index.sqlite3``，
+      ``expires_at`` 上有索引，清理只读取已过期的行，耗时与过期条目数成正比，不再遍历目录、stat每个文件；
+    - 合成先写到 ``<root>/tmp/`` 下的临时文件，完成后 ``put`` 入库。
+    """
+
+    def __init__(self, root: str = "outputs", ttl: float = 24 * 3600):
+        self.root = Path(root)
+        self.blob_dir = self.root / "blobs"
+        self.tmp_dir = self.root / "tmp"
+        self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.root / "index.sqlite3"), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS outputs (
+                name TEXT PRIMARY KEY,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS outputs_expires_at ON outputs (expires_at);
+            CREATE INDEX IF NOT EXISTS outputs_created_at ON outputs (created_at);
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                refcount INTEGER NOT NULL
+            );
+            """
+        )
+        # 上次运行中断留下的临时文件
+        for path in self.tmp_dir.glob("*.tmp.wav"):
+            path.unlink(missing_ok=True)
+
+    def _blob_path(self, digest: str) -> Path:
+        return self.blob_dir / digest[:2] / digest[2:4] / f"{digest}.wav"
+
+    def staging_path(self) -> Path:
+        """合成的临时输出路径，由 ``put`` 移入存储"""
+        return self.tmp_dir / f"{uuid.uuid4().hex}.tmp.wav"
+
+    def put(self, src_path: str, name: str, ttl: Optional[float] = None) -> Path:
+        """
+        把 ``src_path`` 以输出名 ``name`` 存入（文件被移走），同名的旧输出被替换。
+
+        Returns:
+            内容文件路径
+        """
+        digest = file_digest(src_path)
+        size = os.path.getsize(src_path)
+        now = time.time()
+        blob_path = self._blob_path(digest)
+        with self._lock:
+            if blob_path.exists():
+                os.remove(src_path)
+            else:
+                blob_path.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src_path, blob_path)
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._db.execute("SELECT digest FROM outputs WHERE name = ?", (name,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO outputs (name, digest, size, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+                    (name, digest, size, now, now + (self.ttl if ttl is None else ttl)),
+                )
+                self._db.execute(
+                    "INSERT INTO blobs (digest, refcount) VALUES (?, 1) "
+                    "ON CONFLICT(digest) DO UPDATE SET refcount = refcount + 1",
+                    (digest,),
+                )
+                orphans = self._release([old[0]]) if old else []
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._unlink_blobs(orphans)
+        return blob_path
+
+    def resolve(self, name: str) -> Optional[Tuple[Path, str, int]]:
+        """返回未过期输出的 (内容文件路径, 内容哈希, 字节数)，不存在或已过期时返回None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT digest, size FROM outputs WHERE name = ? AND expires_at > ?", (name, time.time())
+            ).fetchone()
+        if row is None:
+            return None
+        path = self._blob_path(row[0])
+        if not path.exists():
+            return None
+        return path, row[0], row[1]
+
+    def _release(self, digests) -> list:
+        """引用计数减一，返回计数归零、需要删除的内容哈希（在事务内调用）"""
+        orphans = []
+        for digest in digests:
+            self._db.execute("UPDATE blobs SET refcount = refcount - 1 WHERE digest = ?", (digest,))
+            row = self._db.execute("SELECT refcount FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is not None and row[0] <= 0:
+                self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+                orphans.append(digest)
+        return orphans
+
+    def _unlink_blobs(self, digests):
+        for digest in digests:
+            try:
+                self._blob_path(digest).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"删除输出文件失败: {digest}: {e}")
+
+    def cleanup(self, max_age: Optional[float] = None, batch_size: int = 1000) -> int:
+        """
+        删除已过期（或创建超过 ``max_age`` 秒）的输出，分批提交，每批只持有一次锁。
+
+        Returns:
+            删除的输出数量
+        """
+        deleted = 0
+        while True:
+            now = time.time()
+            if max_age is None:
+                query = "SELECT name, digest FROM outputs WHERE expires_at <= ? ORDER BY expires_at LIMIT ?"
+                bound = now
+            else:
+                query = "SELECT name, digest FROM outputs WHERE created_at <= ? ORDER BY created_at LIMIT ?"
+                bound = now - max_age
+            with self._lock:
+                self._db.execute("BEGIN IMMEDIATE")
+                try:
+                    rows = self._db.execute(query, (bound, batch_size)).fetchall()
+                    self._db.executemany("DELETE FROM outputs WHERE name = ?", [(name,) for name, _ in rows])
+                    orphans = self._release([digest for _, digest in rows])
+                    self._db.execute("COMMIT")
+                except BaseException:
+                    self._db.execute("ROLLBACK")
+                    raise
+                self._unlink_blobs(orphans)
+            deleted += len(rows)
+            if len(rows) < batch_size:
+                break
+        if deleted:
+            logger.info(f"输出清理完成，删除了 {deleted} 个过期输出")
+        return deleted
+
+    async def run_cleanup(self, interval: float = 600):
+        """后台定期清理过期输出（在线程池中执行，不阻塞事件循环），随任务取消而退出"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await loop.run_in_executor(None, self.cleanup)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"清理过期输出失败: {e}")
+            await asyncio.sleep(interval)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,202 @@
+"""
+Response Cache
+整段合成结果缓存（带单飞去重）
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional
+
+from indextts.utils.cancellation import SynthesisCancelled
+
+logger = logging.getLogger(__name__)
+
+
+def file_digest(path: Optional[str], chunk_size: int = 1 << 20) -> Optional[str]:
+    """文件内容的sha256，用于按内容（而不是路径/文件名）区分参考音频"""
+    if not path:
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    合成结果缓存：键为请求参数的规范化哈希，值为编码好的wav文件（``<cache_dir>/<key>.wav``）。
+
+    - 条目数、总字节数超过上限时按LRU淘汰，超过 ``ttl`` 秒的条目视为失效；
+    - 相同键的并发请求只计算一次（single-flight），其余请求等待同一个结果；
+    - 命中时把缓存文件硬链接（不支持时复制）到请求的输出路径，不再经过模型。
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = "outputs/cache",
+        max_entries: int = 1000,
+        max_bytes: int = 2 << 30,
+        ttl: float = 7 * 24 * 3600
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (size, created_at)，按最近使用排序
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.wav"
+
+    def _load(self):
+        """重启后从缓存目录恢复索引（按修改时间排序），丢弃已过期的文件"""
+        now = time.time()
+        files = sorted((p for p in self.cache_dir.glob("*.wav") if p.is_file()), key=lambda p: p.stat().st_mtime)
+        for path in files:
+            stat = path.stat()
+            if now - stat.st_mtime > self.ttl:
+                path.unlink(missing_ok=True)
+                continue
+            self._entries[path.stem] = (stat.st_size, stat.st_mtime)
+            self._size += stat.st_size
+        self._evict()
+        if self._entries:
+            logger.info(f"响应缓存: 恢复 {len(self._entries)} 条, {self._size / 2 ** 20:.1f} MB")
+
+    def _remove(self, key: str):
+        size, _ = self._entries.pop(key)
+        self._size -= size
+        self._path(key).unlink(missing_ok=True)
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+            self._remove(next(iter(self._entries)))
+
+    def get(self, key: str) -> Optional[Path]:
+        """返回未过期的缓存文件路径，不存在或已过期时返回None"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        path = self._path(key)
+        if time.time() - entry[1] > self.ttl or not path.exists():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return path
+
+    def _copy_in(self, key: str, src_path: str) -> int:
+        """把文件复制到缓存位置（先写临时文件再原子替换），返回字节数；只做文件操作，可在线程池中运行"""
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, path)
+        return path.stat().st_size
+
+    def _add(self, key: str, size: int) -> Path:
+        """登记已复制进缓存的条目并按上限淘汰"""
+        if key in self._entries:
+            old_size, _ = self._entries.pop(key)
+            self._size -= old_size
+        self._entries[key] = (size, time.time())
+        self._size += size
+        self._evict()
+        return self._path(key)
+
+    def put(self, key: str, src_path: str) -> Path:
+        """把合成结果复制进缓存（同步版本，事件循环中请用 ``get_or_generate``）"""
+        return self._add(key, self._copy_in(key, src_path))
+
+    @staticmethod
+    def _materialize(cached_path: Path, output_path: Path):
+        if cached_path == output_path:
+            return
+        output_path.unlink(missing_ok=True)
+        try:
+            os.link(cached_path, output_path)
+        except OSError:
+            shutil.copyfile(cached_path, output_path)
+
+    async def get_or_generate(
+        self,
+        key: str,
+        output_path: Path,
+        generate: Callable[[], Awaitable[str]]
+    ) -> str:
+        """
+        命中时直接把缓存写到 ``output_path``；否则由第一个请求调用 ``generate()`` 合成，
+        同一键上的并发请求等待这次合成的结果。合成方被取消（客户端断开/超时）或结果未能写入缓存时，
+        等待中的请求重新竞争计算，而不是跟着失败或共用合成方的临时文件。
+
+        Returns:
+            输出文件路径
+        """
+        # 复制/硬链接整个wav文件可能很慢（长文本输出），在线程池中进行，不阻塞事件循环
+        loop = asyncio.get_running_loop()
+        while True:
+            cached_path = self.get(key)
+            if cached_path is None:
+                inflight = self._inflight.get(key)
+                if inflight is None:
+                    break
+                try:
+                    cached_path = await asyncio.shield(inflight)
+                except SynthesisCancelled:
+                    continue
+                except asyncio.CancelledError:
+                    if inflight.cancelled():
+                        continue
+                    raise
+            try:
+                await loop.run_in_executor(None, self._materialize, cached_path, output_path)
+            except FileNotFoundError:
+                # 缓存文件在命中后被淘汰，按未命中重新处理
+                if key in self._entries and not cached_path.exists():
+                    self._remove(key)
+                continue
+            self.hits += 1
+            return str(output_path)
+
+        self.misses += 1
+        future = loop.create_future()
+        self._inflight[key] = future
+        try:
+            result_path = await generate()
+            try:
+                size = await loop.run_in_executor(None, self._copy_in, key, result_path)
+                future.set_result(self._add(key, size))
+            except OSError as e:
+                logger.warning(f"写入响应缓存失败: {e}")
+                # 合成方的输出是临时文件，会被移走，不能交给等待者：让它们重新合成
+                future.cancel()
+        except Exception as e:
+            future.set_exception(e)
+            # 没有等待者时避免 "Future exception was never retrieved"
+            future.exception()
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        finally:
+            # 写入缓存完成后才移除，期间到达的相同请求仍等待这次合成
+            self._inflight.pop(key, None)
+        return result_path
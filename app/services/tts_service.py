@@ -3,14 +3,20 @@ TTS Service
 TTS生成服务
 """
 
+import asyncio
 import os
+import time
 import uuid
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Callable
 
 from indextts.infer_v2 import IndexTTS2
+from indextts.utils.cancellation import CancellationToken
 from ..models.tts import TTSRequest
+from .output_store import OutputStore
+from .response_cache import ResponseCache, file_digest
 
 logger = logging.getLogger(__name__)
 
@@ -24,11 +30,20 @@ class TTSService:
         output_dir: str = "outputs",
         use_fp16: bool = False,
         use_cuda_kernel: bool = False,
-        use_deepspeed: bool = False
+        use_deepspeed: bool = False,
+        response_cache: Optional[ResponseCache] = None,
+        output_store: Optional[OutputStore] = None
     ):
         self.model_dir = model_dir
+        # 指定了seed（且没有延迟预算）的请求结果可复现，相同请求直接返回缓存的音频
+        self.response_cache = response_cache
         self.output_dir = Path(output_dir)
         self.output_dir.mkdir(parents=True, exist_ok=True)
+        # 合成结果按内容存放，过期时间记录在索引中
+        self.output_store = output_store or OutputStore(output_dir)
+        # IndexTTS2的说话人/情感条件缓存、GPT前缀KV缓存等是实例状态，不是线程安全的：
+        # 所有合成在这个单线程执行器中依次运行，事件循环仍可在排队或合成期间处理断开并取消任务
+        self._infer_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-infer")
         
         # 初始化TTS模型
         logger.info("正在初始化IndexTTS2模型...")
@@ -51,7 +66,8 @@ class TTSService:
         prompt_audio_path: str,
         emo_audio_path: Optional[str] = None,
         output_filename: Optional[str] = None,
-        progress_callback: Optional[Callable[[float, str], None]] = None
+        progress_callback: Optional[Callable[[float, str], None]] = None,
+        cancel_token: Optional[CancellationToken] = None
     ) -> str:
         """
         生成语音
@@ -60,18 +76,22 @@ class TTSService:
             request: TTS请求参数
             prompt_audio_path: 音色参考音频路径
             emo_audio_path: 情绪参考音频路径（可选）
-            output_filename: 输出文件名（可选）
-            progress_callback: 进度回调函数
+            output_filename: 输出名（可选），即下载URL中的文件名
+            progress_callback: 进度回调函数 (progress 0-100, message)，会在推理线程中调用；
+                只报告进度，失败由调用方捕获异常后发送错误消息
+            cancel_token: 取消令牌（可选），取消或超时后合成在下一个检查点中止并抛出SynthesisCancelled
         
         Returns:
-            生成的音频文件路径
+            生成的音频文件路径（存储中的内容文件）
         """
+        output_path = None
         try:
             # 生成输出文件名
             if not output_filename:
                 output_filename = f"{uuid.uuid4()}.wav"
             
-            output_path = self.output_dir / output_filename
+            # 先合成到临时文件，完成后移入输出存储
+            output_path = self.output_store.staging_path()
             
             # 发送开始消息
             if progress_callback:
@@ -98,94 +118,116 @@ class TTSService:
                 "length_penalty": request.length_penalty,
                 "num_beams": request.num_beams,
                 "repetition_penalty": request.repetition_penalty,
-                "max_mel_tokens": request.max_mel_tokens
+                "max_mel_tokens": request.max_mel_tokens,
+                "seed": request.seed,
+                # s2mel参数
+                "diffusion_steps": request.diffusion_steps,
+                "inference_cfg_rate": request.inference_cfg_rate,
+                "latency_budget": request.latency_budget,
+                "cancel_token": cancel_token,
             }
             
-            # 设置进度回调到TTS引擎
-            # IndexTTS2使用gr_progress属性而不是参数
+            # 进度回调按请求传给TTS引擎（不修改引擎实例上的gr_progress），在推理线程中调用，
+            # 必须是线程安全且不阻塞的，例如 WebSocketManager.create_progress_callback
             if progress_callback:
                 def wrapped_progress_callback(progress: float, desc: str):
                     # 将0-1的进度转换为0-100
                     progress_callback(progress * 100, desc)
-                self.tts_engine.gr_progress = wrapped_progress_callback
-            else:
-                self.tts_engine.gr_progress = None
+                tts_params["progress_callback"] = wrapped_progress_callback
 
             # 调用TTS引擎生成语音
             logger.info(f"开始生成TTS: {request.text[:50]}...")
 
-            result = self.tts_engine.infer(**tts_params)
-            
-            # 检查生成结果
-            if not output_path.exists():
-                raise RuntimeError("TTS生成失败：输出文件不存在")
+            # 在推理线程中运行，事件循环可以继续处理断开连接等事件并取消合成
+            loop = asyncio.get_running_loop()
+            submitted_at = time.monotonic()
+
+            def run_infer():
+                # 排队期间已取消或超时的任务不再开始合成
+                if cancel_token is not None:
+                    cancel_token.check()
+                params = tts_params
+                if request.latency_budget is not None:
+                    # 延迟预算从提交时算起：扣除排队等待推理线程的时间，剩余部分交给引擎规划
+                    waited = time.monotonic() - submitted_at
+                    params = dict(tts_params, latency_budget=max(0.0, request.latency_budget - waited))
+                self.tts_engine.infer(**params)
+
+            async def synthesize() -> str:
+                await loop.run_in_executor(self._infer_executor, run_infer)
+                # 检查生成结果
+                if not output_path.exists():
+                    raise RuntimeError("TTS生成失败：输出文件不存在")
+                return str(output_path)
+
+            # 延迟预算下选用的质量档位取决于负载和排队时间，这样的结果不缓存
+            if self.response_cache is not None and request.seed is not None and request.latency_budget is None:
+                cache_key = await loop.run_in_executor(
+                    None, lambda: self._response_cache_key(request, prompt_audio_path, emo_audio_path))
+                await self.response_cache.get_or_generate(cache_key, output_path, synthesize)
+            else:
+                await synthesize()
+
+            stored_path = await loop.run_in_executor(
+                None, lambda: self.output_store.put(str(output_path), output_filename))
             
-            logger.info(f"TTS生成成功: {output_path}")
+            logger.info(f"TTS生成成功: {output_filename} -> {stored_path}")
             
             # 发送完成消息
             if progress_callback:
                 progress_callback(100, "语音生成完成")
             
-            return str(output_path)
+            return str(stored_path)
             
         except Exception as e:
             logger.error(f"TTS生成失败: {e}", exc_info=True)
-            if progress_callback:
-                progress_callback(0, f"生成失败: {str(e)}")
             raise
+
+        finally:
+            # 失败或取消时删除未入库的临时文件
+            if output_path is not None:
+                output_path.unlink(missing_ok=True)
     
-    def get_output_url(self, file_path: str) -> str:
+    def _response_cache_key(
+        self,
+        request: TTSRequest,
+        prompt_audio_path: str,
+        emo_audio_path: Optional[str] = None
+    ) -> str:
+        """响应缓存键：请求参数 + 参考音频内容哈希 + 模型目录 + 梅尔token预算设置"""
+        mel_budget = self.tts_engine.mel_budget
+        return ResponseCache.make_key(
+            model_dir=self.model_dir,
+            mel_budget=mel_budget.settings if mel_budget is not None else None,
+            request=request.model_dump(),
+            voice=file_digest(prompt_audio_path),
+            emotion=file_digest(emo_audio_path),
+        )
+
+    def get_output_url(self, output_name: str) -> str:
         """
-        将文件路径转换为Web访问URL
+        将输出名转换为Web访问URL（由outputs路由从输出存储中读取）
         
         Args:
-            file_path: 文件路径
+            output_name: 输出名，即 ``generate_speech`` 的 ``output_filename``
         
         Returns:
             Web访问URL
         """
-        file_path = Path(file_path)
-        if file_path.is_absolute():
-            # 转换为相对于output_dir的路径
-            try:
-                relative_path = file_path.relative_to(self.output_dir.parent)
-                return f"/{relative_path.as_posix()}"
-            except ValueError:
-                # 如果不在output_dir下，返回文件名
-                return f"/outputs/{file_path.name}"
-        else:
-            return f"/outputs/{file_path.name}"
+        return f"/outputs/{Path(output_name).name}"
     
-    def cleanup_old_files(self, max_age_hours: int = 24) -> int:
+    def cleanup_old_files(self, max_age_hours: Optional[float] = None) -> int:
         """
-        清理旧的输出文件
+        清理过期的输出（按索引只读取过期条目，不扫描输出目录）
         
         Args:
-            max_age_hours: 最大保留时间（小时）
+            max_age_hours: 最大保留时间（小时），默认按存入时的过期时间
         
         Returns:
-            删除的文件数量
+            删除的输出数量
         """
-        import time
-        
-        deleted_count = 0
-        current_time = time.time()
-        max_age_seconds = max_age_hours * 3600
-        
         try:
-            for file_path in self.output_dir.glob("*.wav"):
-                if file_path.is_file():
-                    file_age = current_time - file_path.stat().st_mtime
-                    if file_age > max_age_seconds:
-                        file_path.unlink()
-                        deleted_count += 1
-                        logger.debug(f"删除旧文件: {file_path}")
-            
-            if deleted_count > 0:
-                logger.info(f"清理完成，删除了 {deleted_count} 个旧文件")
-            
-            return deleted_count
+            return self.output_store.cleanup(None if max_age_hours is None else max_age_hours * 3600)
         except Exception as e:
             logger.error(f"清理旧文件失败: {e}")
-            return deleted_count
-
+            return 0
@@ -0,0 +1,67 @@
+"""
+GPT attention backends (eager / sdpa / flash_attention_2): prefill and decode time.
+
+Prefill is a generation of a single code (the cond + text prefix pass), the decode step time is the rest of a
+``--gen_tokens`` generation divided by its steps. Backends that are not available for the device/dtype
+(e.g. flash_attention_2 on CPU or in fp32) are skipped.
+
+    python -m benchmarks.bench_attn --text_tokens 60 200 400
+    python -m benchmarks.bench_attn --scale full -d cuda:0 --dtype fp16
+"""
+import argparse
+
+import torch
+
+from benchmarks.bench_gpt import generate, random_inputs
+from benchmarks.common import add_common_args, build_gpt, load_config, measure, print_table, setup, write_results
+from indextts.gpt.model_v2 import ATTN_BACKENDS, resolve_attn_backend
+
+DTYPES = {"fp32": torch.float32, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--backends", type=str, nargs="+", choices=ATTN_BACKENDS, default=list(ATTN_BACKENDS))
+    parser.add_argument("--dtype", type=str, choices=list(DTYPES), default="fp32")
+    parser.add_argument("--text_tokens", type=int, nargs="+", default=[60, 200, 400])
+    parser.add_argument("--gen_tokens", type=int, default=100)
+    parser.add_argument("--cond_frames", type=int, default=150, help="w2v-bert frames of the prompt (50Hz)")
+    parser.add_argument("--batch_size", type=int, default=1)
+    args = parser.parse_args(argv)
+    device = setup(args)
+    dtype = DTYPES[args.dtype]
+
+    cfg = load_config(args.config, args.scale)
+    gpt = build_gpt(cfg, device).to(dtype)
+
+    records = []
+    for backend in args.backends:
+        if resolve_attn_backend(backend, device, dtype) != backend:
+            print(f">> skip {backend}: not available on {device} in {args.dtype}")
+            continue
+        gpt.set_attn_backend(backend, device, dtype)
+        for text_tokens in args.text_tokens:
+            spk_cond_emb, text = random_inputs(cfg, device, args.batch_size, text_tokens, args.cond_frames)
+            spk_cond_emb = spk_cond_emb.to(dtype)
+            prefill = measure(lambda: generate(gpt, spk_cond_emb, text, 1, 1), device, args.warmup, args.repeat)
+            total = measure(lambda: generate(gpt, spk_cond_emb, text, args.gen_tokens, 1),
+                            device, args.warmup, args.repeat)
+            decode_step = (total["median"] - prefill["median"]) / max(1, args.gen_tokens - 1)
+            records.append({
+                "backend": backend,
+                "dtype": args.dtype,
+                "batch_size": args.batch_size,
+                "text_tokens": text_tokens,
+                "gen_tokens": args.gen_tokens,
+                "prefill_ms": 1000 * prefill["median"],
+                "decode_ms_per_step": 1000 * decode_step,
+                "tokens_per_s": args.batch_size / decode_step if decode_step > 0 else None,
+                "prefill": prefill,
+                "total": total,
+            })
+    print_table(records, ["backend", "text_tokens", "prefill_ms", "decode_ms_per_step", "tokens_per_s"])
+    return write_results("attn", args, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+BigVGAN vocoder throughput in output samples/s vs. mel length and batch size.
+
+With ``--tile_frames``, the tiled mode (``BigVGAN.inference_tiled``) is measured as well, with its
+maximum absolute difference to the full-sequence call and, on CUDA, the peak memory of both modes.
+
+    python -m benchmarks.bench_bigvgan --mel_frames 86 430 861
+    python -m benchmarks.bench_bigvgan --mel_frames 861 2583 --tile_frames 256
+
+With ``--polyphase``, a copy of the model using the polyphase anti-aliased activations
+(``use_polyphase_activation``, meant for CPU) is timed too, with its max abs difference to the default path.
+
+    python -m benchmarks.bench_bigvgan -d cpu --threads 8 --polyphase
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import (HOP_LENGTH, SAMPLING_RATE, add_common_args, build_bigvgan, measure, print_table, setup,
+                               write_results)
+
+
+def peak_memory(fn, device):
+    """Peak CUDA memory in MiB allocated while running ``fn``, None on other devices."""
+    if device.type != "cuda":
+        fn()
+        return None
+    torch.cuda.synchronize(device)
+    torch.cuda.reset_peak_memory_stats(device)
+    fn()
+    torch.cuda.synchronize(device)
+    return torch.cuda.max_memory_allocated(device) / 2 ** 20
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--mel_frames", type=int, nargs="+", default=[86, 430, 861],
+                        help="mel frames per item (86 frames ~= 1 second)")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--use_cuda_kernel", action="store_true", default=False)
+    parser.add_argument("--tile_frames", type=int, default=None, help="also measure the tiled mode")
+    parser.add_argument("--polyphase", action="store_true", default=False,
+                        help="also measure the polyphase anti-aliased activations")
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    bigvgan = build_bigvgan(args.scale, device, use_cuda_kernel=args.use_cuda_kernel)
+    polyphase = None
+    if args.polyphase:
+        polyphase = build_bigvgan(args.scale, device, use_polyphase_activation=True)
+        polyphase.load_state_dict(bigvgan.state_dict())
+    num_mels = bigvgan.h.num_mels
+
+    records = []
+    for batch_size in args.batch_sizes:
+        for frames in args.mel_frames:
+            mel = torch.randn(batch_size, num_mels, frames, device=device)
+            result = measure(lambda: bigvgan(mel), device, args.warmup, args.repeat)
+            samples = batch_size * frames * HOP_LENGTH
+            record = {
+                "batch_size": batch_size,
+                "mel_frames": frames,
+                "audio_s": samples / SAMPLING_RATE,
+                "vocode_s": result["median"],
+                "samples_per_s": samples / result["median"],
+                "rtf": result["median"] / (samples / SAMPLING_RATE),
+                "vocode": result,
+            }
+            if args.tile_frames:
+                tiled = lambda: bigvgan.inference_tiled(mel, tile_frames=args.tile_frames)
+                tiled_result = measure(tiled, device, args.warmup, args.repeat)
+                record.update({
+                    "tile_frames": args.tile_frames,
+                    "overlap_frames": bigvgan.receptive_field_frames(),
+                    "tiled_s": tiled_result["median"],
+                    "tiled_max_abs_diff": (tiled() - bigvgan(mel)).abs().max().item(),
+                    "peak_mib": peak_memory(lambda: bigvgan(mel), device),
+                    "tiled_peak_mib": peak_memory(tiled, device),
+                    "tiled": tiled_result,
+                })
+            if polyphase is not None:
+                polyphase_result = measure(lambda: polyphase(mel), device, args.warmup, args.repeat)
+                record.update({
+                    "polyphase_s": polyphase_result["median"],
+                    "polyphase_speedup": result["median"] / polyphase_result["median"],
+                    "polyphase_max_abs_diff": (polyphase(mel) - bigvgan(mel)).abs().max().item(),
+                    "polyphase": polyphase_result,
+                })
+            records.append(record)
+    print_table(records, ["batch_size", "mel_frames", "audio_s", "vocode_s", "samples_per_s", "rtf",
+                          "tiled_s", "tiled_max_abs_diff", "peak_mib", "tiled_peak_mib",
+                          "polyphase_s", "polyphase_speedup", "polyphase_max_abs_diff"])
+    return write_results("bigvgan", args, records)
+
+
+if __name__ == "__main__":
+    main()
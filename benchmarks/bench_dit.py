@@ -0,0 +1,123 @@
+"""
+s2mel DiT estimator step time vs. sequence length, and a full CFM solve at batch size 1.
+With ``--mixed_batch N``, also one batched CFM solve of N segments with different prompt and target
+lengths (per item ``prompt_lens``) against solving them one by one.
+
+One "step" is a single estimator forward on the CFG-stacked batch (2 x batch_size), which is what
+``BASECFM.solve_euler`` runs per Euler step with ``inference_cfg_rate > 0``.
+
+    python -m benchmarks.bench_dit --seq_lens 256 512 1024 2048
+"""
+import argparse
+
+import torch
+from torch.nn.utils.rnn import pad_sequence
+
+from benchmarks.common import add_common_args, build_s2mel, load_config, measure, print_table, setup, write_results
+
+
+def random_inputs(cfg, device, batch_size, seq_len, prompt_len):
+    in_channels = cfg.s2mel.DiT.in_channels
+    mu = torch.randn(batch_size, seq_len, cfg.s2mel.DiT.content_dim, device=device)
+    prompt = torch.randn(batch_size, in_channels, prompt_len, device=device)
+    style = torch.randn(batch_size, cfg.s2mel.style_encoder.dim, device=device)
+    return mu, prompt, style
+
+
+def mixed_batch_record(cfm, cfg, device, args):
+    generator = torch.Generator().manual_seed(args.seed)
+    seq_len = max(args.seq_lens)
+    prompt_lens = torch.randint(args.prompt_frames // 2, args.prompt_frames + 1, (args.mixed_batch,),
+                                generator=generator)
+    x_lens = prompt_lens + torch.randint(seq_len // 4, seq_len // 2 + 1, (args.mixed_batch,), generator=generator)
+    items = [random_inputs(cfg, device, 1, int(x_len), int(prompt_len))
+             for x_len, prompt_len in zip(x_lens, prompt_lens)]
+    mu = pad_sequence([m[0] for m, _, _ in items], batch_first=True)
+    prompt = pad_sequence([p[0].transpose(0, 1) for _, p, _ in items], batch_first=True).transpose(1, 2)
+    style = torch.cat([s for _, _, s in items], dim=0)
+    x_lens, prompt_lens = x_lens.to(device), prompt_lens.to(device)
+
+    def batched():
+        cfm.inference(mu, x_lens, prompt, style, None, args.diffusion_steps,
+                      inference_cfg_rate=args.inference_cfg_rate, prompt_lens=prompt_lens)
+
+    def sequential():
+        for m, p, s in items:
+            cfm.inference(m, torch.LongTensor([m.size(1)]).to(device), p, s, None, args.diffusion_steps,
+                          inference_cfg_rate=args.inference_cfg_rate)
+
+    batched_time = measure(batched, device, min(args.warmup, 1), args.repeat)
+    sequential_time = measure(sequential, device, min(args.warmup, 1), args.repeat)
+    return {
+        "batch_size": args.mixed_batch,
+        "seq_len": int(x_lens.max()),
+        "prompt_frames": prompt_lens.tolist(),
+        "x_lens": x_lens.tolist(),
+        "diffusion_steps": args.diffusion_steps,
+        "solve_s": batched_time["median"],
+        "sequential_solve_s": sequential_time["median"],
+        "batch_speedup": sequential_time["median"] / batched_time["median"],
+        "solve": batched_time,
+        "sequential_solve": sequential_time,
+    }
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--seq_lens", type=int, nargs="+", default=[256, 512, 1024, 2048],
+                        help="total mel frames (prompt + target)")
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--prompt_frames", type=int, default=256)
+    parser.add_argument("--diffusion_steps", type=int, default=25)
+    parser.add_argument("--inference_cfg_rate", type=float, default=0.7)
+    parser.add_argument("--skip_solve", action="store_true", default=False, help="only time single estimator steps")
+    parser.add_argument("--mixed_batch", type=int, default=0,
+                        help="also time one CFM solve of this many segments with different prompt/target lengths")
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    s2mel = build_s2mel(cfg, device, max_seq_length=max(args.seq_lens) + args.prompt_frames)
+    cfm = s2mel.models["cfm"]
+    estimator = cfm.estimator
+
+    records = []
+    for batch_size in args.batch_sizes:
+        for seq_len in args.seq_lens:
+            prompt_len = min(args.prompt_frames, seq_len // 2)
+            mu, prompt, style = random_inputs(cfg, device, batch_size, seq_len, prompt_len)
+            stacked = 2 * batch_size if args.inference_cfg_rate > 0 else batch_size
+            x = torch.randn(stacked, cfg.s2mel.DiT.in_channels, seq_len, device=device)
+            prompt_x = torch.zeros_like(x)
+            prompt_x[..., :prompt_len] = prompt.repeat(stacked // batch_size, 1, 1)
+            x_lens = torch.full((stacked,), seq_len, dtype=torch.long, device=device)
+            t = torch.full((stacked,), 0.5, device=device)
+            step = measure(lambda: estimator(x, prompt_x, x_lens, t, style.repeat(stacked // batch_size, 1),
+                                             mu.repeat(stacked // batch_size, 1, 1)),
+                           device, args.warmup, args.repeat)
+            record = {
+                "batch_size": batch_size,
+                "seq_len": seq_len,
+                "prompt_frames": prompt_len,
+                "step_s": step["median"],
+                "frames_per_s": batch_size * seq_len / step["median"],
+                "step": step,
+            }
+            if not args.skip_solve and batch_size == 1:
+                solve = measure(lambda: cfm.inference(mu, torch.LongTensor([seq_len]).to(device), prompt, style, None,
+                                                      args.diffusion_steps,
+                                                      inference_cfg_rate=args.inference_cfg_rate),
+                                device, min(args.warmup, 1), args.repeat)
+                record["diffusion_steps"] = args.diffusion_steps
+                record["solve_s"] = solve["median"]
+                record["solve"] = solve
+            records.append(record)
+    if args.mixed_batch:
+        records.append(mixed_batch_record(cfm, cfg, device, args))
+    print_table(records, ["batch_size", "seq_len", "step_s", "frames_per_s", "solve_s", "sequential_solve_s",
+                          "batch_speedup"])
+    return write_results("dit", args, records)
+
+
+if __name__ == "__main__":
+    main()
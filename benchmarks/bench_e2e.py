@@ -0,0 +1,148 @@
+"""
+End-to-end RTF and time-to-first-audio (TTFB) of the IndexTTS2 synthesis loop, with random weights.
+
+Mirrors the per-segment path of ``IndexTTS2.infer``: GPT generation -> GPT latent forward ->
+semantic codec / length regulator -> CFM (DiT) -> BigVGAN. Prompt feature extraction (w2v-bert,
+CAMPPlus) is cached per speaker in ``IndexTTS2`` and is not part of this benchmark.
+
+Every segment generates exactly ``segment_codes`` mel codes (50 codes ~= 1 second of audio).
+Segments are generated by the GPT ``batch_size`` at a time; s2mel and BigVGAN run per segment.
+
+    python -m benchmarks.bench_e2e --batch_sizes 1 2 --segment_codes 100 250 --segments 4
+"""
+import argparse
+import time
+
+import torch
+
+from benchmarks.bench_gpt import forward_latent, generate
+from benchmarks.common import (add_common_args, build_bigvgan, build_gpt, build_s2mel, build_semantic_codec,
+                               codes_to_seconds, load_config, print_table, setup, synchronize, write_results,
+                               CODE_TO_MEL_RATIO, HOP_LENGTH, SAMPLING_RATE)
+
+
+class Pipeline:
+    def __init__(self, cfg, scale, device, prompt_seconds=5.0, cond_frames=150, diffusion_steps=25,
+                 inference_cfg_rate=0.7, num_beams=1):
+        self.cfg = cfg
+        self.device = device
+        self.diffusion_steps = diffusion_steps
+        self.inference_cfg_rate = inference_cfg_rate
+        self.num_beams = num_beams
+        self.gpt = build_gpt(cfg, device)
+        self.semantic_codec = build_semantic_codec(cfg, device)
+        self.s2mel = build_s2mel(cfg, device)
+        self.bigvgan = build_bigvgan(scale, device)
+
+        # cached prompt conditioning, same shapes as `IndexTTS2.infer`
+        ref_frames = int(prompt_seconds * SAMPLING_RATE / HOP_LENGTH)
+        self.spk_cond_emb = torch.randn(1, cond_frames, 1024, device=device)
+        self.ref_mel = torch.randn(1, cfg.s2mel.DiT.in_channels, ref_frames, device=device)
+        self.style = torch.randn(1, cfg.s2mel.style_encoder.dim, device=device)
+        S_ref = torch.randn(1, cond_frames, 1024, device=device)
+        self.prompt_condition = self.s2mel.models["length_regulator"](
+            S_ref, ylens=torch.LongTensor([ref_frames]).to(device), n_quantizers=3, f0=None)[0]
+
+    def gpt_stage(self, text, gen_tokens):
+        batch_size = text.size(0)
+        spk_cond_emb = self.spk_cond_emb.expand(batch_size, -1, -1).contiguous()
+        codes, latent, emovec = generate(self.gpt, spk_cond_emb, text, gen_tokens, self.num_beams)
+        latent = forward_latent(self.gpt, spk_cond_emb, text, codes, latent, emovec)
+        return codes, latent
+
+    def s2mel_stage(self, codes, latent):
+        # codes: (1, T), latent: (1, T, model_dim)
+        code_lens = torch.LongTensor([codes.shape[-1]]).to(self.device)
+        latent = self.s2mel.models["gpt_layer"](latent)
+        S_infer = self.semantic_codec.quantizer.vq2emb(codes.unsqueeze(1)).transpose(1, 2) + latent
+        target_lengths = (code_lens * CODE_TO_MEL_RATIO).long()
+        cond = self.s2mel.models["length_regulator"](S_infer, ylens=target_lengths, n_quantizers=3, f0=None)[0]
+        cat_condition = torch.cat([self.prompt_condition, cond], dim=1)
+        vc_target = self.s2mel.models["cfm"].inference(cat_condition,
+                                                       torch.LongTensor([cat_condition.size(1)]).to(self.device),
+                                                       self.ref_mel, self.style, None, self.diffusion_steps,
+                                                       inference_cfg_rate=self.inference_cfg_rate)
+        return vc_target[:, :, self.ref_mel.size(-1):]
+
+    def vocoder_stage(self, mel):
+        return self.bigvgan(mel.float()).squeeze(1)
+
+    def run(self, num_segments, batch_size, segment_codes, text_tokens):
+        """
+        Synthesize ``num_segments`` segments, returns per-stage timings, TTFB and audio length.
+        """
+        stats = {"gpt_s": 0.0, "s2mel_s": 0.0, "bigvgan_s": 0.0, "ttfb_s": None}
+        audio_samples = 0
+        synchronize(self.device)
+        start = time.perf_counter()
+        for first in range(0, num_segments, batch_size):
+            rows = min(batch_size, num_segments - first)
+            text = torch.randint(2, self.cfg.gpt.number_text_tokens, (rows, text_tokens), dtype=torch.int32,
+                                 device=self.device)
+            t0 = time.perf_counter()
+            codes, latent = self.gpt_stage(text, segment_codes)
+            synchronize(self.device)
+            stats["gpt_s"] += time.perf_counter() - t0
+            for i in range(rows):
+                t0 = time.perf_counter()
+                mel = self.s2mel_stage(codes[i:i + 1], latent[i:i + 1])
+                synchronize(self.device)
+                t1 = time.perf_counter()
+                wav = self.vocoder_stage(mel)
+                synchronize(self.device)
+                t2 = time.perf_counter()
+                stats["s2mel_s"] += t1 - t0
+                stats["bigvgan_s"] += t2 - t1
+                audio_samples += wav.shape[-1]
+                if stats["ttfb_s"] is None:
+                    stats["ttfb_s"] = t2 - start
+        stats["total_s"] = time.perf_counter() - start
+        stats["audio_s"] = audio_samples / SAMPLING_RATE
+        stats["rtf"] = stats["total_s"] / stats["audio_s"]
+        return stats
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2])
+    parser.add_argument("--segment_codes", type=int, nargs="+", default=[100, 250],
+                        help="mel codes generated per segment (50 codes ~= 1 second)")
+    parser.add_argument("--segments", type=int, default=4, help="segments per synthesized text")
+    parser.add_argument("--text_tokens_per_code", type=float, default=0.25)
+    parser.add_argument("--prompt_seconds", type=float, default=5.0)
+    parser.add_argument("--diffusion_steps", type=int, default=25)
+    parser.add_argument("--inference_cfg_rate", type=float, default=0.7)
+    parser.add_argument("--num_beams", type=int, default=1)
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    pipeline = Pipeline(cfg, args.scale, device, prompt_seconds=args.prompt_seconds,
+                        diffusion_steps=args.diffusion_steps, inference_cfg_rate=args.inference_cfg_rate,
+                        num_beams=args.num_beams)
+
+    records = []
+    for segment_codes in args.segment_codes:
+        text_tokens = max(1, int(segment_codes * args.text_tokens_per_code))
+        for batch_size in args.batch_sizes:
+            for _ in range(args.warmup):
+                pipeline.run(min(batch_size, args.segments), batch_size, segment_codes, text_tokens)
+            runs = [pipeline.run(args.segments, batch_size, segment_codes, text_tokens) for _ in range(args.repeat)]
+            # headline numbers from the median run (by total time), as in the other benchmarks
+            median = sorted(runs, key=lambda r: r["total_s"])[(len(runs) - 1) // 2]
+            records.append({
+                "batch_size": batch_size,
+                "segments": args.segments,
+                "segment_codes": segment_codes,
+                "segment_audio_s": codes_to_seconds(segment_codes),
+                "text_tokens": text_tokens,
+                **median,
+                "runs": runs,
+            })
+    print_table(records, ["batch_size", "segment_codes", "audio_s", "total_s", "ttfb_s", "rtf",
+                          "gpt_s", "s2mel_s", "bigvgan_s"])
+    return write_results("e2e", args, records)
+
+
+if __name__ == "__main__":
+    main()
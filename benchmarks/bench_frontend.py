@@ -0,0 +1,71 @@
+"""
+Text front-end throughput: normalization, BPE tokenization and segment splitting.
+
+Needs the real BPE model (``checkpoints/bpe.model``), the benchmark is skipped when it is missing.
+
+    python -m benchmarks.bench_frontend --bpe_model checkpoints/bpe.model
+"""
+import argparse
+import os
+
+from benchmarks.common import REPO_ROOT, add_common_args, measure, print_table, setup, write_results
+
+SAMPLE_TEXTS = [
+    "IndexTTS 正式发布1.0版本了，效果666。现在是北京时间2025年01月11日 20:00，他这条视频点赞3000+，评论1000+。",
+    "This sales for 2.5% off, only $12.5. See you at 8:00 AM, and don't forget the meeting with Dr. Smith on Jan. 5th.",
+    "晕XUAN4是一种GAN3觉，“衣裳”不读衣chang2，而是读衣shang5。数到3就开始：1、2、3！",
+]
+
+
+def build_text(num_chars: int) -> str:
+    text = ""
+    i = 0
+    while len(text) < num_chars:
+        text += SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        i += 1
+    return text[:num_chars]
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--bpe_model", type=str, default=os.path.join(REPO_ROOT, "checkpoints", "bpe.model"))
+    parser.add_argument("--text_chars", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--max_text_tokens_per_segment", type=int, default=120)
+    args = parser.parse_args(argv)
+    setup(args)
+
+    if not os.path.exists(args.bpe_model):
+        print(f">> bpe model {args.bpe_model} not found, skip front-end benchmark")
+        return write_results("frontend", args, [], extra={"skipped": f"missing {args.bpe_model}"})
+
+    from indextts.utils.front import TextNormalizer, TextTokenizer
+
+    normalizer = TextNormalizer()
+    tokenizer = TextTokenizer(args.bpe_model, normalizer)
+
+    records = []
+    for num_chars in args.text_chars:
+        text = build_text(num_chars)
+        tokens = tokenizer.tokenize(text)
+        normalize = measure(lambda: normalizer.normalize(text), args.device, args.warmup, args.repeat)
+        tokenize = measure(lambda: tokenizer.tokenize(text), args.device, args.warmup, args.repeat)
+        split = measure(lambda: tokenizer.split_segments(tokens, args.max_text_tokens_per_segment),
+                        args.device, args.warmup, args.repeat)
+        records.append({
+            "text_chars": num_chars,
+            "text_tokens": len(tokens),
+            "normalize_s": normalize["median"],
+            "tokenize_s": tokenize["median"],
+            "split_segments_s": split["median"],
+            "chars_per_s": num_chars / tokenize["median"],
+            "tokens_per_s": len(tokens) / (tokenize["median"] + split["median"]),
+            "normalize": normalize,
+            "tokenize": tokenize,
+            "split_segments": split,
+        })
+    print_table(records, ["text_chars", "text_tokens", "normalize_s", "tokenize_s", "split_segments_s", "chars_per_s"])
+    return write_results("frontend", args, records)
+
+
+if __name__ == "__main__":
+    main()
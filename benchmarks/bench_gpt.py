@@ -0,0 +1,95 @@
+"""
+GPT (UnifiedVoice) throughput: autoregressive mel-code generation tokens/s and the latent forward pass.
+
+Generation is forced to a fixed length (``min_new_tokens == max_generate_length``) so that runs are
+comparable between random weights and revisions.
+
+    python -m benchmarks.bench_gpt --batch_sizes 1 4 --gen_tokens 100 300
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import (add_common_args, build_gpt, load_config, measure, print_table, setup,
+                               write_results)
+
+
+def random_inputs(cfg, device, batch_size, text_tokens, cond_frames):
+    # w2v-bert features of the prompt, the same conditioning is shared by every row of the batch
+    spk_cond_emb = torch.randn(1, cond_frames, 1024, device=device).expand(batch_size, -1, -1).contiguous()
+    text = torch.randint(2, cfg.gpt.number_text_tokens, (batch_size, text_tokens), dtype=torch.int32, device=device)
+    return spk_cond_emb, text
+
+
+def generate(gpt, spk_cond_emb, text, gen_tokens, num_beams, do_sample=True):
+    cond_lengths = torch.tensor([spk_cond_emb.shape[1]] * spk_cond_emb.size(0), device=text.device)
+    emovec = gpt.merge_emovec(spk_cond_emb, spk_cond_emb, cond_lengths, cond_lengths, alpha=1.0)
+    codes, speech_conditioning_latent = gpt.inference_speech(
+        spk_cond_emb, text, spk_cond_emb,
+        cond_lengths=cond_lengths, emo_cond_lengths=cond_lengths, emo_vec=emovec,
+        do_sample=do_sample, top_p=0.8, top_k=30, temperature=0.8, num_return_sequences=1,
+        length_penalty=0.0, num_beams=num_beams, repetition_penalty=10.0,
+        max_generate_length=gen_tokens, min_new_tokens=gen_tokens,
+    )
+    return codes, speech_conditioning_latent, emovec
+
+
+def forward_latent(gpt, spk_cond_emb, text, codes, speech_conditioning_latent, emovec):
+    batch_size = text.size(0)
+    device = text.device
+    cond_lengths = torch.tensor([spk_cond_emb.shape[1]] * batch_size, device=device)
+    return gpt(
+        speech_conditioning_latent, text,
+        torch.tensor([text.shape[-1]] * batch_size, device=device),
+        codes, torch.tensor([codes.shape[-1]] * batch_size, device=device),
+        spk_cond_emb,
+        cond_mel_lengths=cond_lengths, emo_cond_mel_lengths=cond_lengths,
+        emo_vec=emovec, use_speed=torch.zeros(batch_size, device=device).long(),
+    )
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--batch_sizes", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--gen_tokens", type=int, nargs="+", default=[50, 150, 300])
+    parser.add_argument("--text_tokens", type=int, default=60)
+    parser.add_argument("--cond_frames", type=int, default=150, help="w2v-bert frames of the prompt (50Hz)")
+    parser.add_argument("--num_beams", type=int, default=1)
+    parser.add_argument("--no_kv_cache", action="store_true", default=False)
+    parser.add_argument("--no_prefix_cache", action="store_true", default=False,
+                        help="prefill the conditioning prefix on every call instead of reusing its KV state")
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    gpt = build_gpt(cfg, device, kv_cache=not args.no_kv_cache, prefix_cache_size=0 if args.no_prefix_cache else 16)
+
+    records = []
+    for batch_size in args.batch_sizes:
+        spk_cond_emb, text = random_inputs(cfg, device, batch_size, args.text_tokens, args.cond_frames)
+        for gen_tokens in args.gen_tokens:
+            gen = measure(lambda: generate(gpt, spk_cond_emb, text, gen_tokens, args.num_beams),
+                          device, args.warmup, args.repeat)
+            codes, latent, emovec = generate(gpt, spk_cond_emb, text, gen_tokens, args.num_beams)
+            fwd = measure(lambda: forward_latent(gpt, spk_cond_emb, text, codes, latent, emovec),
+                          device, args.warmup, args.repeat)
+            records.append({
+                "batch_size": batch_size,
+                "text_tokens": args.text_tokens,
+                "gen_tokens": gen_tokens,
+                "num_beams": args.num_beams,
+                "kv_cache": not args.no_kv_cache,
+                "prefix_cache": not args.no_prefix_cache,
+                "generate_s": gen["median"],
+                "tokens_per_s": batch_size * gen_tokens / gen["median"],
+                "ms_per_step": 1000 * gen["median"] / gen_tokens,
+                "forward_s": fwd["median"],
+                "generate": gen,
+                "forward": fwd,
+            })
+    print_table(records, ["batch_size", "gen_tokens", "generate_s", "tokens_per_s", "ms_per_step", "forward_s"])
+    return write_results("gpt", args, records)
+
+
+if __name__ == "__main__":
+    main()
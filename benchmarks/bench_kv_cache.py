@@ -0,0 +1,91 @@
+"""
+GPT decoding with and without the KV cache in fp32: tokens/s vs. sequence length, and a greedy-decoding check
+that both produce the same codes.
+
+Without the cache every decode step re-runs the whole cond + text + mel prefix, so the step time grows with
+the sequence length (quadratic total cost); with it the step time stays roughly flat. ``--model v1`` (default)
+is the IndexTTS v1 GPT used by the CPU fallback, ``--model v2`` the IndexTTS2 one.
+
+    python -m benchmarks.bench_kv_cache --gen_tokens 50 150 300 600 --threads 4
+    python -m benchmarks.bench_kv_cache --check   # exit 1 if the cached decoding diverges
+"""
+import argparse
+
+import torch
+
+from benchmarks.bench_gpt import generate as generate_v2
+from benchmarks.bench_gpt import random_inputs as random_inputs_v2
+from benchmarks.common import (add_common_args, build_gpt, build_gpt_v1, load_config, measure, print_table, setup,
+                               write_results)
+
+
+def generate_v1(gpt, cond_mel, text, gen_tokens, do_sample=True):
+    cond_mel_lengths = torch.tensor([cond_mel.shape[-1]] * cond_mel.size(0), device=text.device)
+    return gpt.inference_speech(
+        cond_mel, text, cond_mel_lengths=cond_mel_lengths,
+        do_sample=do_sample, top_p=0.8, top_k=30, temperature=1.0, num_return_sequences=1,
+        length_penalty=0.0, num_beams=1, repetition_penalty=10.0,
+        max_generate_length=gen_tokens, min_new_tokens=gen_tokens,
+    )
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--model", type=str, choices=["v1", "v2"], default="v1")
+    parser.add_argument("--gen_tokens", type=int, nargs="+", default=[50, 150, 300, 600])
+    parser.add_argument("--text_tokens", type=int, default=60)
+    parser.add_argument("--cond_frames", type=int, default=300,
+                        help="prompt frames: mel frames (v1) or w2v-bert frames (v2)")
+    parser.add_argument("--check", action="store_true", default=False,
+                        help="exit with an error if the greedy codes with and without the cache differ")
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    if args.model == "v1":
+        gpt = build_gpt_v1(cfg, device, kv_cache=True)
+        cond = torch.randn(1, 100, args.cond_frames, device=device)
+        text = torch.randint(2, cfg.gpt.number_text_tokens, (1, args.text_tokens), dtype=torch.int32, device=device)
+        generate = lambda n, do_sample=True: generate_v1(gpt, cond, text, n, do_sample)
+    else:
+        gpt = build_gpt(cfg, device, kv_cache=True)
+        cond, text = random_inputs_v2(cfg, device, 1, args.text_tokens, args.cond_frames)
+        generate = lambda n, do_sample=True: generate_v2(gpt, cond, text, n, 1, do_sample)[0]
+
+    records = []
+    for gen_tokens in args.gen_tokens:
+        timings, greedy = {}, {}
+        for kv_cache in (False, True):
+            # same weights, only the decoding path changes
+            gpt.inference_model.kv_cache = kv_cache
+            timings[kv_cache] = measure(lambda: generate(gen_tokens), device, args.warmup, args.repeat)
+            greedy[kv_cache] = generate(gen_tokens, do_sample=False)
+        match = (greedy[True] == greedy[False]).float().mean().item() if greedy[True].shape == greedy[False].shape \
+            else 0.0
+        records.append({
+            "model": args.model,
+            "gen_tokens": gen_tokens,
+            "seq_len": text.shape[-1] + gen_tokens,
+            "no_cache_s": timings[False]["median"],
+            "cache_s": timings[True]["median"],
+            "no_cache_tokens_per_s": gen_tokens / timings[False]["median"],
+            "cache_tokens_per_s": gen_tokens / timings[True]["median"],
+            "speedup": timings[False]["median"] / timings[True]["median"],
+            "greedy_match": match,
+            "no_cache": timings[False],
+            "cache": timings[True],
+        })
+    print_table(records, ["model", "gen_tokens", "seq_len", "no_cache_tokens_per_s", "cache_tokens_per_s", "speedup",
+                          "greedy_match"])
+    output = write_results("kv_cache", args, records)
+    if args.check:
+        diverged = [r["gen_tokens"] for r in records if r["greedy_match"] < 1.0]
+        if diverged:
+            print(f">> KV cache decoding diverges from the uncached decoding for gen_tokens: {diverged}")
+            raise SystemExit(1)
+        print(">> KV cache decoding matches the uncached decoding")
+    return output
+
+
+if __name__ == "__main__":
+    main()
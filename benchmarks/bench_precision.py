@@ -0,0 +1,123 @@
+"""
+Reduced precision (autocast fp16/bf16) for s2mel (CFM) and BigVGAN: numerical drift against fp32 and speed-up.
+
+The same noise and inputs are used for every precision. Reported drift:
+
+* ``mel_mae`` / ``mel_max_abs``: mean / max absolute difference of the CFM log-mel output vs. fp32
+* ``wav_snr_db``: SNR of the BigVGAN waveform (vocoding the fp32 mel) vs. fp32
+
+With ``--check`` the script exits with an error when a precision exceeds ``--max_mel_mae`` or falls
+below ``--min_wav_snr_db``. Random weights give a rough drift estimate only, pass
+``--s2mel_checkpoint checkpoints/s2mel.pth --scale full`` to validate the released s2mel weights.
+
+    python -m benchmarks.bench_precision --precisions bf16 -d cpu
+    python -m benchmarks.bench_precision --scale full -d cuda:0 --precisions fp16 bf16 --check
+"""
+import argparse
+
+import torch
+
+from benchmarks.bench_dit import random_inputs
+from benchmarks.common import (HOP_LENGTH, SAMPLING_RATE, add_common_args, build_bigvgan, build_s2mel, load_config,
+                               measure, print_table, setup, write_results)
+from indextts.utils.common import resolve_autocast_dtype
+
+
+def run_cfm(cfm, mu, prompt, style, diffusion_steps, inference_cfg_rate, dtype, seed):
+    torch.manual_seed(seed)
+    with torch.amp.autocast(mu.device.type, enabled=dtype is not None, dtype=dtype):
+        mel = cfm.inference(mu, torch.LongTensor([mu.size(1)]).to(mu.device), prompt, style, None, diffusion_steps,
+                            inference_cfg_rate=inference_cfg_rate)
+    return mel[:, :, prompt.size(-1):].float()
+
+
+def run_bigvgan(bigvgan, mel, dtype):
+    with torch.amp.autocast(mel.device.type, enabled=dtype is not None, dtype=dtype):
+        return bigvgan(mel.float()).float().squeeze(1)
+
+
+def snr_db(reference: torch.Tensor, estimate: torch.Tensor) -> float:
+    noise = (reference - estimate).pow(2).sum()
+    signal = reference.pow(2).sum()
+    if noise == 0:
+        return float("inf")
+    return (10 * torch.log10(signal / noise)).item()
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--precisions", type=str, nargs="+", choices=["fp16", "bf16"], default=["fp16", "bf16"])
+    parser.add_argument("--seq_len", type=int, default=1024, help="total mel frames (prompt + target)")
+    parser.add_argument("--prompt_frames", type=int, default=256)
+    parser.add_argument("--diffusion_steps", type=int, default=25)
+    parser.add_argument("--inference_cfg_rate", type=float, default=0.7)
+    parser.add_argument("--s2mel_checkpoint", type=str, default=None, help="load real s2mel weights (use --scale full)")
+    parser.add_argument("--check", action="store_true", default=False, help="fail when the drift is above the limits")
+    parser.add_argument("--max_mel_mae", type=float, default=0.1)
+    parser.add_argument("--min_wav_snr_db", type=float, default=20.0)
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    s2mel = build_s2mel(cfg, device, max_seq_length=args.seq_len)
+    if args.s2mel_checkpoint:
+        from indextts.s2mel.modules.commons import load_checkpoint2
+
+        s2mel, _, _, _ = load_checkpoint2(s2mel, None, args.s2mel_checkpoint, load_only_params=True,
+                                          ignore_modules=[], is_distributed=False)
+        s2mel = s2mel.to(device).eval()
+    cfm = s2mel.models["cfm"]
+    bigvgan = build_bigvgan(args.scale, device)
+
+    prompt_len = min(args.prompt_frames, args.seq_len // 2)
+    mu, prompt, style = random_inputs(cfg, device, 1, args.seq_len, prompt_len)
+    audio_s = (args.seq_len - prompt_len) * HOP_LENGTH / SAMPLING_RATE
+
+    ref_mel = run_cfm(cfm, mu, prompt, style, args.diffusion_steps, args.inference_cfg_rate, None, args.seed)
+    ref_wav = run_bigvgan(bigvgan, ref_mel, None)
+
+    records = []
+    failed = []
+    for precision in ["fp32"] + args.precisions:
+        dtype = resolve_autocast_dtype(precision, device)
+        if precision != "fp32" and dtype is None:
+            records.append({"precision": precision, "skipped": f"not supported on {args.device}"})
+            continue
+        cfm_time = measure(lambda: run_cfm(cfm, mu, prompt, style, args.diffusion_steps, args.inference_cfg_rate,
+                                           dtype, args.seed),
+                           device, min(args.warmup, 1), args.repeat)
+        vocode_time = measure(lambda: run_bigvgan(bigvgan, ref_mel, dtype), device, args.warmup, args.repeat)
+        mel = run_cfm(cfm, mu, prompt, style, args.diffusion_steps, args.inference_cfg_rate, dtype, args.seed)
+        wav = run_bigvgan(bigvgan, ref_mel, dtype)
+        record = {
+            "precision": precision,
+            "seq_len": args.seq_len,
+            "audio_s": audio_s,
+            "cfm_s": cfm_time["median"],
+            "bigvgan_s": vocode_time["median"],
+            "mel_mae": (mel - ref_mel).abs().mean().item(),
+            "mel_max_abs": (mel - ref_mel).abs().max().item(),
+            "wav_snr_db": snr_db(ref_wav, wav),
+            "cfm": cfm_time,
+            "bigvgan": vocode_time,
+        }
+        baseline = records[0]
+        record["cfm_speedup"] = baseline["cfm_s"] / record["cfm_s"]
+        record["bigvgan_speedup"] = baseline["bigvgan_s"] / record["bigvgan_s"]
+        if record["mel_mae"] > args.max_mel_mae or record["wav_snr_db"] < args.min_wav_snr_db:
+            failed.append(precision)
+        records.append(record)
+
+    print_table(records, ["precision", "cfm_s", "cfm_speedup", "bigvgan_s", "bigvgan_speedup",
+                          "mel_mae", "mel_max_abs", "wav_snr_db"])
+    output = write_results("precision", args, records, extra={"limits": {"max_mel_mae": args.max_mel_mae,
+                                                                         "min_wav_snr_db": args.min_wav_snr_db}})
+    if failed:
+        print(f">> drift above the limits for: {failed}")
+        if args.check:
+            raise SystemExit(1)
+    return output
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+s2mel (CFM) solve time vs. the length of the speaker prompt prepended to every segment.
+
+Every CFM call runs on ``prompt frames + target frames``, so the reference audio length is paid on every
+segment. This sweeps the prompt length for a few target lengths, e.g. to pick ``max_prompt_frames``
+(IndexTTS2 trims longer references to their most voiced window). 15s of reference audio is ~1292 frames.
+
+    python -m benchmarks.bench_prompt --prompt_frames 128 256 512 1292 --target_frames 172 860
+"""
+import argparse
+
+import torch
+
+from benchmarks.bench_dit import random_inputs
+from benchmarks.common import (HOP_LENGTH, SAMPLING_RATE, add_common_args, build_s2mel, load_config, measure,
+                               print_table, setup, write_results)
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.add_argument("--prompt_frames", type=int, nargs="+", default=[128, 256, 512, 1292])
+    parser.add_argument("--target_frames", type=int, nargs="+", default=[172, 860],
+                        help="generated mel frames per segment (172 ~ 2s, 860 ~ 10s)")
+    parser.add_argument("--diffusion_steps", type=int, default=25)
+    parser.add_argument("--inference_cfg_rate", type=float, default=0.7)
+    args = parser.parse_args(argv)
+    device = setup(args)
+
+    cfg = load_config(args.config, args.scale)
+    s2mel = build_s2mel(cfg, device, max_seq_length=max(args.prompt_frames) + max(args.target_frames))
+    cfm = s2mel.models["cfm"]
+
+    records = []
+    for target_frames in args.target_frames:
+        baseline = None
+        for prompt_frames in sorted(args.prompt_frames):
+            seq_len = prompt_frames + target_frames
+            mu, prompt, style = random_inputs(cfg, device, 1, seq_len, prompt_frames)
+            x_lens = torch.LongTensor([seq_len]).to(device)
+            solve = measure(lambda: cfm.inference(mu, x_lens, prompt, style, None, args.diffusion_steps,
+                                                  inference_cfg_rate=args.inference_cfg_rate),
+                            device, min(args.warmup, 1), args.repeat)
+            baseline = baseline or solve["median"]
+            records.append({
+                "target_frames": target_frames,
+                "target_s": target_frames * HOP_LENGTH / SAMPLING_RATE,
+                "prompt_frames": prompt_frames,
+                "prompt_s": prompt_frames * HOP_LENGTH / SAMPLING_RATE,
+                "diffusion_steps": args.diffusion_steps,
+                "solve_s": solve["median"],
+                "vs_shortest_prompt": solve["median"] / baseline,
+                "solve": solve,
+            })
+    print_table(records, ["target_frames", "prompt_frames", "prompt_s", "solve_s", "vs_shortest_prompt"])
+    return write_results("prompt", args, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Text segmentation of book-length input: the eager path (normalize and tokenize the whole text, then
+``split_segments``) vs. the streaming segmenter (``TextTokenizer.iter_segments``, paragraph by paragraph).
+
+Reports the time to the first segment (when synthesis can start), the total time and the peak Python memory
+(tracemalloc, measured in a separate run). Needs the real BPE model (``checkpoints/bpe.model``), the benchmark
+is skipped when it is missing.
+
+    python -m benchmarks.bench_segmenter --text_chars 1000000
+    python -m benchmarks.bench_segmenter --text_file book.txt
+"""
+import argparse
+import os
+import time
+import tracemalloc
+
+from benchmarks.bench_frontend import SAMPLE_TEXTS
+from benchmarks.common import REPO_ROOT, add_common_args, print_table, setup, write_results
+
+
+def build_document(num_chars: int, sentences_per_paragraph: int = 5) -> str:
+    paragraphs, paragraph, size = [], "", 0
+    i = 0
+    while size < num_chars:
+        paragraph += SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)]
+        i += 1
+        if i % sentences_per_paragraph == 0:
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 1
+            paragraph = ""
+    return "\n".join(paragraphs)[:num_chars]
+
+
+def run_eager(tokenizer, text, max_tokens):
+    start = time.perf_counter()
+    segments = tokenizer.split_segments(tokenizer.tokenize(text), max_tokens)
+    end = time.perf_counter()
+    return end - start, end - start, len(segments)
+
+
+def run_streaming(tokenizer, text, max_tokens):
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in tokenizer.iter_segments(text, max_tokens):
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    return first, time.perf_counter() - start, count
+
+
+def peak_memory(fn, *args) -> int:
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(argv=None):
+    parser = add_common_args(argparse.ArgumentParser(description=__doc__))
+    parser.set_defaults(warmup=0, repeat=1)
+    parser.add_argument("--bpe_model", type=str, default=os.path.join(REPO_ROOT, "checkpoints", "bpe.model"))
+    parser.add_argument("--text_chars", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--text_file", type=str, default=None, help="segment this file instead of generated text")
+    parser.add_argument("--max_text_tokens_per_segment", type=int, default=120)
+    args = parser.parse_args(argv)
+    setup(args)
+
+    if not os.path.exists(args.bpe_model):
+        print(f">> bpe model {args.bpe_model} not found, skip segmenter benchmark")
+        return write_results("segmenter", args, [], extra={"skipped": f"missing {args.bpe_model}"})
+
+    from indextts.utils.front import TextNormalizer, TextTokenizer
+
+    tokenizer = TextTokenizer(args.bpe_model, TextNormalizer())
+    if args.text_file:
+        with open(args.text_file, "r", encoding="utf-8") as f:
+            documents = [f.read()]
+    else:
+        documents = [build_document(n) for n in args.text_chars]
+
+    records = []
+    for text in documents:
+        for mode, fn in (("eager", run_eager), ("streaming", run_streaming)):
+            for _ in range(args.warmup):
+                fn(tokenizer, text, args.max_text_tokens_per_segment)
+            runs = [fn(tokenizer, text, args.max_text_tokens_per_segment) for _ in range(args.repeat)]
+            first = sorted(r[0] for r in runs)[len(runs) // 2]
+            total = sorted(r[1] for r in runs)[len(runs) // 2]
+            peak = peak_memory(fn, tokenizer, text, args.max_text_tokens_per_segment)
+            records.append({
+                "mode": mode,
+                "text_chars": len(text),
+                "segments": runs[0][2],
+                "first_segment_s": first,
+                "total_s": total,
+                "chars_per_s": len(text) / total,
+                "peak_mem_mb": peak / 2 ** 20,
+                "runs": [{"first_segment_s": r[0], "total_s": r[1]} for r in runs],
+            })
+    print_table(records, ["mode", "text_chars", "segments", "first_segment_s", "total_s", "chars_per_s",
+                          "peak_mem_mb"])
+    return write_results("segmenter", args, records)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""
+Shared helpers for the benchmark suite.
+
+Models are built from ``checkpoints/config.yaml`` and randomly initialized, so the suite runs
+without checkpoints (CPU by default). ``--scale tiny`` shrinks widths/depths while keeping
+the architecture and the audio frame rates, ``--scale full`` keeps the production shapes.
+"""
+import argparse
+import copy
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+import torch
+from omegaconf import OmegaConf
+
+DEFAULT_CONFIG = os.path.join(REPO_ROOT, "checkpoints", "config.yaml")
+DEFAULT_OUTPUT_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+BIGVGAN_CONFIG = os.path.join(REPO_ROOT, "indextts", "s2mel", "modules", "bigvgan", "config.json")
+
+# semantic codes are 50Hz, mel frames are 22050 / 256 Hz
+CODE_TO_MEL_RATIO = 1.72
+SAMPLING_RATE = 22050
+HOP_LENGTH = 256
+
+TINY_OVERRIDES = {
+    "gpt": {
+        "model_dim": 256,
+        "heads": 4,
+        "layers": 2,
+        "condition_module": {"output_size": 128, "linear_units": 256, "attention_heads": 2, "num_blocks": 1},
+        "emo_condition_module": {"output_size": 128, "linear_units": 256, "attention_heads": 2, "num_blocks": 1},
+    },
+    "semantic_codec": {"vocos_dim": 64, "vocos_intermediate_dim": 128, "vocos_num_layers": 1},
+    "s2mel": {
+        "length_regulator": {"channels": 128},
+        "DiT": {"hidden_dim": 128, "num_heads": 2, "depth": 2, "content_dim": 128},
+        "wavenet": {"hidden_dim": 128, "num_layers": 2},
+    },
+}
+BIGVGAN_TINY_OVERRIDES = {"upsample_initial_channel": 128}
+
+
+def add_common_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("-c", "--config", type=str, default=DEFAULT_CONFIG, help="Model config to derive shapes from")
+    parser.add_argument("--scale", type=str, choices=["tiny", "full"], default="tiny",
+                        help="`tiny` shrinks the models, `full` keeps the production shapes")
+    parser.add_argument("-d", "--device", type=str, default="cpu")
+    parser.add_argument("--threads", type=int, default=None, help="torch.set_num_threads, default: torch default")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="JSON result file, default: benchmarks/results/<name>.json")
+    return parser
+
+
+def setup(args) -> torch.device:
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    torch.manual_seed(args.seed)
+    torch.set_grad_enabled(False)
+    return torch.device(args.device)
+
+
+def _merge(base, overrides):
+    for key, value in overrides.items():
+        if isinstance(value, dict):
+            _merge(base[key], value)
+        else:
+            base[key] = value
+
+
+def load_config(cfg_path: str = DEFAULT_CONFIG, scale: str = "tiny"):
+    cfg = OmegaConf.load(cfg_path)
+    if scale == "tiny":
+        cfg = OmegaConf.to_container(cfg, resolve=True)
+        _merge(cfg, TINY_OVERRIDES)
+        cfg = OmegaConf.create(cfg)
+    return cfg
+
+
+def build_gpt(cfg, device, kv_cache=True, prefix_cache_size=16):
+    from indextts.gpt.model_v2 import UnifiedVoice
+
+    gpt = UnifiedVoice(**cfg.gpt).to(device).eval()
+    gpt.post_init_gpt2_config(use_deepspeed=False, kv_cache=kv_cache, half=False, prefix_cache_size=prefix_cache_size)
+    return gpt
+
+
+def build_gpt_v1(cfg, device, kv_cache=True):
+    """IndexTTS v1 GPT (mel conditioning, no emotion branch) with the shapes of ``cfg.gpt``."""
+    from indextts.gpt.model import UnifiedVoice
+
+    kwargs = {k: v for k, v in OmegaConf.to_container(cfg.gpt, resolve=True).items() if k != "emo_condition_module"}
+    gpt = UnifiedVoice(**kwargs).to(device).eval()
+    gpt.post_init_gpt2_config(use_deepspeed=False, kv_cache=kv_cache, half=False)
+    return gpt
+
+
+def build_semantic_codec(cfg, device):
+    from indextts.utils.maskgct_utils import build_semantic_codec as _build
+
+    return _build(cfg.semantic_codec).to(device).eval()
+
+
+def build_s2mel(cfg, device, max_seq_length=8192):
+    from indextts.s2mel.modules.commons import MyModel
+
+    s2mel = MyModel(cfg.s2mel, use_gpt_latent=True)
+    if cfg.gpt.model_dim != 1280:
+        # `gpt_layer` hard-codes the 1280 wide GPT latent of the released model
+        s2mel.models["gpt_layer"] = torch.nn.Sequential(torch.nn.Linear(cfg.gpt.model_dim, 256),
+                                                        torch.nn.Linear(256, 128),
+                                                        torch.nn.Linear(128, 1024))
+    s2mel = s2mel.to(device).eval()
+    s2mel.models["cfm"].estimator.setup_caches(max_batch_size=1, max_seq_length=max_seq_length)
+    return s2mel
+
+
+def build_bigvgan(scale: str, device, use_cuda_kernel=False, use_polyphase_activation=False):
+    from indextts.s2mel.modules.bigvgan import bigvgan
+
+    h = bigvgan.load_hparams_from_json(BIGVGAN_CONFIG)
+    if scale == "tiny":
+        h.update(copy.deepcopy(BIGVGAN_TINY_OVERRIDES))
+    model = bigvgan.BigVGAN(h, use_cuda_kernel=use_cuda_kernel, use_polyphase_activation=use_polyphase_activation)
+    model.remove_weight_norm()
+    return model.to(device).eval()
+
+
+def codes_to_seconds(num_codes: int) -> float:
+    return int(num_codes * CODE_TO_MEL_RATIO) * HOP_LENGTH / SAMPLING_RATE
+
+
+def synchronize(device):
+    device = torch.device(device)
+    if device.type == "cuda":
+        torch.cuda.synchronize(device)
+    elif device.type == "xpu":
+        torch.xpu.synchronize(device)
+    elif device.type == "mps":
+        torch.mps.synchronize()
+
+
+def measure(fn: Callable[[], object], device, warmup=1, repeat=3) -> Dict:
+    """
+    Run ``fn`` ``warmup`` times untimed, then ``repeat`` times timed. Times are in seconds.
+    """
+    for _ in range(warmup):
+        fn()
+    synchronize(device)
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        synchronize(device)
+        times.append(time.perf_counter() - start)
+    return {
+        "mean": statistics.fmean(times),
+        "median": statistics.median(times),
+        "min": min(times),
+        "max": max(times),
+        "std": statistics.pstdev(times),
+        "repeat": repeat,
+    }
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment(args) -> Dict:
+    return {
+        "git_revision": _git_revision(),
+        "python": platform.python_version(),
+        "torch": torch.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "device": args.device,
+        "cuda_device": torch.cuda.get_device_name(args.device) if args.device.startswith("cuda") else None,
+        "threads": torch.get_num_threads(),
+        "scale": args.scale,
+        "seed": args.seed,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def write_results(name: str, args, records: List[Dict], extra: Optional[Dict] = None) -> str:
+    output = args.output or os.path.join(DEFAULT_OUTPUT_DIR, f"{name}.json")
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    result = {"benchmark": name, "environment": environment(args), "results": records}
+    if extra:
+        result.update(extra)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f">> {name} results saved to: {output}")
+    return output
+
+
+def print_table(records: List[Dict], columns: List[str]):
+    widths = [max(len(c), *(len(_fmt(r.get(c))) for r in records)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for r in records:
+        print("  ".join(_fmt(r.get(c)).ljust(w) for c, w in zip(columns, widths)))
+
+
+def _fmt(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.4f}"
+    return str(value)
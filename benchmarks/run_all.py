@@ -0,0 +1,67 @@
+"""
+Run every benchmark with its default sweep and write one JSON file per benchmark.
+Exits with an error when a benchmark fails, including the drift limits of ``bench_precision --check``.
+
+    python -m benchmarks.run_all --scale tiny -d cpu --output_dir benchmarks/results
+"""
+import argparse
+import os
+import traceback
+
+from benchmarks import (bench_attn, bench_bigvgan, bench_dit, bench_e2e, bench_frontend, bench_gpt,
+                        bench_kv_cache, bench_precision, bench_prompt, bench_segmenter)
+from benchmarks.common import DEFAULT_CONFIG, DEFAULT_OUTPUT_DIR
+
+BENCHMARKS = {
+    "frontend": bench_frontend,
+    "gpt": bench_gpt,
+    "dit": bench_dit,
+    "bigvgan": bench_bigvgan,
+    "e2e": bench_e2e,
+    "precision": bench_precision,
+    "prompt": bench_prompt,
+    "kv_cache": bench_kv_cache,
+    "attn": bench_attn,
+    "segmenter": bench_segmenter,
+}
+
+# arguments added to the common ones, per benchmark
+EXTRA_ARGV = {
+    # fp16/bf16 s2mel and BigVGAN must stay within the drift limits of fp32
+    "precision": ["--check"],
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--only", type=str, nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("-c", "--config", type=str, default=DEFAULT_CONFIG)
+    parser.add_argument("--scale", type=str, choices=["tiny", "full"], default="tiny")
+    parser.add_argument("-d", "--device", type=str, default="cpu")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output_dir", type=str, default=DEFAULT_OUTPUT_DIR)
+    args = parser.parse_args(argv)
+
+    common_argv = ["-c", args.config, "--scale", args.scale, "-d", args.device, "--seed", str(args.seed)]
+    if args.threads:
+        common_argv += ["--threads", str(args.threads)]
+    failed = []
+    for name in args.only:
+        print(f">> running benchmark: {name}")
+        try:
+            BENCHMARKS[name].main(common_argv + EXTRA_ARGV.get(name, [])
+                                  + ["-o", os.path.join(args.output_dir, f"{name}.json")])
+        except SystemExit as e:
+            if e.code:
+                failed.append(name)
+        except Exception:
+            traceback.print_exc()
+            failed.append(name)
+    if failed:
+        print(f">> failed benchmarks: {failed}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
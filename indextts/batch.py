@@ -0,0 +1,386 @@
+"""
+Offline bulk synthesis for JSONL manifests.
+
+Each manifest line uses the same schema as ``examples/cases.jsonl``::
+
+    {"prompt_audio": "voice_01.wav", "text": "...", "emo_mode": 0}
+
+Optional keys: ``id``, ``output``, ``emo_audio``, ``emo_weight``, ``emo_vec`` (list of 8 floats)
+or ``emo_vec_1`` ... ``emo_vec_8``, ``emo_text``, ``emo_random``, ``seed`` (overrides ``--seed``).
+Relative audio paths are resolved against the manifest directory.
+
+Usage:
+    indextts batch manifest.jsonl -o outputs/batch --workers 2 --devices cuda:0,cuda:1
+    indextts batch manifest.jsonl --seed 42 --segment_cache_dir outputs/segment_cache
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from typing import Dict, List, Optional, Set
+
+RESULTS_FILE = "results.jsonl"
+SHARD_RESULTS_PATTERN = "results.{rank}.jsonl"
+SUMMARY_FILE = "summary.json"
+
+
+def _job_digest(job: Dict) -> str:
+    # the whole job content, so the id does not depend on the position of the line in the manifest
+    payload = json.dumps({k: v for k, v in job.items() if k != "id"}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def _resolve_audio_path(path: Optional[str], base_dir: str) -> Optional[str]:
+    if not path:
+        return None
+    if os.path.isabs(path) or os.path.exists(path):
+        return path
+    return os.path.join(base_dir, path)
+
+
+def load_manifest(manifest_path: str) -> List[Dict]:
+    """
+    Read a JSONL manifest, assign stable job ids and resolve audio paths.
+    Jobs without ``id`` are keyed by a digest of their content, identical jobs get a ``_<n>`` suffix in manifest
+    order, so inserting or removing other lines does not re-key them.
+    """
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs: List[Dict] = []
+    seen_ids: Set[str] = set()
+    digest_counts: Dict[str, int] = {}
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            if not job.get("text", "").strip() or not job.get("prompt_audio"):
+                print(f">> skip manifest line {line_no + 1}: `text` and `prompt_audio` are required")
+                continue
+            if job.get("id") is not None:
+                job["id"] = str(job["id"])
+            else:
+                digest = _job_digest(job)
+                count = digest_counts.get(digest, 0)
+                digest_counts[digest] = count + 1
+                job["id"] = f"{digest}_{count}" if count else digest
+            if job["id"] in seen_ids:
+                raise ValueError(f"duplicated job id `{job['id']}` at manifest line {line_no + 1}")
+            seen_ids.add(job["id"])
+            job["order"] = line_no
+            job["prompt_audio"] = _resolve_audio_path(job["prompt_audio"], base_dir)
+            job["emo_audio"] = _resolve_audio_path(job.get("emo_audio"), base_dir)
+            jobs.append(job)
+    return jobs
+
+
+def speaker_key(job: Dict) -> str:
+    """
+    Jobs with the same key reuse the cached speaker/emotion conditioning of ``IndexTTS2``.
+    """
+    emo_audio = job.get("emo_audio") if int(job.get("emo_mode", 0)) == 1 else None
+    return f"{job['prompt_audio']}|{emo_audio or ''}"
+
+
+def shard_jobs(jobs: List[Dict], num_shards: int) -> List[List[Dict]]:
+    """
+    Split jobs into ``num_shards`` shards without splitting a speaker across shards.
+    Speaker groups are assigned greedily (largest first) to the least loaded shard,
+    using the text length as the cost estimate. Jobs inside a shard are ordered by speaker
+    so that consecutive jobs hit the conditioning cache.
+    """
+    groups: Dict[str, List[Dict]] = {}
+    for job in jobs:
+        groups.setdefault(speaker_key(job), []).append(job)
+
+    shards: List[List[Dict]] = [[] for _ in range(max(1, num_shards))]
+    loads = [0] * len(shards)
+    for key in sorted(groups, key=lambda k: (-sum(len(j["text"]) for j in groups[k]), k)):
+        rank = loads.index(min(loads))
+        shards[rank].extend(sorted(groups[key], key=lambda j: j["order"]))
+        loads[rank] += sum(len(j["text"]) for j in groups[key])
+    return shards
+
+
+def _iter_results(output_dir: str):
+    if not os.path.isdir(output_dir):
+        return
+    for name in sorted(os.listdir(output_dir)):
+        if not (name.startswith("results.") and name.endswith(".jsonl")) or name == RESULTS_FILE:
+            continue
+        with open(os.path.join(output_dir, name), "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # a torn line left behind by a crashed worker
+                    continue
+
+
+def load_finished(output_dir: str) -> Dict[str, Dict]:
+    """
+    Results of jobs that already finished successfully and whose output still exists.
+    """
+    finished: Dict[str, Dict] = {}
+    for result in _iter_results(output_dir):
+        if result.get("status") == "ok" and os.path.isfile(result.get("output", "")):
+            finished[result["id"]] = result
+    return finished
+
+
+def _output_path(job: Dict, output_dir: str) -> str:
+    if job.get("output"):
+        return job["output"] if os.path.isabs(job["output"]) else os.path.join(output_dir, job["output"])
+    return os.path.join(output_dir, "wavs", f"{job['id']}.wav")
+
+
+def _infer_kwargs(tts, job: Dict) -> Dict:
+    emo_mode = int(job.get("emo_mode", 0))
+    emo_weight = float(job.get("emo_weight", 1.0))
+    kwargs = {
+        "spk_audio_prompt": job["prompt_audio"],
+        "text": job["text"].strip(),
+        "use_random": bool(job.get("emo_random", False)),
+    }
+    if emo_mode == 1 and job.get("emo_audio"):
+        kwargs["emo_audio_prompt"] = job["emo_audio"]
+        kwargs["emo_alpha"] = emo_weight
+    elif emo_mode == 2:
+        vec = job.get("emo_vec") or [float(job.get(f"emo_vec_{i}", 0.0)) for i in range(1, 9)]
+        kwargs["emo_vector"] = tts.normalize_emo_vec(list(vec), apply_bias=True)
+        kwargs["emo_alpha"] = emo_weight
+    elif emo_mode == 3:
+        kwargs["use_emo_text"] = True
+        kwargs["emo_text"] = job.get("emo_text") or None
+        kwargs["emo_alpha"] = emo_weight
+    return kwargs
+
+
+def run_shard(rank: int, device: Optional[str], jobs: List[Dict], args_dict: Dict) -> None:
+    """
+    Synthesize one shard in the current process and append a result line per job.
+    """
+    import torchaudio
+
+    from indextts.infer_v2 import IndexTTS2
+
+    output_dir = args_dict["output_dir"]
+    tts = IndexTTS2(cfg_path=args_dict["config"], model_dir=args_dict["model_dir"],
+                    use_fp16=args_dict["fp16"], device=device,
+                    use_cuda_kernel=args_dict["cuda_kernel"],
+                    s2mel_precision=args_dict["s2mel_precision"],
+                    bigvgan_tile_frames=args_dict["bigvgan_tile_frames"],
+                    max_prompt_frames=args_dict["max_prompt_frames"],
+                    prepare_prompts=args_dict["prepare_prompts"],
+                    attn_backend=args_dict["attn_backend"],
+                    segment_cache_dir=args_dict["segment_cache_dir"],
+                    mel_budget_slack=args_dict["mel_budget_slack"] or None)
+    generation_kwargs = args_dict["generation_kwargs"]
+    results_path = os.path.join(output_dir, SHARD_RESULTS_PATTERN.format(rank=rank))
+    with open(results_path, "a", encoding="utf-8") as results_file:
+        for idx, job in enumerate(jobs):
+            output_path = _output_path(job, output_dir)
+            os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            # write to a temporary file first so a crash never leaves a truncated wav behind
+            tmp_path = output_path[:-len(".wav")] + ".part.wav" if output_path.endswith(".wav") \
+                else output_path + ".part.wav"
+            result = {"id": job["id"], "order": job["order"], "output": output_path, "worker": rank}
+            start_time = time.perf_counter()
+            try:
+                seed = job.get("seed", args_dict["seed"])
+                tts.infer(output_path=tmp_path,
+                          max_text_tokens_per_segment=args_dict["max_text_tokens_per_segment"],
+                          seed=int(seed) if seed is not None else None,
+                          **_infer_kwargs(tts, job), **generation_kwargs)
+                os.replace(tmp_path, output_path)
+                info = torchaudio.info(output_path)
+                result["audio_seconds"] = info.num_frames / info.sample_rate
+                result["status"] = "ok"
+            except Exception as e:
+                result["status"] = "error"
+                result["error"] = f"{type(e).__name__}: {e}"
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            result["synth_seconds"] = time.perf_counter() - start_time
+            results_file.write(json.dumps(result, ensure_ascii=False) + "\n")
+            results_file.flush()
+            os.fsync(results_file.fileno())
+            print(f">> [worker {rank}] {idx + 1}/{len(jobs)} {job['id']}: {result['status']}"
+                  f" ({result['synth_seconds']:.2f}s)")
+
+
+def _run_shard_entry(rank: int, device: Optional[str], jobs: List[Dict], args_dict: Dict) -> None:
+    # entry point of spawned workers: pin the worker to its CUDA device before any model is built
+    if device and device.startswith("cuda"):
+        import torch
+        torch.cuda.set_device(device)
+    run_shard(rank, device, jobs, args_dict)
+
+
+def summarize(output_dir: str, jobs: List[Dict], wall_seconds: float, run_ids: Optional[Set[str]] = None) -> Dict:
+    """
+    Merge the per-worker results into ``results.jsonl`` (manifest order) and report aggregate RTF.
+    ``run_ids``: ids of the jobs synthesized in this run, the wall-clock RTF only counts their audio
+    (a resumed run does not get the audio of the earlier runs).
+    """
+    latest: Dict[str, Dict] = {}
+    for result in _iter_results(output_dir):
+        # a later `ok` entry overrides an earlier failure of the same job
+        if result["id"] not in latest or result.get("status") == "ok":
+            latest[result["id"]] = result
+    merged = [latest[job["id"]] for job in jobs if job["id"] in latest]
+    with open(os.path.join(output_dir, RESULTS_FILE), "w", encoding="utf-8") as f:
+        for result in sorted(merged, key=lambda r: r["order"]):
+            f.write(json.dumps(result, ensure_ascii=False) + "\n")
+
+    ok = [r for r in merged if r.get("status") == "ok"]
+    audio_seconds = sum(r.get("audio_seconds", 0.0) for r in ok)
+    synth_seconds = sum(r.get("synth_seconds", 0.0) for r in ok)
+    run_audio_seconds = sum(r.get("audio_seconds", 0.0) for r in ok if run_ids is None or r["id"] in run_ids)
+    summary = {
+        "total_jobs": len(jobs),
+        "succeeded": len(ok),
+        "failed": sum(1 for r in merged if r.get("status") != "ok"),
+        "pending": len(jobs) - len(merged),
+        "audio_seconds": audio_seconds,
+        "synth_seconds": synth_seconds,
+        # RTF per worker (compute time / audio time) and throughput RTF of this run (wall time / audio time)
+        "rtf": synth_seconds / audio_seconds if audio_seconds > 0 else None,
+        "wall_seconds": wall_seconds,
+        "run_audio_seconds": run_audio_seconds,
+        "wall_rtf": wall_seconds / run_audio_seconds if run_audio_seconds > 0 else None,
+    }
+    with open(os.path.join(output_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return summary
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="indextts batch", description="IndexTTS2 offline bulk synthesis")
+    parser.add_argument("manifest", type=str, help="Path to the JSONL manifest")
+    parser.add_argument("-o", "--output_dir", type=str, default="outputs/batch", help="Directory for wavs and results")
+    parser.add_argument("-c", "--config", type=str, default="checkpoints/config.yaml", help="Path to the config file")
+    parser.add_argument("--model_dir", type=str, default="checkpoints", help="Path to the model directory")
+    parser.add_argument("--fp16", action="store_true", default=False, help="Use FP16 for inference if available")
+    parser.add_argument("--cuda_kernel", action="store_true", default=False, help="Use BigVGAN custom CUDA kernel")
+    parser.add_argument("--s2mel_precision", type=str, choices=["fp32", "fp16", "bf16"], default=None,
+                        help="Autocast precision of s2mel and BigVGAN")
+    parser.add_argument("--bigvgan_tile_frames", type=int, default=None,
+                        help="Vocode in tiles of N mel frames to bound BigVGAN memory")
+    parser.add_argument("--max_prompt_frames", type=int, default=None,
+                        help="Trim the s2mel speaker prompt to its N most voiced mel frames")
+    parser.add_argument("--prepare_prompts", action="store_true", default=False,
+                        help="Trim silence and normalize loudness of the reference audios (cached per file)")
+    parser.add_argument("--attn_backend", type=str, choices=["auto", "eager", "sdpa", "flash_attention_2"],
+                        default="auto", help="Attention implementation of the GPT")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed of every job (a job's `seed` key overrides it), "
+                             "the same seed renders the same audio")
+    parser.add_argument("--segment_cache_dir", type=str, default=None,
+                        help="Cache synthesized segments here and reuse them for seeded jobs and later runs")
+    parser.add_argument("--mel_budget_slack", type=float, default=2.0,
+                        help="Stop the generation of a segment after this many times the mel tokens predicted from "
+                             "its text length, 0: only the fixed max_mel_tokens cap")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="Number of worker processes")
+    parser.add_argument("-d", "--devices", type=str, default=None,
+                        help="Comma separated devices assigned round-robin to workers, e.g. `cuda:0,cuda:1`")
+    parser.add_argument("--max_text_tokens_per_segment", type=int, default=120)
+    parser.add_argument("--no_resume", action="store_true", default=False,
+                        help="Ignore previous results and synthesize every job again")
+    parser.add_argument("--temperature", type=float, default=0.8)
+    parser.add_argument("--top_p", type=float, default=0.8)
+    parser.add_argument("--top_k", type=int, default=30)
+    parser.add_argument("--num_beams", type=int, default=3)
+    parser.add_argument("--max_mel_tokens", type=int, default=1500)
+    parser.add_argument("--diffusion_steps", type=int, default=25)
+    parser.add_argument("--inference_cfg_rate", type=float, default=0.7)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if not os.path.exists(args.manifest):
+        print(f"ERROR: manifest {args.manifest} does not exist.")
+        sys.exit(1)
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    jobs = load_manifest(args.manifest)
+    if args.no_resume:
+        for name in os.listdir(args.output_dir):
+            if name.startswith("results.") and name.endswith(".jsonl"):
+                os.remove(os.path.join(args.output_dir, name))
+        finished = {}
+    else:
+        finished = load_finished(args.output_dir)
+    pending = [job for job in jobs if job["id"] not in finished]
+    print(f">> manifest jobs: {len(jobs)}, finished: {len(finished)}, pending: {len(pending)}")
+
+    devices = [d.strip() for d in args.devices.split(",")] if args.devices else [None]
+    num_workers = max(1, min(args.workers, len(pending))) if pending else 0
+    shards = shard_jobs(pending, num_workers) if num_workers else []
+    args_dict = {
+        "output_dir": args.output_dir,
+        "config": args.config,
+        "model_dir": args.model_dir,
+        "fp16": args.fp16,
+        "cuda_kernel": args.cuda_kernel,
+        "s2mel_precision": args.s2mel_precision,
+        "bigvgan_tile_frames": args.bigvgan_tile_frames,
+        "max_prompt_frames": args.max_prompt_frames,
+        "prepare_prompts": args.prepare_prompts,
+        "attn_backend": args.attn_backend,
+        "segment_cache_dir": args.segment_cache_dir,
+        "mel_budget_slack": args.mel_budget_slack,
+        "seed": args.seed,
+        "max_text_tokens_per_segment": args.max_text_tokens_per_segment,
+        "generation_kwargs": {
+            "temperature": args.temperature,
+            "top_p": args.top_p,
+            "top_k": args.top_k,
+            "num_beams": args.num_beams,
+            "max_mel_tokens": args.max_mel_tokens,
+            "diffusion_steps": args.diffusion_steps,
+            "inference_cfg_rate": args.inference_cfg_rate,
+        },
+    }
+
+    start_time = time.perf_counter()
+    if num_workers == 1:
+        run_shard(0, devices[0], shards[0], args_dict)
+    elif num_workers > 1:
+        import multiprocessing as mp
+
+        ctx = mp.get_context("spawn")  # CUDA cannot be re-initialized in forked processes
+        processes = []
+        for rank, shard in enumerate(shards):
+            if not shard:
+                continue
+            device = devices[rank % len(devices)]
+            p = ctx.Process(target=_run_shard_entry, args=(rank, device, shard, args_dict))
+            p.start()
+            processes.append(p)
+        for p in processes:
+            p.join()
+        failed_workers = [p.pid for p in processes if p.exitcode != 0]
+        if failed_workers:
+            print(f">> WARNING: workers {failed_workers} exited abnormally, rerun the command to resume.")
+    wall_seconds = time.perf_counter() - start_time
+
+    summary = summarize(args.output_dir, jobs, wall_seconds, run_ids={job["id"] for job in pending})
+    print(f">> succeeded: {summary['succeeded']}, failed: {summary['failed']}, pending: {summary['pending']}")
+    print(f">> audio: {summary['audio_seconds']:.2f} seconds, synthesis: {summary['synth_seconds']:.2f} seconds")
+    if summary["rtf"] is not None:
+        print(f">> RTF: {summary['rtf']:.4f}")
+    if summary["wall_rtf"] is not None:
+        print(f">> wall-clock RTF of this run: {summary['wall_rtf']:.4f} "
+              f"({summary['run_audio_seconds']:.2f} seconds of audio synthesized in this run)")
+    print(f">> results manifest: {os.path.join(args.output_dir, RESULTS_FILE)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,12 @@ import warnings
 warnings.filterwarnings("ignore", category=UserWarning)
 warnings.filterwarnings("ignore", category=FutureWarning)
 def main():
+    # 批量合成: indextts batch manifest.jsonl [options]
+    if len(sys.argv) > 1 and sys.argv[1] == "batch":
+        from indextts.batch import main as batch_main
+        batch_main(sys.argv[2:])
+        return
+
     import argparse
     parser = argparse.ArgumentParser(description="IndexTTS Command Line")
     parser.add_argument("text", type=str, help="Text to be synthesized")
@@ -24,6 +30,24 @@ def main():
     parser.add_argument("--temperature", type=float, default=0.8, help="Sampling temperature (IndexTTS2 only)")
     parser.add_argument("--top_p", type=float, default=0.8, help="Top-p sampling parameter (IndexTTS2 only)")
     parser.add_argument("--top_k", type=int, default=30, help="Top-k sampling parameter (IndexTTS2 only)")
+    parser.add_argument("--s2mel_precision", type=str, choices=["fp32", "fp16", "bf16"], default=None,
+                        help="Autocast precision of s2mel and BigVGAN, bf16 also works on CPU if supported (IndexTTS2 only)")
+    parser.add_argument("--bigvgan_tile_frames", type=int, default=None,
+                        help="Vocode in tiles of N mel frames to bound memory on long segments (IndexTTS2 only)")
+    parser.add_argument("--max_prompt_frames", type=int, default=None,
+                        help="Trim the s2mel speaker prompt to its N most voiced mel frames (IndexTTS2 only)")
+    parser.add_argument("--prepare_prompts", action="store_true", default=False,
+                        help="Trim silence and normalize loudness of the reference audios (IndexTTS2 only)")
+    parser.add_argument("--attn_backend", type=str, choices=["auto", "eager", "sdpa", "flash_attention_2"],
+                        default="auto", help="Attention implementation of the GPT (IndexTTS2 only)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Seed of the sampling, the same seed renders the same audio (IndexTTS2 only)")
+    parser.add_argument("--segment_cache_dir", type=str, default=None,
+                        help="Cache synthesized segments here and reuse them in later runs with the same --seed "
+                             "(IndexTTS2 only)")
+    parser.add_argument("--mel_budget_slack", type=float, default=2.0,
+                        help="Stop the generation of a segment after this many times the mel tokens predicted from "
+                             "its text length, 0: only the fixed max_mel_tokens cap (IndexTTS2 only)")
 
     args = parser.parse_args()
     if len(args.text.strip()) == 0:
@@ -75,7 +99,14 @@ def main():
                 cfg_path=args.config,
                 model_dir=args.model_dir,
                 use_fp16=args.fp16,
-                device=args.device
+                device=args.device,
+                s2mel_precision=args.s2mel_precision,
+                bigvgan_tile_frames=args.bigvgan_tile_frames,
+                max_prompt_frames=args.max_prompt_frames,
+                prepare_prompts=args.prepare_prompts,
+                attn_backend=args.attn_backend,
+                segment_cache_dir=args.segment_cache_dir,
+                mel_budget_slack=args.mel_budget_slack or None
             )
 
             # 构建IndexTTS2推理参数
@@ -99,6 +130,10 @@ def main():
                 infer_kwargs['use_random'] = True
                 print("🎲 Random sampling enabled")
 
+            if args.seed is not None:
+                infer_kwargs['seed'] = args.seed
+                print(f"🌱 Seed: {args.seed}")
+
             # 执行推理
             print(f"🚀 Starting synthesis...")
             print(f"   Text: {args.text[:50]}{'...' if len(args.text) > 50 else ''}")
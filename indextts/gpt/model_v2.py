@@ -1,4 +1,6 @@
 import functools
+import hashlib
+from collections import OrderedDict
 
 import torch
 import torch.nn as nn
@@ -19,6 +21,34 @@ from indextts.utils.arch_util import AttentionBlock
 from indextts.utils.typical_sampling import TypicalLogitsWarper
 
 
+ATTN_BACKENDS = ("eager", "sdpa", "flash_attention_2")
+
+
+def resolve_attn_backend(attn_backend="auto", device="cpu", dtype=None):
+    """
+    Attention implementation of the GPT-2 stack (``config._attn_implementation``).
+        auto: flash_attention_2 on CUDA in fp16/bf16 when flash-attn is installed, else sdpa, else eager.
+    An explicitly requested backend that is not available falls back to the automatic choice.
+    """
+    device_type = torch.device(device).type
+    has_sdpa = hasattr(F, "scaled_dot_product_attention")
+    try:
+        from transformers.utils import is_flash_attn_2_available
+        has_flash = is_flash_attn_2_available()
+    except ImportError:
+        has_flash = False
+    has_flash = has_flash and device_type == "cuda" and dtype in (torch.float16, torch.bfloat16)
+    if attn_backend in (None, "auto"):
+        return "flash_attention_2" if has_flash else "sdpa" if has_sdpa else "eager"
+    if attn_backend not in ATTN_BACKENDS:
+        raise ValueError(f"attn_backend must be one of {('auto',) + ATTN_BACKENDS}, got {attn_backend!r}")
+    if (attn_backend == "flash_attention_2" and not has_flash) or (attn_backend == "sdpa" and not has_sdpa):
+        fallback = resolve_attn_backend("auto", device, dtype)
+        print(f">> GPT attention backend {attn_backend} is not available on {device} ({dtype}), using {fallback}")
+        return fallback
+    return attn_backend
+
+
 def null_position_embeddings(range, dim):
     return torch.zeros((range.shape[0], range.shape[1], dim), device=range.device)
 
@@ -57,6 +87,9 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
         self.model_parallel = False
         self.device_map = None
         self.cached_mel_emb = None
+        # KV state of the conditioning prefix, which is then not part of `cached_mel_emb`
+        self.cached_prefix_kv = None
+        self.cached_prefix_len = 0
 
     def parallelize(self, device_map=None):
         self.device_map = (
@@ -87,6 +120,25 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
     def store_mel_emb(self, mel_emb):
         self.cached_mel_emb = mel_emb
 
+    def store_prefix_kv(self, prefix_kv):
+        """
+        ``prefix_kv``: per layer (key, value) of the conditioning prefix, batch size 1, or None.
+        The input ids still span the prefix, only the positions after it are embedded and prefilled.
+        """
+        self.cached_prefix_kv = prefix_kv
+        self.cached_prefix_len = prefix_kv[0][0].shape[2] if prefix_kv is not None else 0
+
+    def _prefix_past_key_values(self, past_key_values, batch_size):
+        prefix_kv = tuple(
+            (k.expand(batch_size, -1, -1, -1), v.expand(batch_size, -1, -1, -1)) for k, v in self.cached_prefix_kv
+        )
+        if past_key_values is None:
+            return prefix_kv
+        # an empty `Cache` created by `generate`
+        for layer_idx, (k, v) in enumerate(prefix_kv):
+            past_key_values.update(k, v, layer_idx)
+        return past_key_values
+
     def prepare_inputs_for_generation(self, input_ids, past_key_values=None, **kwargs):
         token_type_ids = kwargs.get("token_type_ids", None)  # usually None
         if not self.kv_cache:
@@ -141,7 +193,7 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
             return_dict if return_dict is not None else self.config.use_return_dict
         )
         # Create embedding
-        mel_len = self.cached_mel_emb.shape[1]
+        mel_len = self.cached_prefix_len + self.cached_mel_emb.shape[1]
         if input_ids.shape[1] != 1:
             text_inputs = input_ids[:, mel_len:]
             text_emb = self.embeddings(text_inputs)
@@ -153,6 +205,11 @@ class GPT2InferenceModel(GPT2PreTrainedModel):
             else:  # this outcome only occurs once per loop in most cases
                 mel_emb = self.cached_mel_emb
             emb = torch.cat([mel_emb, text_emb], dim=1)
+            if self.cached_prefix_kv is not None:
+                # the conditioning prefix is restored from its KV state instead of being prefilled
+                past_key_values = self._prefix_past_key_values(past_key_values, emb.shape[0])
+                if position_ids is not None:
+                    position_ids = position_ids[:, self.cached_prefix_len:]
         else:
             emb = self.embeddings(input_ids)
             emb = emb + self.text_pos_embedding.get_fixed_embedding(
@@ -307,7 +364,8 @@ class UnifiedVoice(nn.Module):
                  start_text_token=0, stop_text_token=1, number_mel_codes=8194, start_mel_token=8192, stop_mel_token=8193,
                  train_solo_embeddings=False, use_mel_codes_as_input=True,
                  checkpointing=True, types=1,
-                 condition_num_latent=32, condition_type="perceiver", condition_module=None, emo_condition_module=None):
+                 condition_num_latent=32, condition_type="perceiver", condition_module=None, emo_condition_module=None,
+                 attn_backend="auto"):
         """
         Args:
             layers: Number of layers in transformer stack.
@@ -327,6 +385,8 @@ class UnifiedVoice(nn.Module):
             use_mel_codes_as_input:
             checkpointing:
             condition_type: perceiver, gst or default encoder
+            attn_backend: attention implementation of the GPT-2 stack: auto, eager, sdpa or flash_attention_2.
+                Resolved for fp32/CPU here, call `set_attn_backend` again once the model is on its device/dtype.
         """
         super().__init__()
         self.number_text_tokens = number_text_tokens
@@ -409,7 +469,29 @@ class UnifiedVoice(nn.Module):
         for module in embeddings:
             module.weight.data.normal_(mean=0.0, std=.02)
 
-    def post_init_gpt2_config(self, use_deepspeed=False, kv_cache=False, half=False):
+        self.attn_backend = None
+        self.set_attn_backend(attn_backend)
+        self.prefix_cache = None
+        self.prefix_cache_size = 0
+
+    def set_attn_backend(self, attn_backend="auto", device="cpu", dtype=None):
+        """
+        Select the attention implementation of the GPT-2 stack for ``device`` and ``dtype`` (see
+        `resolve_attn_backend`). Transformers reads it at every forward, so it can change after loading.
+        Returns the selected backend.
+        """
+        self.attn_backend = resolve_attn_backend(attn_backend, device, dtype)
+        self.gpt.config._attn_implementation = self.attn_backend
+        self.gpt._attn_implementation = self.attn_backend
+        if getattr(self, "inference_model", None) is not None:
+            self.inference_model.config._attn_implementation = self.attn_backend
+        return self.attn_backend
+
+    def post_init_gpt2_config(self, use_deepspeed=False, kv_cache=False, half=False, prefix_cache_size=16):
+        """
+        ``prefix_cache_size``: number of conditioning prefixes (speaker/emotion) whose KV state is kept and reused
+        by `inference_speech` across segments and requests, 0 to disable. Not used with DeepSpeed.
+        """
         seq_length = self.max_mel_tokens + self.max_text_tokens + 2
         gpt_config = GPT2Config(
             vocab_size=self.number_mel_codes,
@@ -421,6 +503,7 @@ class UnifiedVoice(nn.Module):
             gradient_checkpointing=False,
             use_cache=True,
         )
+        gpt_config._attn_implementation = self.attn_backend
         self.inference_model = GPT2InferenceModel(
             gpt_config,
             self.gpt,
@@ -449,6 +532,32 @@ class UnifiedVoice(nn.Module):
 
         # self.inference_model = PrunedGPT2InferenceModel(gpt_config, self.gpt, self.mel_pos_embedding, self.mel_embedding, self.final_norm, self.mel_head)
         self.gpt.wte = self.mel_embedding
+        # DeepSpeed kernel injection replaces the transformer, its cache layout is not ours to fill
+        self.prefix_cache_size = 0 if use_deepspeed and torch.cuda.is_available() else prefix_cache_size
+        self.prefix_cache = OrderedDict() if self.prefix_cache_size > 0 else None
+
+    def get_prefix_kv(self, conds_latent):
+        """
+        KV state of the GPT on the conditioning prefix ``conds_latent`` (1, P, dim), from an LRU cache keyed by the
+        content of the prefix. The GPT has no absolute position embedding (text/mel positions are added to the
+        input embeddings), so the prefix state does not depend on what follows it.
+        """
+        digest = hashlib.sha1(conds_latent.detach().float().cpu().numpy().tobytes()).hexdigest()
+        key = (digest, tuple(conds_latent.shape), str(conds_latent.dtype), str(conds_latent.device),
+               torch.is_autocast_enabled())
+        if key in self.prefix_cache:
+            self.prefix_cache.move_to_end(key)
+            return self.prefix_cache[key]
+        with torch.no_grad():
+            output = self.gpt(inputs_embeds=conds_latent, use_cache=True, return_dict=True)
+        prefix_kv = output.past_key_values
+        if hasattr(prefix_kv, "to_legacy_cache"):
+            prefix_kv = prefix_kv.to_legacy_cache()
+        prefix_kv = tuple((k, v) for k, v in prefix_kv)
+        self.prefix_cache[key] = prefix_kv
+        while len(self.prefix_cache) > self.prefix_cache_size:
+            self.prefix_cache.popitem(last=False)
+        return prefix_kv
 
     def build_aligned_inputs_and_targets(self, input, start_token, stop_token):
         inp = F.pad(input, (1, 0), value=start_token)
@@ -595,10 +704,80 @@ class UnifiedVoice(nn.Module):
         text_logits, mel_logits = self.get_logits(conds, text_emb, self.text_head, mel_emb, self.mel_head, get_attns=False, return_latent=True)
         return mel_logits[:, :-2]  # Despite the name, these are not logits. Strip off the two tokens added by this forward pass.
 
+    def forward_latent(self, speech_conditioning_latent, text_inputs, text_lengths, mel_codes, mel_codes_lengths,
+                       emo_vec, use_speed=None):
+        """
+        Batched inference variant of `forward()` returning the GPT latents of the mel codes.
+
+        Each row is laid out as [pad][cond][text][mel][pad]: the conditioning and text are left padded
+        (masked out by the attention mask) and the mel codes are right padded, so every valid position sees
+        exactly the same context as an unbatched `forward()` call.
+
+        speech_conditioning_latent: (b, c, dim) or (1, c, dim), the output of `get_conditioning()`
+        text_inputs: (b, L), padded text tokens
+        text_lengths: (b,)
+        mel_codes: (b, M), padded mel codes without stop token
+        mel_codes_lengths: (b,)
+        emo_vec: (b, dim) or (1, dim)
+        Returns:
+            latent: (b, max(mel_codes_lengths), dim), positions beyond `mel_codes_lengths` are padding.
+        """
+        b = text_inputs.size(0)
+        device = text_inputs.device
+        if speech_conditioning_latent.size(0) != b:
+            speech_conditioning_latent = speech_conditioning_latent.expand(b, -1, -1)
+        if emo_vec.size(0) != b:
+            emo_vec = emo_vec.expand(b, -1)
+        if use_speed is None:
+            use_speed = torch.zeros(b, dtype=torch.long, device=device)
+        duration_emb = self.speed_emb(torch.zeros_like(use_speed))
+        duration_emb_half = self.speed_emb(torch.ones_like(use_speed))
+        conds = torch.cat((speech_conditioning_latent + emo_vec.unsqueeze(1), duration_emb_half.unsqueeze(1),
+                           duration_emb.unsqueeze(1)), 1)
+
+        text_lengths = text_lengths.tolist()
+        mel_codes_lengths = mel_codes_lengths.tolist()
+        # +2 for the start and stop tokens
+        max_text_len = max(text_lengths) + 2
+        max_mel_len = max(mel_codes_lengths) + 2
+        embs = []
+        attention_masks = []
+        for i in range(b):
+            text_input = F.pad(text_inputs[i, :text_lengths[i]], (1, 0), value=self.start_text_token)
+            text_input = F.pad(text_input, (0, 1), value=self.stop_text_token)
+            text_emb = self.text_embedding(text_input) + \
+                self.text_pos_embedding.emb(torch.arange(text_input.size(0), device=device))
+            mel_input = F.pad(mel_codes[i, :mel_codes_lengths[i]], (1, 0), value=self.start_mel_token)
+            mel_input = F.pad(mel_input, (0, 1), value=self.stop_mel_token)
+            mel_emb = self.mel_embedding(mel_input) + \
+                self.mel_pos_embedding.emb(torch.arange(mel_input.size(0), device=device))
+            left_pad = max_text_len - text_input.size(0)
+            right_pad = max_mel_len - mel_input.size(0)
+            emb = torch.cat([
+                torch.zeros((left_pad, text_emb.size(-1)), dtype=text_emb.dtype, device=device),
+                conds[i].to(text_emb.dtype),
+                text_emb,
+                mel_emb,
+                torch.zeros((right_pad, mel_emb.size(-1)), dtype=mel_emb.dtype, device=device),
+            ])
+            attention_mask = torch.ones(emb.size(0), dtype=torch.long, device=device)
+            attention_mask[:left_pad] = 0
+            embs.append(emb)
+            attention_masks.append(attention_mask)
+        emb = torch.stack(embs, dim=0)
+        attention_mask = torch.stack(attention_masks, dim=0)
+
+        gpt_out = self.gpt(inputs_embeds=emb, attention_mask=attention_mask, return_dict=True)
+        offset = conds.size(1) + max_text_len
+        enc = self.final_norm(gpt_out.last_hidden_state[:, offset:])
+        # same as `forward()`: strip off the latents of the last two mel inputs
+        return enc[:, :max_mel_len - 2]
+
     def prepare_gpt_inputs(
         self,
         conditional_latents: torch.Tensor,
         text_inputs: torch.Tensor,
+        cond_first: bool = False,
     ):
         
         """
@@ -606,6 +785,9 @@ class UnifiedVoice(nn.Module):
         Args:
             conds_latent: (b, 32, dim) audio conditioning embedding by `get_conditioning()`
             text_inputs: (b, L)
+            cond_first: pad padded rows as [cond][pad][text] instead of [pad][cond][text], so that the
+                conditioning is a common prefix of all rows (for the prefix KV cache). Equivalent, since the
+                padding is masked and the GPT has no absolute position embedding.
         Returns:
             input_ids: (b, s+1) the input ids for the GPT2InferenceModel.generate()
             inputs_embeds: (b, s+1, dim) the input embeddings for the GPT2InferenceModel.forward()
@@ -638,8 +820,9 @@ class UnifiedVoice(nn.Module):
             # pad left of [cond][text] -> [pad][cond][text]
             if padding > 0:
                 pad = torch.zeros((padding, conditional_latents.size(-1)), dtype=text_emb.dtype, device=device) # [p, dim]
-                conds_text_emb.insert(0, pad)
-                attention_mask[:padding] = 0
+                pad_start = conditional_latents.shape[1] if cond_first else 0
+                conds_text_emb.insert(1 if cond_first else 0, pad)
+                attention_mask[pad_start:pad_start + padding] = 0
             mel_emb = torch.cat(conds_text_emb) #[s, dim]
             assert mel_emb.shape[0] == target_len, f"mel_emb.shape: {mel_emb.shape}, target_len: {target_len}"
             batched_mel_emb.append(mel_emb)
@@ -690,12 +873,21 @@ class UnifiedVoice(nn.Module):
         else:
             print('Use the specified emotion vector')
 
-        tmp = torch.zeros(text_inputs.size(0)).to(text_inputs.device)
+        # the conditioning is shared by all rows of a batch, `prepare_gpt_inputs` broadcasts it
+        tmp = torch.zeros(speech_conditioning_latent.size(0)).to(text_inputs.device)
         duration_emb =  self.speed_emb(torch.zeros_like(tmp).long())
         duration_emb_half = self.speed_emb(torch.ones_like(tmp).long())
         conds_latent = torch.cat((speech_conditioning_latent + emo_vec.unsqueeze(1), duration_emb_half.unsqueeze(1), duration_emb.unsqueeze(1)), 1)
-        input_ids, inputs_embeds, attention_mask = self.prepare_gpt_inputs(conds_latent, text_inputs)
+        prefix_kv = None
+        if self.prefix_cache is not None and conds_latent.shape[0] == 1:
+            prefix_kv = self.get_prefix_kv(conds_latent)
+        input_ids, inputs_embeds, attention_mask = self.prepare_gpt_inputs(conds_latent, text_inputs,
+                                                                           cond_first=prefix_kv is not None)
+        if prefix_kv is not None:
+            # only [pad][text][start_mel] is prefilled, the conditioning comes from the cached KV state
+            inputs_embeds = inputs_embeds[:, conds_latent.shape[1]:]
         self.inference_model.store_mel_emb(inputs_embeds)
+        self.inference_model.store_prefix_kv(prefix_kv)
         if input_tokens is None:
             inputs = input_ids
         else:
@@ -713,7 +905,7 @@ class UnifiedVoice(nn.Module):
             inputs = torch.cat([input_ids, input_tokens], dim=1)
             attention_mask = F.pad(attention_mask, (0, input_tokens.shape[1]), value=1)
         trunc_index = inputs.shape[1]
-        logits_processor = LogitsProcessorList()
+        logits_processor = LogitsProcessorList(hf_generate_kwargs.pop("logits_processor", None) or [])
         if typical_sampling:
             # employ custom typical sampling
             if not (typical_mass > 0.0 and typical_mass < 1.0):
@@ -1968,6 +1968,8 @@ class GenerationMixin:
         self._validate_model_class()
         tokenizer = kwargs.pop("tokenizer", None)  # Pull this out first, we only use it for stopping criteria
         assistant_tokenizer = kwargs.pop("assistant_tokenizer", None)  # only used for assisted generation
+        # one torch.Generator per batch item: the sampled tokens of an item do not depend on the rest of the batch
+        sampling_generators = kwargs.pop("sampling_generators", None)
 
         generation_config, model_kwargs = self._prepare_generation_config(generation_config, **kwargs)
         self._validate_model_kwargs(model_kwargs.copy())
@@ -2220,6 +2222,7 @@ class GenerationMixin:
                 generation_config=generation_config,
                 synced_gpus=synced_gpus,
                 streamer=streamer,
+                sampling_generators=sampling_generators,
                 **model_kwargs,
             )
 
@@ -2251,6 +2254,7 @@ class GenerationMixin:
                 stopping_criteria=prepared_stopping_criteria,
                 generation_config=generation_config,
                 synced_gpus=synced_gpus,
+                sampling_generators=sampling_generators,
                 **model_kwargs,
             )
 
@@ -3128,6 +3132,7 @@ class GenerationMixin:
         generation_config: GenerationConfig,
         synced_gpus: bool,
         streamer: Optional["BaseStreamer"],
+        sampling_generators: Optional[List[torch.Generator]] = None,
         **model_kwargs,
     ) -> Union[GenerateNonBeamOutput, torch.LongTensor]:
         r"""
@@ -3247,7 +3252,7 @@ class GenerationMixin:
             if do_sample:
                 probs = nn.functional.softmax(next_token_scores, dim=-1)
                 # TODO (joao): this OP throws "skipping cudagraphs due to ['incompatible ops']", find solution
-                next_tokens = torch.multinomial(probs, num_samples=1).squeeze(1)
+                next_tokens = _multinomial(probs, 1, sampling_generators).squeeze(1)
             else:
                 next_tokens = torch.argmax(next_token_scores, dim=-1)
 
@@ -3330,6 +3335,7 @@ class GenerationMixin:
         stopping_criteria: StoppingCriteriaList,
         generation_config: GenerationConfig,
         synced_gpus: bool,
+        sampling_generators: Optional[List[torch.Generator]] = None,
         **model_kwargs,
     ) -> Union[GenerateBeamOutput, torch.LongTensor]:
         r"""
@@ -3512,7 +3518,7 @@ class GenerationMixin:
                 # import time
                 # start = time.time()
                 probs = nn.functional.softmax(next_token_scores, dim=-1)
-                next_tokens = torch.multinomial(probs, num_samples=n_tokens_to_keep)
+                next_tokens = _multinomial(probs, n_tokens_to_keep, sampling_generators)
                 next_token_scores = torch.gather(next_token_scores, -1, next_tokens)
                 next_token_scores, _indices = torch.sort(next_token_scores, descending=True, dim=1)
                 next_tokens = torch.gather(next_tokens, -1, _indices)
@@ -4405,6 +4411,20 @@ class GenerationMixin:
             return input_ids
 
 
+def _multinomial(probs, num_samples, generators=None):
+    """
+    `torch.multinomial`, drawing the rows of each batch item from its own generator when `generators` (one per
+    batch item, the rows of an item being contiguous) is given.
+    """
+    if generators is None:
+        return torch.multinomial(probs, num_samples=num_samples)
+    rows = probs.size(0) // len(generators)
+    return torch.cat([
+        torch.multinomial(probs[i * rows:(i + 1) * rows], num_samples=num_samples, generator=generator)
+        for i, generator in enumerate(generators)
+    ])
+
+
 def _speculative_sampling(
     candidate_input_ids,
     candidate_logits,
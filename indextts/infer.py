@@ -97,7 +97,9 @@ class IndexTTS:
 
             self.gpt.post_init_gpt2_config(use_deepspeed=use_deepspeed, kv_cache=True, half=True)
         else:
-            self.gpt.post_init_gpt2_config(use_deepspeed=False, kv_cache=False, half=False)
+            # KV cache in fp32 as well: without it every decode step re-runs the whole cond+text+mel prefix
+            # (quadratic in the output length), see benchmarks/bench_kv_cache.py
+            self.gpt.post_init_gpt2_config(use_deepspeed=False, kv_cache=True, half=False)
 
         if self.use_cuda_kernel:
             # preload the CUDA kernel for BigVGAN
@@ -136,56 +138,28 @@ class IndexTTS:
         Shrink special tokens (silent_token and stop_mel_token) in codes
         codes: [B, T]
         """
-        code_lens = []
-        codes_list = []
-        device = codes.device
-        dtype = codes.dtype
-        isfix = False
-        for i in range(0, codes.shape[0]):
-            code = codes[i]
-            if not torch.any(code == self.stop_mel_token).item():
-                len_ = code.size(0)
-            else:
-                stop_mel_idx = (code == self.stop_mel_token).nonzero(as_tuple=False)
-                len_ = stop_mel_idx[0].item() if len(stop_mel_idx) > 0 else code.size(0)
-
-            count = torch.sum(code == silent_token).item()
-            if count > max_consecutive:
-                # code = code.cpu().tolist()
-                ncode_idx = []
-                n = 0
-                for k in range(len_):
-                    assert code[
-                               k] != self.stop_mel_token, f"stop_mel_token {self.stop_mel_token} should be shrinked here"
-                    if code[k] != silent_token:
-                        ncode_idx.append(k)
-                        n = 0
-                    elif code[k] == silent_token and n < 10:
-                        ncode_idx.append(k)
-                        n += 1
-                    # if (k == 0 and code[k] == 52) or (code[k] == 52 and code[k-1] == 52):
-                    #    n += 1
-                # new code
-                len_ = len(ncode_idx)
-                codes_list.append(code[ncode_idx])
-                isfix = True
-            else:
-                # shrink to len_
-                codes_list.append(code[:len_])
-            code_lens.append(len_)
-        if isfix:
-            if len(codes_list) > 1:
-                codes = pad_sequence(codes_list, batch_first=True, padding_value=self.stop_mel_token)
-            else:
-                codes = codes_list[0].unsqueeze(0)
-        else:
-            # unchanged
-            pass
+        is_stop = codes == self.stop_mel_token
+        # argmax returns the first maximal index, i.e. the first stop token
+        code_lens = torch.where(is_stop.any(dim=1), is_stop.int().argmax(dim=1), codes.size(1)).long()
+        positions = torch.arange(codes.size(1), device=codes.device)
+        valid = positions[None, :] < code_lens[:, None]
+        is_silent = (codes == silent_token) & valid
+        # 连续静音段内的序号: 当前位置 - 该位置之前最后一个非静音 token 的位置 - 1
+        last_non_silent = torch.where(is_silent, -1, positions[None, :]).cummax(dim=1).values
+        run_index = positions[None, :] - last_non_silent - 1
+        keep = valid & (~is_silent | (run_index < 10))
+        # 静音 token 总数不超过 max_consecutive 的行保持不变
+        isfix = (codes == silent_token).sum(dim=1) > max_consecutive
+        keep = torch.where(isfix[:, None], keep, valid)
+        code_lens = keep.sum(dim=1)
+        if isfix.any():
+            # stable sort moves the kept tokens to the front, in order
+            order = torch.argsort((~keep).to(torch.int8), dim=1, stable=True)
+            codes = codes.gather(1, order)
         # clip codes to max length
-        max_len = max(code_lens)
-        if max_len < codes.shape[1]:
-            codes = codes[:, :max_len]
-        code_lens = torch.tensor(code_lens, dtype=torch.long, device=device)
+        max_len = int(code_lens.max()) if codes.size(0) > 0 else 0
+        codes = codes[:, :max_len]
+        codes = codes.masked_fill(positions[None, :max_len] >= code_lens[:, None], self.stop_mel_token)
         return codes, code_lens
 
     def bucket_segments(self, segments, bucket_max_size=4) -> List[List[Dict]]:
@@ -2,9 +2,14 @@ import os
 from subprocess import CalledProcessError
 
 os.environ['HF_HUB_CACHE'] = './checkpoints/hf_cache'
+import contextlib
 import json
+import math
+import queue
 import re
+import threading
 import time
+from typing import Dict, Iterator, List
 import librosa
 import torch
 import torchaudio
@@ -19,15 +24,21 @@ from omegaconf import OmegaConf
 
 from indextts.gpt.model_v2 import UnifiedVoice
 from indextts.utils.maskgct_utils import build_semantic_model, build_semantic_codec
+from indextts.utils.cancellation import CancellationStoppingCriteria, SynthesisCancelled
 from indextts.utils.checkpoint import load_checkpoint
+from indextts.utils.common import resolve_autocast_dtype
 from indextts.utils.front import TextNormalizer, TextTokenizer
+from indextts.utils.latency import LatencyPlanner
+from indextts.utils.mel_budget import DegenerateDecodeLogitsProcessor, MelBudgetLogitsProcessor, MelTokenBudget
+from indextts.utils.prompt_audio import PromptAudioCache
+from indextts.utils.segment_cache import SegmentAudioCache, derive_seed, tensor_digest
 
 from indextts.s2mel.modules.commons import load_checkpoint2, MyModel
 from indextts.s2mel.modules.bigvgan import bigvgan
 from indextts.s2mel.modules.campplus.DTDNN import CAMPPlus
-from indextts.s2mel.modules.audio import mel_spectrogram
+from indextts.s2mel.modules.audio import mel_spectrogram, select_voiced_window
 
-from transformers import AutoTokenizer
+from transformers import AutoTokenizer, StoppingCriteriaList
 from modelscope import AutoModelForCausalLM
 from huggingface_hub import hf_hub_download
 import safetensors
@@ -38,7 +49,9 @@ import torch.nn.functional as F
 class IndexTTS2:
     def __init__(
             self, cfg_path="checkpoints/config.yaml", model_dir="checkpoints", use_fp16=False, device=None,
-            use_cuda_kernel=None,use_deepspeed=False
+            use_cuda_kernel=None,use_deepspeed=False, s2mel_precision=None, bigvgan_tile_frames=None,
+            use_polyphase_activation=False, max_prompt_frames=None, prepare_prompts=False, attn_backend="auto",
+            segment_cache_dir=None, segment_cache_max_bytes=None, mel_budget_slack=2.0
     ):
         """
         Args:
@@ -48,6 +61,31 @@ class IndexTTS2:
             device (str): device to use (e.g., 'cuda:0', 'cpu'). If None, it will be set automatically based on the availability of CUDA or MPS.
             use_cuda_kernel (None | bool): whether to use BigVGan custom fused activation CUDA kernel, only for CUDA device.
             use_deepspeed (bool): whether to use DeepSpeed or not.
+            s2mel_precision (None | str): autocast precision of s2mel (CFM) and BigVGAN: "fp32", "fp16" or "bf16".
+                None: fp32. bf16 is also available on CPUs with native bf16 support.
+                See `benchmarks/bench_precision.py` for the numerical drift and the speed-up.
+            bigvgan_tile_frames (None | int): vocode mel spectrograms in tiles of this many frames (with receptive field
+                overlap) to bound the BigVGAN peak memory on long segments. None: vocode whole segments.
+            use_polyphase_activation (bool): use the polyphase BigVGAN anti-aliased activations (same output, faster on CPU).
+                Ignored when the CUDA kernel is used.
+            max_prompt_frames (None | int): longest speaker prompt (mel frames, 22050/256 Hz) prepended to every
+                CFM call. Longer reference audios are trimmed, once per speaker, to the window with the most voice
+                activity, which bounds the s2mel sequence length. None: use the whole reference (up to 15s).
+                See `benchmarks/bench_prompt.py` for the s2mel time vs. prompt length.
+            prepare_prompts (bool): trim the leading/trailing silence of the speaker and emotion reference audios and
+                normalize their loudness when loading them (see `indextts/utils/prompt_audio.py`). The prepared audios
+                are cached. Not needed for audios already prepared at ingest (e.g. by the web API).
+            attn_backend (str): attention implementation of the GPT: "auto", "eager", "sdpa" or "flash_attention_2".
+                auto: flash_attention_2 on CUDA with fp16 when flash-attn is installed, else sdpa.
+                See `benchmarks/bench_attn.py` for the prefill/decode time of each backend.
+            segment_cache_dir (None | str): directory of the on-disk cache of synthesized segments. ``infer`` calls
+                with a ``seed`` then only synthesize the segments not rendered before with the same voice, emotion
+                and settings, e.g. when re-rendering an edited document. None: no segment cache.
+            segment_cache_max_bytes (None | int): size limit of the segment cache, least recently used entries go first.
+            mel_budget_slack (None | float): the GPT generation of a segment stops after this many times the number of
+                codes predicted from its text length and language (``indextts/utils/mel_budget.py``), within
+                ``max_mel_tokens``. None: every segment may use the whole ``max_mel_tokens``.
+                Generations stuck in a repetition loop are aborted and the loop is cut in both cases.
         """
         if device is not None:
             self.device = device
@@ -74,6 +112,8 @@ class IndexTTS2:
         self.cfg = OmegaConf.load(cfg_path)
         self.model_dir = model_dir
         self.dtype = torch.float16 if self.use_fp16 else None
+        # s2mel/BigVGAN 权重保持 fp32, 通过 autocast 降低计算精度
+        self.s2mel_dtype = resolve_autocast_dtype(s2mel_precision, self.device)
         self.stop_mel_token = self.cfg.gpt.stop_mel_token
 
         self.qwen_emo = QwenEmotion(os.path.join(self.model_dir, self.cfg.qwen_emo_path))
@@ -96,6 +136,9 @@ class IndexTTS2:
                 print(f">> Failed to load DeepSpeed. Falling back to normal inference. Error: {e}")
 
         self.gpt.post_init_gpt2_config(use_deepspeed=use_deepspeed, kv_cache=True, half=self.use_fp16)
+        self.gpt.set_attn_backend(attn_backend, self.device, self.dtype)
+        print(f">> GPT attention backend: {self.gpt.attn_backend} (requested: {attn_backend}, "
+              f"dtype: {self.dtype or torch.float32})")
 
         if self.use_cuda_kernel:
             # preload the CUDA kernel for BigVGAN
@@ -109,8 +152,10 @@ class IndexTTS2:
                 self.use_cuda_kernel = False
 
         self.extract_features = SeamlessM4TFeatureExtractor.from_pretrained("facebook/w2v-bert-2.0")
+        # s2mel/GPT 使用 w2v-bert 第 17 层的输出
+        self.semantic_layer = 17
         self.semantic_model, self.semantic_mean, self.semantic_std = build_semantic_model(
-            os.path.join(self.model_dir, self.cfg.w2v_stat))
+            os.path.join(self.model_dir, self.cfg.w2v_stat), output_layer=self.semantic_layer)
         self.semantic_model = self.semantic_model.to(self.device)
         self.semantic_model.eval()
         self.semantic_mean = self.semantic_mean.to(self.device)
@@ -149,10 +194,14 @@ class IndexTTS2:
         print(">> campplus_model weights restored from:", campplus_ckpt_path)
 
         bigvgan_name = self.cfg.vocoder.name
-        self.bigvgan = bigvgan.BigVGAN.from_pretrained(bigvgan_name, use_cuda_kernel=self.use_cuda_kernel)
+        self.bigvgan = bigvgan.BigVGAN.from_pretrained(bigvgan_name, use_cuda_kernel=self.use_cuda_kernel,
+                                                       use_polyphase_activation=use_polyphase_activation)
         self.bigvgan = self.bigvgan.to(self.device)
         self.bigvgan.remove_weight_norm()
         self.bigvgan.eval()
+        self.bigvgan_tile_frames = bigvgan_tile_frames
+        self.max_prompt_frames = max_prompt_frames
+        self.prompt_audio_cache = PromptAudioCache() if prepare_prompts else None
         print(">> bigvgan weights restored from:", bigvgan_name)
 
         self.bpe_path = os.path.join(self.model_dir, self.cfg.dataset["bpe_model"])
@@ -195,74 +244,64 @@ class IndexTTS2:
 
         # 进度引用显示（可选）
         self.gr_progress = None
+        # 延迟预算模式: 根据已完成请求的各阶段耗时估计本机的开销
+        self.latency_planner = LatencyPlanner()
+        self.segment_cache = SegmentAudioCache(segment_cache_dir, segment_cache_max_bytes) if segment_cache_dir else None
+        # 按文本长度和语言预测每段的 max_mel_tokens，由实际生成长度在线校准
+        self.mel_budget = MelTokenBudget.from_tokenizer(self.tokenizer, slack=mel_budget_slack) \
+            if mel_budget_slack else None
         self.model_version = self.cfg.version if hasattr(self.cfg, "version") else None
 
     @torch.no_grad()
     def get_emb(self, input_features, attention_mask):
+        # the encoder is truncated after `self.semantic_layer`, its last hidden state is hidden_states[17]
         vq_emb = self.semantic_model(
             input_features=input_features,
             attention_mask=attention_mask,
-            output_hidden_states=True,
         )
-        feat = vq_emb.hidden_states[17]  # (B, T, C)
+        feat = vq_emb.last_hidden_state  # (B, T, C)
         feat = (feat - self.semantic_mean) / self.semantic_std
         return feat
 
+    @torch.no_grad()
+    def get_embs(self, audios_16k: List[torch.Tensor]) -> List[torch.Tensor]:
+        """
+        Batched ``get_emb`` for several 16kHz prompts, e.g. the speaker and the emotion prompt.
+        Returns one (1, T_i, C) feature per audio, without the batch padding.
+        """
+        inputs = self.extract_features([audio.reshape(-1).cpu().numpy() for audio in audios_16k],
+                                       sampling_rate=16000, return_tensors="pt", padding=True)
+        input_features = inputs["input_features"].to(self.device)
+        attention_mask = inputs["attention_mask"].to(self.device)
+        feats = self.get_emb(input_features, attention_mask)
+        feat_lens = attention_mask.sum(dim=1).tolist()
+        return [feat[:feat_len].unsqueeze(0) for feat, feat_len in zip(feats, feat_lens)]
+
     def remove_long_silence(self, codes: torch.Tensor, silent_token=52, max_consecutive=30):
         """
         Shrink special tokens (silent_token and stop_mel_token) in codes
         codes: [B, T]
         """
-        code_lens = []
-        codes_list = []
-        device = codes.device
-        dtype = codes.dtype
-        isfix = False
-        for i in range(0, codes.shape[0]):
-            code = codes[i]
-            if not torch.any(code == self.stop_mel_token).item():
-                len_ = code.size(0)
-            else:
-                stop_mel_idx = (code == self.stop_mel_token).nonzero(as_tuple=False)
-                len_ = stop_mel_idx[0].item() if len(stop_mel_idx) > 0 else code.size(0)
-
-            count = torch.sum(code == silent_token).item()
-            if count > max_consecutive:
-                # code = code.cpu().tolist()
-                ncode_idx = []
-                n = 0
-                for k in range(len_):
-                    assert code[
-                               k] != self.stop_mel_token, f"stop_mel_token {self.stop_mel_token} should be shrinked here"
-                    if code[k] != silent_token:
-                        ncode_idx.append(k)
-                        n = 0
-                    elif code[k] == silent_token and n < 10:
-                        ncode_idx.append(k)
-                        n += 1
-                    # if (k == 0 and code[k] == 52) or (code[k] == 52 and code[k-1] == 52):
-                    #    n += 1
-                # new code
-                len_ = len(ncode_idx)
-                codes_list.append(code[ncode_idx])
-                isfix = True
-            else:
-                # shrink to len_
-                codes_list.append(code[:len_])
-            code_lens.append(len_)
-        if isfix:
-            if len(codes_list) > 1:
-                codes = pad_sequence(codes_list, batch_first=True, padding_value=self.stop_mel_token)
-            else:
-                codes = codes_list[0].unsqueeze(0)
-        else:
-            # unchanged
-            pass
+        code_lens = self._get_code_lens(codes)
+        positions = torch.arange(codes.size(1), device=codes.device)
+        valid = positions[None, :] < code_lens[:, None]
+        is_silent = (codes == silent_token) & valid
+        # 连续静音段内的序号: 当前位置 - 该位置之前最后一个非静音 token 的位置 - 1
+        last_non_silent = torch.where(is_silent, -1, positions[None, :]).cummax(dim=1).values
+        run_index = positions[None, :] - last_non_silent - 1
+        keep = valid & (~is_silent | (run_index < 10))
+        # 静音 token 总数不超过 max_consecutive 的行保持不变
+        isfix = (codes == silent_token).sum(dim=1) > max_consecutive
+        keep = torch.where(isfix[:, None], keep, valid)
+        code_lens = keep.sum(dim=1)
+        if isfix.any():
+            # stable sort moves the kept tokens to the front, in order
+            order = torch.argsort((~keep).to(torch.int8), dim=1, stable=True)
+            codes = codes.gather(1, order)
         # clip codes to max length
-        max_len = max(code_lens)
-        if max_len < codes.shape[1]:
-            codes = codes[:, :max_len]
-        code_lens = torch.tensor(code_lens, dtype=torch.long, device=device)
+        max_len = int(code_lens.max()) if codes.size(0) > 0 else 0
+        codes = codes[:, :max_len]
+        codes = codes.masked_fill(positions[None, :max_len] >= code_lens[:, None], self.stop_mel_token)
         return codes, code_lens
 
     def insert_interval_silence(self, wavs, sampling_rate=22050, interval_silence=200):
@@ -288,11 +327,19 @@ class IndexTTS2:
 
         return wavs_list
 
-    def _set_gr_progress(self, value, desc):
-        if self.gr_progress is not None:
-            self.gr_progress(value, desc=desc)
+    def _set_gr_progress(self, value, desc, progress_callback=None):
+        """
+        Report progress to the per-call ``progress_callback`` or, without one, to ``self.gr_progress`` (webui).
+        """
+        callback = progress_callback if progress_callback is not None else self.gr_progress
+        if callback is not None:
+            callback(value, desc=desc)
 
     def _load_and_cut_audio(self,audio_path,max_audio_length_seconds,verbose=False,sr=None):
+        if self.prompt_audio_cache is not None:
+            # 去除首尾静音并做响度归一化, 结果按文件缓存
+            sr = sr or 22050
+            return self.prompt_audio_cache.load(audio_path, sr, max_audio_length_seconds), sr
         if not sr:
             audio, sr = librosa.load(audio_path)
         else:
@@ -322,21 +369,15 @@ class IndexTTS2:
 
         return emo_vector
 
-    # 原始推理模式
-    def infer(self, spk_audio_prompt, text, output_path,
-              emo_audio_prompt=None, emo_alpha=1.0,
-              emo_vector=None,
-              use_emo_text=False, emo_text=None, use_random=False, interval_silence=200,
-              verbose=False, max_text_tokens_per_segment=120, **generation_kwargs):
-        print(">> starting inference...")
-        self._set_gr_progress(0, "starting inference...")
-        if verbose:
-            print(f"origin text:{text}, spk_audio_prompt:{spk_audio_prompt}, "
-                  f"emo_audio_prompt:{emo_audio_prompt}, emo_alpha:{emo_alpha}, "
-                  f"emo_vector:{emo_vector}, use_emo_text:{use_emo_text}, "
-                  f"emo_text:{emo_text}")
-        start_time = time.perf_counter()
-
+    @torch.no_grad()
+    def _prepare_conditions(self, spk_audio_prompt, text, emo_audio_prompt=None, emo_alpha=1.0, emo_vector=None,
+                            use_emo_text=False, emo_text=None, use_random=False, verbose=False, seed=None):
+        """
+        Prepare (and cache) the speaker and emotion conditionings shared by every segment of a request.
+        ``seed``: seed of the ``use_random`` emotion picks.
+        Returns a dict with ``spk_cond_emb``, ``emo_cond_emb``, ``style``, ``prompt_condition``, ``ref_mel``,
+        the effective ``emo_alpha`` and, when emotion vectors are used, ``weight_vector`` and ``emovec_mat``.
+        """
         if use_emo_text or emo_vector is not None:
             # we're using a text or emotion vector guidance; so we must remove
             # "emotion reference voice", to ensure we use correct emotion mixing!
@@ -369,7 +410,10 @@ class IndexTTS2:
             emo_alpha = 1.0
 
         # 如果参考音频改变了，才需要重新生成, 提升速度
-        if self.cache_spk_cond is None or self.cache_spk_audio_prompt != spk_audio_prompt:
+        spk_cache_miss = self.cache_spk_cond is None or self.cache_spk_audio_prompt != spk_audio_prompt
+        emo_cache_miss = self.cache_emo_cond is None or self.cache_emo_audio_prompt != emo_audio_prompt
+        emo_cond_emb = None
+        if spk_cache_miss:
             if self.cache_spk_cond is not None:
                 self.cache_spk_cond = None
                 self.cache_s2mel_style = None
@@ -380,12 +424,12 @@ class IndexTTS2:
             audio_22k = torchaudio.transforms.Resample(sr, 22050)(audio)
             audio_16k = torchaudio.transforms.Resample(sr, 16000)(audio)
 
-            inputs = self.extract_features(audio_16k, sampling_rate=16000, return_tensors="pt")
-            input_features = inputs["input_features"]
-            attention_mask = inputs["attention_mask"]
-            input_features = input_features.to(self.device)
-            attention_mask = attention_mask.to(self.device)
-            spk_cond_emb = self.get_emb(input_features, attention_mask)
+            if emo_cache_miss:
+                # 情感参考音频也需要重新提取时, 与说话人参考音频合并为一个 batch
+                emo_audio, _ = self._load_and_cut_audio(emo_audio_prompt, 15, verbose, sr=16000)
+                spk_cond_emb, emo_cond_emb = self.get_embs([audio_16k, emo_audio])
+            else:
+                spk_cond_emb, = self.get_embs([audio_16k])
 
             _, S_ref = self.semantic_codec.quantize(spk_cond_emb)
             ref_mel = self.mel_fn(audio_22k.to(spk_cond_emb.device).float())
@@ -401,6 +445,14 @@ class IndexTTS2:
                                                                      ylens=ref_target_lengths,
                                                                      n_quantizers=3,
                                                                      f0=None)[0]
+            if self.max_prompt_frames and ref_mel.size(-1) > self.max_prompt_frames:
+                # s2mel 只使用参考音频中语音最密集的一段, 与缓存一起按说话人只计算一次
+                start = select_voiced_window(ref_mel, self.max_prompt_frames)
+                end = start + self.max_prompt_frames
+                if verbose:
+                    print(f">> s2mel prompt trimmed from {ref_mel.size(-1)} to frames [{start}, {end})")
+                ref_mel = ref_mel[:, :, start:end]
+                prompt_condition = prompt_condition[:, start:end]
 
             self.cache_spk_cond = spk_cond_emb
             self.cache_s2mel_style = style
@@ -416,7 +468,8 @@ class IndexTTS2:
         if emo_vector is not None:
             weight_vector = torch.tensor(emo_vector).to(self.device)
             if use_random:
-                random_index = [random.randint(0, x - 1) for x in self.emo_num]
+                rng = random.Random(derive_seed(seed, "emotion")) if seed is not None else random
+                random_index = [rng.randint(0, x - 1) for x in self.emo_num]
             else:
                 random_index = [find_most_similar_cosine(style, tmp) for tmp in self.spk_matrix]
 
@@ -426,32 +479,825 @@ class IndexTTS2:
             emovec_mat = torch.sum(emovec_mat, 0)
             emovec_mat = emovec_mat.unsqueeze(0)
 
-        if self.cache_emo_cond is None or self.cache_emo_audio_prompt != emo_audio_prompt:
+        if emo_cache_miss:
             if self.cache_emo_cond is not None:
                 self.cache_emo_cond = None
                 torch.cuda.empty_cache()
-            emo_audio, _ = self._load_and_cut_audio(emo_audio_prompt,15,verbose,sr=16000)
-            emo_inputs = self.extract_features(emo_audio, sampling_rate=16000, return_tensors="pt")
-            emo_input_features = emo_inputs["input_features"]
-            emo_attention_mask = emo_inputs["attention_mask"]
-            emo_input_features = emo_input_features.to(self.device)
-            emo_attention_mask = emo_attention_mask.to(self.device)
-            emo_cond_emb = self.get_emb(emo_input_features, emo_attention_mask)
+            if emo_cond_emb is None:
+                emo_audio, _ = self._load_and_cut_audio(emo_audio_prompt,15,verbose,sr=16000)
+                emo_cond_emb, = self.get_embs([emo_audio])
 
             self.cache_emo_cond = emo_cond_emb
             self.cache_emo_audio_prompt = emo_audio_prompt
         else:
             emo_cond_emb = self.cache_emo_cond
 
-        self._set_gr_progress(0.1, "text processing...")
-        text_tokens_list = self.tokenizer.tokenize(text)
-        segments = self.tokenizer.split_segments(text_tokens_list, max_text_tokens_per_segment)
+
+        conds = {
+            "spk_cond_emb": spk_cond_emb,
+            "emo_cond_emb": emo_cond_emb,
+            "style": style,
+            "prompt_condition": prompt_condition,
+            "ref_mel": ref_mel,
+            "emo_alpha": emo_alpha,
+            "weight_vector": None,
+            "emovec_mat": None,
+        }
+        if emo_vector is not None:
+            conds["weight_vector"] = weight_vector
+            conds["emovec_mat"] = emovec_mat
+        return conds
+
+    def _get_emovec(self, conds):
+        spk_cond_emb = conds["spk_cond_emb"]
+        emo_cond_emb = conds["emo_cond_emb"]
+        device = spk_cond_emb.device
+        with torch.no_grad():
+            with torch.amp.autocast(device.type, enabled=self.dtype is not None, dtype=self.dtype):
+                emovec = self.gpt.merge_emovec(
+                    spk_cond_emb,
+                    emo_cond_emb,
+                    torch.tensor([spk_cond_emb.shape[-1]], device=device),
+                    torch.tensor([emo_cond_emb.shape[-1]], device=device),
+                    alpha=conds["emo_alpha"]
+                )
+                if conds["weight_vector"] is not None:
+                    emovec = conds["emovec_mat"] + (1 - torch.sum(conds["weight_vector"])) * emovec
+                    # emovec = emovec_mat
+        return emovec
+
+    def _get_code_lens(self, codes: torch.Tensor) -> torch.Tensor:
+        """
+        Number of codes before the first stop_mel_token of each row.
+        codes: [B, T]
+        """
+        is_stop = codes == self.stop_mel_token
+        # argmax returns the first maximal index, i.e. the first stop token
+        first_stop = is_stop.int().argmax(dim=1)
+        return torch.where(is_stop.any(dim=1), first_stop, codes.size(1)).long()
+
+    def _split_buckets_by_budget(self, buckets, max_mel_tokens, max_batch_mel_tokens, num_beams=1, calibrated=True):
+        """
+        Split the buckets whose GPT generation is predicted to exceed ``max_batch_mel_tokens``: rows (segments x
+        beams) times the longest text tokens + mel token budget of the bucket, i.e. the padded KV cache length.
+        The order of the segments is kept.
+        """
+        out_buckets = []
+        for bucket in buckets:
+            current, longest = [], 0
+            for item in bucket:
+                text_tokens = self.tokenizer.convert_tokens_to_ids(item["sent"])
+                budget = self.mel_budget.predict(text_tokens, max_mel_tokens, calibrated) if self.mel_budget is not None \
+                    else max_mel_tokens
+                length = len(text_tokens) + budget
+                if current and (len(current) + 1) * num_beams * max(longest, length) > max_batch_mel_tokens:
+                    out_buckets.append(current)
+                    current, longest = [], 0
+                current.append(item)
+                longest = max(longest, length)
+            if current:
+                out_buckets.append(current)
+        return out_buckets
+
+    def bucket_segments(self, segments, bucket_max_size=4) -> List[List[Dict]]:
+        """
+        Group the non-empty segments into buckets of at most ``bucket_max_size`` segments of similar token length,
+        for batched GPT generation. Each item is ``{"idx": position in segments, "sent": tokens, "len": length}``;
+        segments are sorted by length, a bucket is closed when the next segment is 1.5x its median length or it is
+        full, and single-segment buckets are merged into buckets with room left (or grouped together).
+        When there are at most ``bucket_max_size`` segments they form one bucket in their original order; with
+        ``bucket_max_size=1`` every segment gets its own bucket. Returns [] when every segment is empty.
+        """
+        outputs: List[Dict] = []
+        for idx, sent in enumerate(segments):
+            outputs.append({"idx": idx, "sent": sent, "len": len(sent)})
+
+        # 过滤掉空的segments
+        outputs = [o for o in outputs if o["len"] > 0]
+        if not outputs:
+            print(">> Warning: All segments are empty, returning empty bucket list")
+            return []
+
+        if len(outputs) > bucket_max_size:
+            # split segments into buckets by segment length
+            buckets: List[List[Dict]] = []
+            factor = 1.5
+            last_bucket = None
+            last_bucket_sent_len_median = 0
+
+            for sent in sorted(outputs, key=lambda x: x["len"]):
+                current_sent_len = sent["len"]
+                if last_bucket is None \
+                        or current_sent_len >= int(last_bucket_sent_len_median * factor) \
+                        or len(last_bucket) >= bucket_max_size:
+                    # new bucket
+                    buckets.append([sent])
+                    last_bucket = buckets[-1]
+                    last_bucket_sent_len_median = current_sent_len
+                else:
+                    # current bucket can hold more segments
+                    last_bucket.append(sent)  # sorted
+                    mid = len(last_bucket) // 2
+                    last_bucket_sent_len_median = last_bucket[mid]["len"]
+            last_bucket = None
+            # merge all buckets with size 1
+            out_buckets: List[List[Dict]] = []
+            only_ones: List[Dict] = []
+            for b in buckets:
+                if len(b) == 1:
+                    only_ones.append(b[0])
+                else:
+                    out_buckets.append(b)
+            if len(only_ones) > 0:
+                # merge into previous buckets if possible
+                for i in range(len(out_buckets)):
+                    b = out_buckets[i]
+                    if len(b) < bucket_max_size:
+                        b.append(only_ones.pop(0))
+                        if len(only_ones) == 0:
+                            break
+                # combined all remaining sized 1 buckets
+                if len(only_ones) > 0:
+                    out_buckets.extend(
+                        [only_ones[i:i + bucket_max_size] for i in range(0, len(only_ones), bucket_max_size)])
+            return out_buckets
+        return [outputs]
+
+    def pad_tokens_cat(self, tokens: List[torch.Tensor]) -> torch.Tensor:
+        """
+        Right pad text tokens with stop_text_token, `prepare_gpt_inputs` turns them into left padded inputs.
+        tokens: List[[1, N]] -> [B, max(N)]
+        """
+        if not tokens:
+            raise ValueError("pad_tokens_cat: tokens list is empty")
+        tokens = [t.squeeze(0) for t in tokens]
+        return pad_sequence(tokens, batch_first=True, padding_value=self.cfg.gpt.stop_text_token)
+
+    def _save_wav(self, wav, output_path, sampling_rate):
+        # save audio
+        wav = wav.cpu()  # to cpu
+        if output_path:
+            # 直接保存音频到指定路径中
+            if os.path.isfile(output_path):
+                os.remove(output_path)
+                print(">> remove old wav file:", output_path)
+            if os.path.dirname(output_path) != "":
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+            torchaudio.save(output_path, wav.type(torch.int16), sampling_rate)
+            print(">> wav file saved to:", output_path)
+            return output_path
+        else:
+            # 返回音频数据
+            wav_data = wav.type(torch.int16)
+            wav_data = wav_data.numpy().T
+            return (sampling_rate, wav_data)
+
+    def _prepare_text_tokens(self, text, max_text_tokens_per_segment=120, verbose=False) -> List[torch.Tensor]:
+        segments_tokens = list(self._iter_text_tokens(text, max_text_tokens_per_segment, verbose))
+        if verbose:
+            print("segments count:", len(segments_tokens))
+            print("max_text_tokens_per_segment:", max_text_tokens_per_segment)
+        return segments_tokens
+
+    def _iter_text_tokens(self, text, max_text_tokens_per_segment=120, verbose=False) -> Iterator[torch.Tensor]:
+        """
+        Yield the text tokens (1, L) of every segment, normalizing and tokenizing the text paragraph by paragraph
+        (``TextTokenizer.iter_segments``), so that synthesis can start before a long text is fully processed.
+        """
+        for sent in self.tokenizer.iter_segments(text, max_text_tokens_per_segment):
+            if verbose:
+                print(sent)
+            text_tokens = self.tokenizer.convert_tokens_to_ids(sent)
+            text_tokens = torch.tensor(text_tokens, dtype=torch.int32, device=self.device).unsqueeze(0)
+            if verbose:
+                print(text_tokens)
+                print(f"text_tokens shape: {text_tokens.shape}, text_tokens type: {text_tokens.dtype}")
+                # debug tokenizer
+                text_token_syms = self.tokenizer.convert_ids_to_tokens(text_tokens[0].tolist())
+                print("text_token_syms is same as segment tokens", text_token_syms == sent)
+            yield text_tokens
+
+    def _build_gpt_kwargs(self, generation_kwargs, cancel_token=None):
+        """
+        Turn the user ``generation_kwargs`` into the kwargs of ``UnifiedVoice.inference_speech``.
+        With a ``cancel_token``, the generation stops within a few decode steps once it is cancelled.
+        """
+        generation_kwargs = dict(generation_kwargs)
+        generation_kwargs.pop("do_sample", True)
+        top_p = generation_kwargs.pop("top_p", 0.8)
+        top_k = generation_kwargs.pop("top_k", 30)
+        temperature = generation_kwargs.pop("temperature", 0.8)
+        autoregressive_batch_size = 1
+        length_penalty = generation_kwargs.pop("length_penalty", 0.0)
+        num_beams = generation_kwargs.pop("num_beams", 3)
+        repetition_penalty = generation_kwargs.pop("repetition_penalty", 10.0)
+        max_mel_tokens = generation_kwargs.pop("max_mel_tokens", 1500)
+        if cancel_token is not None:
+            generation_kwargs["stopping_criteria"] = StoppingCriteriaList([CancellationStoppingCriteria(cancel_token)])
+        return dict(
+            do_sample=True,
+            top_p=top_p,
+            top_k=top_k,
+            temperature=temperature,
+            num_return_sequences=autoregressive_batch_size,
+            length_penalty=length_penalty,
+            num_beams=num_beams,
+            repetition_penalty=repetition_penalty,
+            max_generate_length=max_mel_tokens,
+            **generation_kwargs
+        )
+
+    def _decode_limits(self, segments_tokens, gpt_kwargs, calibrated=True):
+        """
+        Mel token budget of every segment of one ``inference_speech`` call (``self.mel_budget``, at most
+        ``max_generate_length``) and the logits processors ending every row at its own budget and in a repetition
+        loop by forcing ``stop_mel_token``. Logits processors, unlike stopping criteria, also end a single row of a
+        beam search or a batch. The given stopping criteria (cancellation) are kept.
+        ``calibrated``: False for seeded requests, their budgets depend on the text and the settings only.
+        Returns (gpt_kwargs, loop_processor, budgets).
+        """
+        max_mel_tokens = gpt_kwargs["max_generate_length"]
+        budgets = [self.mel_budget.predict(t, max_mel_tokens, calibrated) if self.mel_budget is not None
+                   else max_mel_tokens for t in segments_tokens]
+        loop_processor = DegenerateDecodeLogitsProcessor(self.stop_mel_token, batch_size=len(budgets), ignore_token=52)
+        logits_processor = [loop_processor]
+        if len(set(budgets)) > 1:
+            logits_processor.insert(0, MelBudgetLogitsProcessor(self.stop_mel_token, budgets))
+        gpt_kwargs = dict(gpt_kwargs, max_generate_length=max(budgets), logits_processor=logits_processor)
+        return gpt_kwargs, loop_processor, budgets
+
+    def _finish_decode(self, codes, loop_processor, segments_tokens, budgets, stats):
+        """
+        Cut the repetition loops out of the generated ``codes`` [B, T], and calibrate ``self.mel_budget`` with the
+        segments that ended with ``stop_mel_token`` within their budget.
+        Returns (codes, reached_budget [B]).
+        """
+        code_lens = self._get_code_lens(codes)
+        reached = code_lens >= torch.tensor(budgets, device=codes.device)
+        if loop_processor.loops:
+            stats["gpt_loops"] += loop_processor.loops
+            print(f">> GPT generation aborted in a repetition loop ({loop_processor.loops} of {len(budgets)} "
+                  f"segments), the loop is cut")
+            codes = loop_processor.trim(codes)
+        elif self.mel_budget is not None:
+            for text_tokens, code_len, over in zip(segments_tokens, code_lens.tolist(), reached.tolist()):
+                if not over:
+                    self.mel_budget.observe(text_tokens, code_len)
+        return codes, reached
+
+    def _gpt_stage(self, text_tokens, conds, emovec, gpt_kwargs, stats, cancel_token=None, seed=None):
+        """
+        GPT stage of one segment: autoregressive mel code generation followed by the GPT latent pass.
+        ``seed``: sample the codes from a generator seeded with it instead of the global RNG.
+        Returns (codes, code_lens, latent, reached_max_tokens).
+        """
+        if seed is not None:
+            gpt_kwargs = dict(gpt_kwargs, sampling_generators=self._seed_generators([seed], "gpt"))
+        gpt_kwargs, loop_processor, budgets = self._decode_limits([text_tokens], gpt_kwargs, calibrated=seed is None)
+        spk_cond_emb = conds["spk_cond_emb"]
+        emo_cond_emb = conds["emo_cond_emb"]
+        device = text_tokens.device
+        with torch.no_grad():
+            m_start_time = time.perf_counter()
+            with torch.amp.autocast(device.type, enabled=self.dtype is not None, dtype=self.dtype):
+                codes, speech_conditioning_latent = self.gpt.inference_speech(
+                    spk_cond_emb,
+                    text_tokens,
+                    emo_cond_emb,
+                    cond_lengths=torch.tensor([spk_cond_emb.shape[-1]], device=device),
+                    emo_cond_lengths=torch.tensor([emo_cond_emb.shape[-1]], device=device),
+                    emo_vec=emovec,
+                    **gpt_kwargs
+                )
+            stats["gpt_gen_time"] += time.perf_counter() - m_start_time
+            if cancel_token is not None:
+                cancel_token.check()
+            stats["text_tokens"] += text_tokens.shape[-1]
+            stats["gpt_steps"] += codes.shape[-1]
+            codes, reached = self._finish_decode(codes, loop_processor, [text_tokens], budgets, stats)
+            reached_max_tokens = bool(reached.any())
+
+            codes, code_lens = self.remove_long_silence(codes, silent_token=52, max_consecutive=30)
+            stats["codes"] += codes.shape[-1]
+
+            m_start_time = time.perf_counter()
+            use_speed = torch.zeros(spk_cond_emb.size(0)).to(spk_cond_emb.device).long()
+            with torch.amp.autocast(device.type, enabled=self.dtype is not None, dtype=self.dtype):
+                latent = self.gpt(
+                    speech_conditioning_latent,
+                    text_tokens,
+                    torch.tensor([text_tokens.shape[-1]], device=device),
+                    codes,
+                    torch.tensor([codes.shape[-1]], device=device),
+                    emo_cond_emb,
+                    cond_mel_lengths=torch.tensor([spk_cond_emb.shape[-1]], device=device),
+                    emo_cond_mel_lengths=torch.tensor([emo_cond_emb.shape[-1]], device=device),
+                    emo_vec=emovec,
+                    use_speed=use_speed,
+                )
+            stats["gpt_forward_time"] += time.perf_counter() - m_start_time
+        return codes, code_lens, latent, reached_max_tokens
+
+    def _s2mel_stage(self, codes, code_lens, latent, conds, stats, diffusion_steps=25, inference_cfg_rate=0.7,
+                     cancel_token=None, seed=None):
+        """
+        s2mel stage of one segment: GPT latents + semantic codes -> mel spectrogram (CFM).
+        ``seed``: draw the CFM noise from a generator seeded with it instead of the global RNG.
+        """
+        prompt_condition = conds["prompt_condition"]
+        ref_mel = conds["ref_mel"]
+        with torch.no_grad():
+            dtype = self.s2mel_dtype
+            with torch.amp.autocast(codes.device.type, enabled=dtype is not None, dtype=dtype):
+                m_start_time = time.perf_counter()
+                latent = self.s2mel.models['gpt_layer'](latent)
+                S_infer = self.semantic_codec.quantizer.vq2emb(codes.unsqueeze(1))
+                S_infer = S_infer.transpose(1, 2)
+                S_infer = S_infer + latent
+                target_lengths = (code_lens * 1.72).long()
+
+                cond = self.s2mel.models['length_regulator'](S_infer,
+                                                             ylens=target_lengths,
+                                                             n_quantizers=3,
+                                                             f0=None)[0]
+                cat_condition = torch.cat([prompt_condition, cond], dim=1)
+                vc_target = self.s2mel.models['cfm'].inference(cat_condition,
+                                                               torch.LongTensor([cat_condition.size(1)]).to(
+                                                                   cond.device),
+                                                               ref_mel, conds["style"], None, diffusion_steps,
+                                                               inference_cfg_rate=inference_cfg_rate,
+                                                               cancel_check=cancel_token and cancel_token.check,
+                                                               generators=self._seed_generators([seed], "s2mel")
+                                                               if seed is not None else None)
+                vc_target = vc_target[:, :, ref_mel.size(-1):]
+                stats["s2mel_time"] += time.perf_counter() - m_start_time
+                stats["s2mel_frames"] += cat_condition.size(1)
+        return vc_target
+
+    def _s2mel_batch_stage(self, codes, code_lens, latent, conds_list, stats, diffusion_steps=25,
+                           inference_cfg_rate=0.7, cancel_token=None, seeds=None):
+        """
+        Batched s2mel stage: a single CFM solve for several segments of different lengths, which may also come from
+        different requests/speakers (``conds_list[i]`` are the conditionings of segment ``i``).
+        ``codes``: (B, T) padded with 0, ``code_lens``: (B,), ``latent``: the batched GPT latents.
+        ``seeds``: per segment seeds of the CFM noise, which is then the same as in ``_s2mel_stage`` with that seed.
+        Returns (mel, target_lengths): mel is (B, 80, max target frames), padded frames are filled with silence.
+        """
+        batch_num = codes.size(0)
+        device = codes.device
+        with torch.no_grad():
+            dtype = self.s2mel_dtype
+            with torch.amp.autocast(device.type, enabled=dtype is not None, dtype=dtype):
+                m_start_time = time.perf_counter()
+                latent = self.s2mel.models['gpt_layer'](latent)
+                S_infer = self.semantic_codec.quantizer.vq2emb(codes.unsqueeze(0))
+                S_infer = S_infer.transpose(1, 2)
+                S_infer = S_infer + latent
+                target_lengths = (code_lens * 1.72).long()
+
+                # the length regulator interpolates the whole input, so it runs per segment
+                cat_conditions = []
+                for i in range(batch_num):
+                    cond = self.s2mel.models['length_regulator'](S_infer[i:i + 1, :code_lens[i]],
+                                                                 ylens=target_lengths[i:i + 1],
+                                                                 n_quantizers=3,
+                                                                 f0=None)[0]
+                    cat_conditions.append(torch.cat([conds_list[i]["prompt_condition"], cond], dim=1).squeeze(0))
+                cat_lens = torch.tensor([c.size(0) for c in cat_conditions], device=device)
+                cat_condition = pad_sequence(cat_conditions, batch_first=True)
+                prompt_lens = torch.tensor([c["ref_mel"].size(-1) for c in conds_list], device=device)
+                # (B, 80, max prompt frames)
+                ref_mels = pad_sequence([c["ref_mel"][0].transpose(0, 1) for c in conds_list],
+                                        batch_first=True).transpose(1, 2)
+                styles = torch.cat([c["style"] for c in conds_list], dim=0)
+                vc_target = self.s2mel.models['cfm'].inference(cat_condition, cat_lens, ref_mels, styles,
+                                                               None, diffusion_steps,
+                                                               inference_cfg_rate=inference_cfg_rate,
+                                                               prompt_lens=prompt_lens,
+                                                               cancel_check=cancel_token and cancel_token.check,
+                                                               generators=self._seed_generators(seeds, "s2mel")
+                                                               if seeds is not None else None)
+                # the target frames of item i start after its own prompt
+                max_target = int(target_lengths.max())
+                frame_idx = prompt_lens[:, None] + torch.arange(max_target, device=device)[None, :]
+                frame_idx = frame_idx.clamp(max=vc_target.size(-1) - 1)
+                mel = torch.gather(vc_target, 2, frame_idx[:, None, :].expand(-1, vc_target.size(1), -1))
+                frame_mask = torch.arange(max_target, device=device)[None, :] < target_lengths[:, None]
+                mel = mel.masked_fill(~frame_mask.unsqueeze(1), math.log(1e-5))
+                stats["s2mel_time"] += time.perf_counter() - m_start_time
+                stats["s2mel_frames"] += int(cat_lens.sum())
+        return mel, target_lengths
+
+    def _vocoder_stage(self, mel, stats):
+        """
+        BigVGAN stage of one segment: mel spectrogram -> waveform in int16 range, on CPU.
+        """
+        dtype = self.s2mel_dtype
+        with torch.no_grad(), torch.amp.autocast(mel.device.type, enabled=dtype is not None, dtype=dtype):
+            m_start_time = time.perf_counter()
+            if self.bigvgan_tile_frames:
+                wav = self.bigvgan.inference_tiled(mel.float(), tile_frames=self.bigvgan_tile_frames)
+            else:
+                wav = self.bigvgan(mel.float())
+            wav = wav.float().squeeze().unsqueeze(0)
+            stats["bigvgan_time"] += time.perf_counter() - m_start_time
+            stats["mel_frames"] += mel.size(-1)
+            wav = wav.squeeze(1)
+        wav = torch.clamp(32767 * wav, -32767.0, 32767.0)
+        return wav.cpu()  # to cpu before saving
+
+    def _iter_gpt_stage(self, segments_tokens, conds, emovec, gpt_kwargs, stats, use_pipeline=False, pipeline_depth=2,
+                        cancel_token=None, seed=None):
+        """
+        Yield ``(text_tokens, gpt_stage_outputs)`` for every segment.
+        ``segments_tokens`` may be a lazy iterator (e.g. ``_iter_text_tokens``), it is then consumed by the worker.
+        ``seed``: base seed, the GPT sampling of each segment is seeded with ``_segment_seed(seed, text_tokens)``.
+        With ``use_pipeline``, the GPT stage runs ahead in a worker thread (on its own CUDA stream when running on
+        CUDA) and hands over at most ``pipeline_depth`` finished segments through a bounded queue, so the next
+        segment is generated while the caller runs s2mel/BigVGAN on the current one.
+        """
+        if not use_pipeline or (isinstance(segments_tokens, list) and len(segments_tokens) < 2):
+            for text_tokens in segments_tokens:
+                if cancel_token is not None:
+                    cancel_token.check()
+                yield text_tokens, self._gpt_stage(text_tokens, conds, emovec, gpt_kwargs, stats, cancel_token,
+                                                   self._segment_seed(seed, text_tokens))
+            return
+
+        use_cuda_stream = str(self.device).startswith("cuda") and torch.cuda.is_available()
+        consumer_stream = torch.cuda.current_stream(self.device) if use_cuda_stream else None
+        gpt_stream = torch.cuda.Stream(device=self.device) if use_cuda_stream else None
+        outputs = queue.Queue(maxsize=max(1, pipeline_depth))
+        stop_event = threading.Event()
+        end_of_segments = object()
+
+        def put(item):
+            while not stop_event.is_set():
+                try:
+                    outputs.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                stream_ctx = torch.cuda.stream(gpt_stream) if use_cuda_stream else contextlib.nullcontext()
+                with stream_ctx:
+                    if use_cuda_stream:
+                        # conditionings and text tokens were produced on the caller's stream
+                        gpt_stream.wait_stream(consumer_stream)
+                    for text_tokens in segments_tokens:
+                        if stop_event.is_set():
+                            return
+                        if cancel_token is not None:
+                            cancel_token.check()
+                        result = self._gpt_stage(text_tokens, conds, emovec, gpt_kwargs, stats, cancel_token,
+                                                 self._segment_seed(seed, text_tokens))
+                        ready = None
+                        if use_cuda_stream:
+                            ready = torch.cuda.Event()
+                            ready.record(gpt_stream)
+                        if not put((text_tokens, result, ready)):
+                            return
+                put(end_of_segments)
+            except BaseException as e:
+                put(e)
+
+        thread = threading.Thread(target=worker, name="indextts2-gpt-stage", daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = outputs.get()
+                if item is end_of_segments:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                text_tokens, result, ready = item
+                if ready is not None:
+                    consumer_stream.wait_event(ready)
+                    for tensor in result[:3]:
+                        tensor.record_stream(consumer_stream)
+                yield text_tokens, result
+        finally:
+            stop_event.set()
+            thread.join()
+
+    def _iter_segment_wavs(self, segments_tokens, conds, emovec, gpt_kwargs, stats, max_text_tokens_per_segment,
+                           use_pipeline=False, pipeline_depth=2, diffusion_steps=25, inference_cfg_rate=0.7,
+                           cancel_token=None, seed=None, progress_callback=None, verbose=False):
+        """
+        Yield the waveform of every segment, in order.
+        ``segments_tokens``: list or lazy iterator of the text tokens of the segments.
+        ``seed``: base seed, the GPT sampling and the CFM noise of a segment then only depend on it and on the segment
+        text (``_segment_seed``), not on the other segments or the pipelining.
+        """
+        segments_count = len(segments_tokens) if isinstance(segments_tokens, list) else None
+        has_warned = False
+        gpt_outputs = self._iter_gpt_stage(segments_tokens, conds, emovec, gpt_kwargs, stats,
+                                           use_pipeline=use_pipeline, pipeline_depth=pipeline_depth,
+                                           cancel_token=cancel_token, seed=seed)
+        for seg_idx, (text_tokens, (codes, code_lens, latent, reached_max_tokens)) in enumerate(gpt_outputs):
+            if segments_count is not None:
+                self._set_gr_progress(0.2 + 0.7 * seg_idx / segments_count,
+                                      f"speech synthesis {seg_idx + 1}/{segments_count}...", progress_callback)
+            else:
+                self._set_gr_progress(0.2, f"speech synthesis {seg_idx + 1}...", progress_callback)
+            if not has_warned and reached_max_tokens:
+                warnings.warn(
+                    f"WARN: generation stopped due to exceeding the mel token budget of the segment "
+                    f"(`max_mel_tokens`: {gpt_kwargs['max_generate_length']}). "
+                    f"Input text tokens: {text_tokens.shape[1]}. "
+                    f"Consider reducing `max_text_tokens_per_segment`({max_text_tokens_per_segment}) or increasing `max_mel_tokens`.",
+                    category=RuntimeWarning
+                )
+                has_warned = True
+            if verbose:
+                print(codes, type(codes))
+                print(f"fix codes shape: {codes.shape}, codes type: {codes.dtype}")
+                print(f"code len: {code_lens}")
+            mel = self._s2mel_stage(codes, code_lens, latent, conds, stats, diffusion_steps, inference_cfg_rate,
+                                    cancel_token, self._segment_seed(seed, text_tokens))
+            wav = self._vocoder_stage(mel, stats)
+            if verbose:
+                print(f"wav shape: {wav.shape}", "min:", wav.min(), "max:", wav.max())
+            yield wav
+
+    @staticmethod
+    def _new_stats():
+        # 各阶段耗时, 以及延迟预算模式的代价模型所需的工作量统计
+        return {"gpt_gen_time": 0, "gpt_forward_time": 0, "s2mel_time": 0, "bigvgan_time": 0,
+                "text_tokens": 0, "gpt_steps": 0, "codes": 0, "s2mel_frames": 0, "mel_frames": 0, "gpt_loops": 0}
+
+    @staticmethod
+    def _segment_seed(seed, text_tokens):
+        """
+        Seed of a segment, derived from ``seed`` and the text tokens of the segment (not its index), so that
+        a segment is rendered the same wherever it appears in the document. None without ``seed``.
+        """
+        if seed is None:
+            return None
+        return derive_seed(seed, text_tokens.flatten().tolist() if torch.is_tensor(text_tokens) else list(text_tokens))
+
+    @staticmethod
+    def _segment_seeds(seed, segments_tokens):
+        if seed is None:
+            return None
+        return [IndexTTS2._segment_seed(seed, t) for t in segments_tokens]
+
+    def _seed_generators(self, seeds, stage):
+        """
+        One ``torch.Generator`` per segment seed for the random draws of ``stage`` ("gpt", "s2mel").
+        """
+        return [torch.Generator(device=self.device).manual_seed(derive_seed(seed, stage)) for seed in seeds]
+
+    def _segment_cache_keys(self, conds, emovec, gpt_kwargs, diffusion_steps, inference_cfg_rate, segments_tokens,
+                            segment_seeds):
+        """
+        Segment cache key of every segment: speaker and emotion conditionings (content hash), generation settings,
+        text tokens and seed of the segment.
+        """
+        request_key = {
+            "model": [self.model_dir, self.cfg.gpt_checkpoint, self.cfg.s2mel_checkpoint, str(self.dtype),
+                      str(self.s2mel_dtype), self.bigvgan_tile_frames],
+            "conditions": tensor_digest(conds["spk_cond_emb"], emovec, conds["prompt_condition"], conds["style"],
+                                        conds["ref_mel"]),
+            "gpt": {k: v for k, v in gpt_kwargs.items() if k not in ("stopping_criteria", "logits_processor")},
+            "diffusion_steps": diffusion_steps,
+            "inference_cfg_rate": inference_cfg_rate,
+            # seeded segments use the uncalibrated mel token budgets
+            "mel_budget": self.mel_budget.settings if self.mel_budget is not None else None,
+        }
+        return [SegmentAudioCache.make_key(request_key, t.flatten().tolist(), seed)
+                for t, seed in zip(segments_tokens, segment_seeds)]
+
+    def _plan_latency_budget(self, latency_budget, segments_tokens, conds, gpt_kwargs, diffusion_steps,
+                             inference_cfg_rate):
+        """
+        Latency budget mode: lower the diffusion steps, CFG, beams and ``max_mel_tokens`` to the tier that
+        ``self.latency_planner`` predicts to finish within ``latency_budget`` seconds. Never raises the requested
+        quality. The budget covers this call only: the instance is not safe for concurrent calls, so callers that
+        queue requests for it pass the budget left after the wait.
+        Returns (gpt_kwargs, diffusion_steps, inference_cfg_rate).
+        """
+        plan = self.latency_planner.plan([t.shape[-1] for t in segments_tokens], conds["ref_mel"].size(-1),
+                                         latency_budget, max_mel_tokens=gpt_kwargs["max_generate_length"])
+        if plan is None:
+            print(">> latency budget: no cost measurements yet, using the requested settings")
+            return gpt_kwargs, diffusion_steps, inference_cfg_rate
+        gpt_kwargs = dict(gpt_kwargs)
+        gpt_kwargs["num_beams"] = min(gpt_kwargs["num_beams"], plan["num_beams"])
+        gpt_kwargs["max_generate_length"] = plan["max_mel_tokens"]
+        diffusion_steps = min(diffusion_steps, plan["diffusion_steps"])
+        if plan["inference_cfg_rate"] == 0:
+            inference_cfg_rate = 0.0
+        print(f">> latency budget: {latency_budget:.2f}s, "
+              f"estimated: {plan['estimated_time']:.2f}s -> diffusion_steps: {diffusion_steps}, "
+              f"inference_cfg_rate: {inference_cfg_rate}, num_beams: {gpt_kwargs['num_beams']}, "
+              f"max_mel_tokens: {gpt_kwargs['max_generate_length']}")
+        return gpt_kwargs, diffusion_steps, inference_cfg_rate
+
+    # 原始推理模式
+    def infer(self, spk_audio_prompt, text, output_path,
+              emo_audio_prompt=None, emo_alpha=1.0,
+              emo_vector=None,
+              use_emo_text=False, emo_text=None, use_random=False, interval_silence=200,
+              verbose=False, max_text_tokens_per_segment=120, use_pipeline=False,
+              diffusion_steps=25, inference_cfg_rate=0.7, latency_budget=None, cancel_token=None, seed=None,
+              progress_callback=None, **generation_kwargs):
+        """
+        ``use_pipeline``: generate the next segment with the GPT while the current one goes through s2mel/BigVGAN,
+        see ``_iter_gpt_stage``. Only useful for texts with several segments.
+        ``diffusion_steps`` / ``inference_cfg_rate``: CFM steps and classifier-free guidance rate of s2mel.
+        ``latency_budget``: target synthesis time in seconds. The diffusion steps, CFG, ``num_beams`` and
+            ``max_mel_tokens`` are lowered as needed, from the cost model fitted on the previous requests
+            (``self.latency_planner``), see ``_plan_latency_budget``. None: use the settings as given.
+        ``cancel_token``: ``indextts.utils.cancellation.CancellationToken``, checked between segments, between diffusion
+            steps and every few GPT decode steps. ``SynthesisCancelled`` is raised once it is cancelled or past its
+            deadline, nothing is saved.
+        ``seed``: seed the GPT sampling and the CFM noise of every segment with a seed derived from ``seed`` and the
+            segment text, so the same request renders the same audio. With ``segment_cache_dir``, segments already
+            rendered are then read from the cache and only the others are synthesized. Also seeds the ``use_random``
+            emotion picks, and predicts the mel token budgets from the priors only (not the calibrated rates).
+        ``progress_callback``: ``callback(value, desc=...)`` with value in [0, 1], called from the inference thread.
+            Per call, instead of the instance-wide ``self.gr_progress``.
+        """
+        print(">> starting inference...")
+        self._set_gr_progress(0, "starting inference...", progress_callback)
+        if verbose:
+            print(f"origin text:{text}, spk_audio_prompt:{spk_audio_prompt}, "
+                  f"emo_audio_prompt:{emo_audio_prompt}, emo_alpha:{emo_alpha}, "
+                  f"emo_vector:{emo_vector}, use_emo_text:{use_emo_text}, "
+                  f"emo_text:{emo_text}")
+        start_time = time.perf_counter()
+
+        conds = self._prepare_conditions(spk_audio_prompt, text, emo_audio_prompt, emo_alpha, emo_vector,
+                                         use_emo_text, emo_text, use_random, verbose, seed)
+        emovec = self._get_emovec(conds)
+
+        self._set_gr_progress(0.1, "text processing...", progress_callback)
+        segments_tokens = self._prepare_text_tokens(text, max_text_tokens_per_segment, verbose)
+        gpt_kwargs = self._build_gpt_kwargs(generation_kwargs, cancel_token)
+        sampling_rate = 22050
+
+        stats = self._new_stats()
+        if latency_budget is not None:
+            gpt_kwargs, diffusion_steps, inference_cfg_rate = self._plan_latency_budget(
+                latency_budget, segments_tokens, conds, gpt_kwargs, diffusion_steps, inference_cfg_rate)
+        segment_seeds = self._segment_seeds(seed, segments_tokens)
+        wavs = [None] * len(segments_tokens)
+        cache_keys = None
+        if self.segment_cache is not None and segment_seeds is not None:
+            cache_keys = self._segment_cache_keys(conds, emovec, gpt_kwargs, diffusion_steps, inference_cfg_rate,
+                                                  segments_tokens, segment_seeds)
+            wavs = [self.segment_cache.get(key) for key in cache_keys]
+        todo = [i for i, wav in enumerate(wavs) if wav is None]
+        try:
+            segment_wavs = self._iter_segment_wavs([segments_tokens[i] for i in todo], conds, emovec, gpt_kwargs,
+                                                   stats, max_text_tokens_per_segment, use_pipeline=use_pipeline,
+                                                   diffusion_steps=diffusion_steps,
+                                                   inference_cfg_rate=inference_cfg_rate, cancel_token=cancel_token,
+                                                   seed=seed, progress_callback=progress_callback,
+                                                   verbose=verbose)
+            for i, wav in zip(todo, segment_wavs):
+                wavs[i] = wav
+                if cache_keys is not None:
+                    self.segment_cache.put(cache_keys[i], wav)
+        except SynthesisCancelled as e:
+            print(f">> inference cancelled after {time.perf_counter() - start_time:.2f} seconds: {e}")
+            raise
+        end_time = time.perf_counter()
+        self.latency_planner.observe(stats, gpt_kwargs["num_beams"], diffusion_steps, inference_cfg_rate)
+
+        self._set_gr_progress(0.9, "saving audio...", progress_callback)
+        wavs = self.insert_interval_silence(wavs, sampling_rate=sampling_rate, interval_silence=interval_silence)
+        wav = torch.cat(wavs, dim=1)
+        wav_length = wav.shape[-1] / sampling_rate
+        print(f">> gpt_gen_time: {stats['gpt_gen_time']:.2f} seconds")
+        print(f">> gpt_forward_time: {stats['gpt_forward_time']:.2f} seconds")
+        print(f">> s2mel_time: {stats['s2mel_time']:.2f} seconds")
+        print(f">> bigvgan_time: {stats['bigvgan_time']:.2f} seconds")
+        print(f">> Total inference time: {end_time - start_time:.2f} seconds")
+        print(f">> Generated audio length: {wav_length:.2f} seconds")
+        print(f">> RTF: {(end_time - start_time) / wav_length:.4f}")
+        if cache_keys is not None:
+            print(f">> segment cache: {len(wavs) - len(todo)}/{len(wavs)} segments reused, {len(todo)} synthesized")
+
+        return self._save_wav(wav, output_path, sampling_rate)
+
+    # 流式推理：逐句返回音频
+    def infer_stream(self, spk_audio_prompt, text,
+                     emo_audio_prompt=None, emo_alpha=1.0,
+                     emo_vector=None,
+                     use_emo_text=False, emo_text=None, use_random=False, interval_silence=200,
+                     verbose=False, max_text_tokens_per_segment=120, use_pipeline=True,
+                     diffusion_steps=25, inference_cfg_rate=0.7, latency_budget=None, cancel_token=None, seed=None,
+                     progress_callback=None, **generation_kwargs):
+        """
+        Streaming variant of ``infer``: yields the audio of each segment as soon as it is vocoded.
+        Same arguments as ``infer`` (without ``output_path``; the segment cache is not used).
+        Without ``latency_budget``, the text is normalized and split lazily while the previous segments are
+        synthesized, so the first audio of a book-length text does not wait for the whole text to be processed.
+        Yields:
+            torch.Tensor of shape (1, samples), 22050Hz, float values in int16 range.
+            The interval silence is prepended to every segment but the first one.
+        """
+        print(">> starting streaming inference...")
+        start_time = time.perf_counter()
+        conds = self._prepare_conditions(spk_audio_prompt, text, emo_audio_prompt, emo_alpha, emo_vector,
+                                         use_emo_text, emo_text, use_random, verbose, seed)
+        emovec = self._get_emovec(conds)
+        if latency_budget is not None:
+            # the latency planner needs the lengths of all the segments
+            segments_tokens = self._prepare_text_tokens(text, max_text_tokens_per_segment, verbose)
+        else:
+            segments_tokens = self._iter_text_tokens(text, max_text_tokens_per_segment, verbose)
+        gpt_kwargs = self._build_gpt_kwargs(generation_kwargs, cancel_token)
+        sampling_rate = 22050
+
+        stats = self._new_stats()
+        wav_length = 0
+        if latency_budget is not None:
+            gpt_kwargs, diffusion_steps, inference_cfg_rate = self._plan_latency_budget(
+                latency_budget, segments_tokens, conds, gpt_kwargs, diffusion_steps, inference_cfg_rate)
+        segment_wavs = self._iter_segment_wavs(segments_tokens, conds, emovec, gpt_kwargs, stats,
+                                               max_text_tokens_per_segment, use_pipeline=use_pipeline,
+                                               diffusion_steps=diffusion_steps,
+                                               inference_cfg_rate=inference_cfg_rate, cancel_token=cancel_token,
+                                               seed=seed, progress_callback=progress_callback,
+                                               verbose=verbose)
+        try:
+            for seg_idx, wav in enumerate(segment_wavs):
+                if seg_idx == 0:
+                    print(f">> first segment latency: {time.perf_counter() - start_time:.2f} seconds")
+                elif interval_silence > 0:
+                    sil_tensor = torch.zeros(wav.size(0), int(sampling_rate * interval_silence / 1000.0))
+                    wav = torch.cat([sil_tensor, wav], dim=1)
+                wav_length += wav.shape[-1] / sampling_rate
+                yield wav
+        except SynthesisCancelled as e:
+            print(f">> streaming inference cancelled after {time.perf_counter() - start_time:.2f} seconds: {e}")
+            raise
+        end_time = time.perf_counter()
+        self.latency_planner.observe(stats, gpt_kwargs["num_beams"], diffusion_steps, inference_cfg_rate)
+        print(f">> Total streaming inference time: {end_time - start_time:.2f} seconds")
+        if wav_length > 0:
+            print(f">> Generated audio length: {wav_length:.2f} seconds")
+            print(f">> RTF: {(end_time - start_time) / wav_length:.4f}")
+
+    # 快速推理：长文本分句分桶后批量推理（与 IndexTTS.infer_fast 对应）
+    def infer_fast(self, spk_audio_prompt, text, output_path,
+                   emo_audio_prompt=None, emo_alpha=1.0,
+                   emo_vector=None,
+                   use_emo_text=False, emo_text=None, use_random=False, interval_silence=200,
+                   verbose=False, max_text_tokens_per_segment=120, segments_bucket_max_size=4,
+                   diffusion_steps=25, inference_cfg_rate=0.7, cancel_token=None, seed=None, progress_callback=None,
+                   max_batch_mel_tokens=None, **generation_kwargs):
+        """
+        Same arguments as ``infer`` (without ``use_pipeline`` and ``latency_budget``: the cost model is fitted on
+        unbatched segments; the segment cache is not used), plus:
+            ``segments_bucket_max_size``: 分句分桶的最大容量，默认``4``，可以根据GPU内存调整
+                - 越大，bucket数量越少，batch越多，推理速度越*快*，占用内存更多
+                - 越小，bucket数量越多，batch越少，推理速度越*慢*，占用内存和结果更接近于非快速推理
+            ``max_batch_mel_tokens``: 按预测长度限制每个bucket的GPT生成规模（行数 x 最长的 文本token+mel token预算），
+                超出的bucket被拆分，用于控制KV cache和显存占用。None: 不限制
+        Segments of similar length are grouped into buckets; GPT generation, GPT latents, s2mel and BigVGAN
+        run once per bucket, and the generated segments are put back in their original order.
+        With a ``seed``, every segment samples from its own generators, so the bucketing does not change which
+        random draws a segment gets.
+        """
+        print(">> starting fast inference...")
+        self._set_gr_progress(0, "starting fast inference...", progress_callback)
+        if verbose:
+            print(f"origin text:{text}, spk_audio_prompt:{spk_audio_prompt}, "
+                  f"emo_audio_prompt:{emo_audio_prompt}, emo_alpha:{emo_alpha}, "
+                  f"emo_vector:{emo_vector}, use_emo_text:{use_emo_text}, "
+                  f"emo_text:{emo_text}")
+        start_time = time.perf_counter()
+
+        conds = self._prepare_conditions(spk_audio_prompt, text, emo_audio_prompt, emo_alpha, emo_vector,
+                                         use_emo_text, emo_text, use_random, verbose, seed)
+        spk_cond_emb = conds["spk_cond_emb"]
+        emo_cond_emb = conds["emo_cond_emb"]
+        emovec = self._get_emovec(conds)
+
+        self._set_gr_progress(0.1, "text processing...", progress_callback)
+        segments = list(self.tokenizer.iter_segments(text, max_text_tokens_per_segment))
         segments_count = len(segments)
+        bucket_max_size = segments_bucket_max_size if self.device != "cpu" else 1
+        buckets = self.bucket_segments(segments, bucket_max_size=bucket_max_size)
+        if max_batch_mel_tokens is not None and bucket_max_size > 1:
+            buckets = self._split_buckets_by_budget(buckets, generation_kwargs.get("max_mel_tokens", 1500),
+                                                    max_batch_mel_tokens, generation_kwargs.get("num_beams", 3),
+                                                    calibrated=seed is None)
+        segment_seeds = self._segment_seeds(seed, [self.tokenizer.convert_tokens_to_ids(s) for s in segments])
         if verbose:
-            print("text_tokens_list:", text_tokens_list)
             print("segments count:", segments_count)
             print("max_text_tokens_per_segment:", max_text_tokens_per_segment)
             print(*segments, sep="\n")
+            print(">> segments bucket_count:", len(buckets),
+                  "bucket sizes:", [(len(s), [t["idx"] for t in s]) for s in buckets],
+                  "bucket_max_size:", bucket_max_size)
         do_sample = generation_kwargs.pop("do_sample", True)
         top_p = generation_kwargs.pop("top_p", 0.8)
         top_k = generation_kwargs.pop("top_k", 30)
@@ -461,50 +1307,50 @@ class IndexTTS2:
         num_beams = generation_kwargs.pop("num_beams", 3)
         repetition_penalty = generation_kwargs.pop("repetition_penalty", 10.0)
         max_mel_tokens = generation_kwargs.pop("max_mel_tokens", 1500)
+        if cancel_token is not None:
+            generation_kwargs["stopping_criteria"] = StoppingCriteriaList([CancellationStoppingCriteria(cancel_token)])
         sampling_rate = 22050
+        hop_length = self.cfg.s2mel['preprocess_params']['spect_params']['hop_length']
 
-        wavs = []
-        gpt_gen_time = 0
-        gpt_forward_time = 0
-        s2mel_time = 0
-        bigvgan_time = 0
+        segment_wavs = [None] * segments_count
+        stats = self._new_stats()
         has_warned = False
-        for seg_idx, sent in enumerate(segments):
-            self._set_gr_progress(0.2 + 0.7 * seg_idx / segments_count,
-                                  f"speech synthesis {seg_idx + 1}/{segments_count}...")
-
-            text_tokens = self.tokenizer.convert_tokens_to_ids(sent)
-            text_tokens = torch.tensor(text_tokens, dtype=torch.int32, device=self.device).unsqueeze(0)
+        processed_num = 0
+        for bucket in buckets:
+            if cancel_token is not None:
+                cancel_token.check()
+            batch_num = len(bucket)
+            self._set_gr_progress(0.2 + 0.7 * processed_num / segments_count,
+                                  f"speech synthesis {processed_num + 1}-{processed_num + batch_num}/{segments_count}...",
+                                  progress_callback)
+            text_tokens = [
+                torch.tensor(self.tokenizer.convert_tokens_to_ids(item["sent"]), dtype=torch.int32,
+                             device=self.device).unsqueeze(0)
+                for item in bucket
+            ]
+            text_lengths = torch.tensor([t.size(1) for t in text_tokens], device=self.device)
+            batch_text_tokens = self.pad_tokens_cat(text_tokens)
+            bucket_seeds = [segment_seeds[item["idx"]] for item in bucket] if segment_seeds is not None else None
+            if bucket_seeds is not None:
+                generation_kwargs["sampling_generators"] = self._seed_generators(bucket_seeds, "gpt")
+            # 每段按预测的长度停止，整个batch最多生成其中最长的预算
+            bucket_kwargs, loop_processor, budgets = self._decode_limits(
+                text_tokens, dict(generation_kwargs, max_generate_length=max_mel_tokens), calibrated=seed is None)
             if verbose:
-                print(text_tokens)
-                print(f"text_tokens shape: {text_tokens.shape}, text_tokens type: {text_tokens.dtype}")
-                # debug tokenizer
-                text_token_syms = self.tokenizer.convert_ids_to_tokens(text_tokens[0].tolist())
-                print("text_token_syms is same as segment tokens", text_token_syms == sent)
+                print(f"bucket {[item['idx'] for item in bucket]}, text_tokens shape: {batch_text_tokens.shape}, "
+                      f"mel token budgets: {budgets}")
 
             m_start_time = time.perf_counter()
             with torch.no_grad():
-                with torch.amp.autocast(text_tokens.device.type, enabled=self.dtype is not None, dtype=self.dtype):
-                    emovec = self.gpt.merge_emovec(
-                        spk_cond_emb,
-                        emo_cond_emb,
-                        torch.tensor([spk_cond_emb.shape[-1]], device=text_tokens.device),
-                        torch.tensor([emo_cond_emb.shape[-1]], device=text_tokens.device),
-                        alpha=emo_alpha
-                    )
-
-                    if emo_vector is not None:
-                        emovec = emovec_mat + (1 - torch.sum(weight_vector)) * emovec
-                        # emovec = emovec_mat
-
+                with torch.amp.autocast(batch_text_tokens.device.type, enabled=self.dtype is not None, dtype=self.dtype):
                     codes, speech_conditioning_latent = self.gpt.inference_speech(
                         spk_cond_emb,
-                        text_tokens,
+                        batch_text_tokens,
                         emo_cond_emb,
-                        cond_lengths=torch.tensor([spk_cond_emb.shape[-1]], device=text_tokens.device),
-                        emo_cond_lengths=torch.tensor([emo_cond_emb.shape[-1]], device=text_tokens.device),
+                        cond_lengths=torch.tensor([spk_cond_emb.shape[-1]], device=self.device),
+                        emo_cond_lengths=torch.tensor([emo_cond_emb.shape[-1]], device=self.device),
                         emo_vec=emovec,
-                        do_sample=True,
+                        do_sample=do_sample,
                         top_p=top_p,
                         top_k=top_k,
                         temperature=temperature,
@@ -512,126 +1358,87 @@ class IndexTTS2:
                         length_penalty=length_penalty,
                         num_beams=num_beams,
                         repetition_penalty=repetition_penalty,
-                        max_generate_length=max_mel_tokens,
-                        **generation_kwargs
+                        **bucket_kwargs
                     )
-
-                gpt_gen_time += time.perf_counter() - m_start_time
-                if not has_warned and (codes[:, -1] != self.stop_mel_token).any():
+                stats["gpt_gen_time"] += time.perf_counter() - m_start_time
+                if cancel_token is not None:
+                    cancel_token.check()
+                codes, reached = self._finish_decode(codes, loop_processor, text_tokens, budgets, stats)
+                if not has_warned and reached.any():
                     warnings.warn(
-                        f"WARN: generation stopped due to exceeding `max_mel_tokens` ({max_mel_tokens}). "
-                        f"Input text tokens: {text_tokens.shape[1]}. "
+                        f"WARN: generation stopped due to exceeding the mel token budget of the segment "
+                        f"(`max_mel_tokens`: {max_mel_tokens}). "
+                        f"Input text tokens: {text_lengths.tolist()}. "
                         f"Consider reducing `max_text_tokens_per_segment`({max_text_tokens_per_segment}) or increasing `max_mel_tokens`.",
                         category=RuntimeWarning
                     )
                     has_warned = True
 
-                code_lens = torch.tensor([codes.shape[-1]], device=codes.device, dtype=codes.dtype)
-                #                 if verbose:
-                #                     print(codes, type(codes))
-                #                     print(f"codes shape: {codes.shape}, codes type: {codes.dtype}")
-                #                     print(f"code len: {code_lens}")
-
-                code_lens = []
-                for code in codes:
-                    if self.stop_mel_token not in code:
-                        code_lens.append(len(code))
-                        code_len = len(code)
-                    else:
-                        len_ = (code == self.stop_mel_token).nonzero(as_tuple=False)[0] + 1
-                        code_len = len_ - 1
-                    code_lens.append(code_len)
-                codes = codes[:, :code_len]
-                code_lens = torch.LongTensor(code_lens)
-                code_lens = code_lens.to(self.device)
+                codes, code_lens = self.remove_long_silence(codes, silent_token=52, max_consecutive=30)
+                # padded positions hold stop_mel_token, which is out of the semantic codebook
+                code_mask = torch.arange(codes.size(1), device=codes.device)[None, :] < code_lens[:, None]
+                codes = codes.masked_fill(~code_mask, 0)
                 if verbose:
-                    print(codes, type(codes))
-                    print(f"fix codes shape: {codes.shape}, codes type: {codes.dtype}")
-                    print(f"code len: {code_lens}")
+                    print(f"fix codes shape: {codes.shape}, code lens: {code_lens}")
 
                 m_start_time = time.perf_counter()
-                use_speed = torch.zeros(spk_cond_emb.size(0)).to(spk_cond_emb.device).long()
-                with torch.amp.autocast(text_tokens.device.type, enabled=self.dtype is not None, dtype=self.dtype):
-                    latent = self.gpt(
+                with torch.amp.autocast(batch_text_tokens.device.type, enabled=self.dtype is not None, dtype=self.dtype):
+                    latent = self.gpt.forward_latent(
                         speech_conditioning_latent,
-                        text_tokens,
-                        torch.tensor([text_tokens.shape[-1]], device=text_tokens.device),
+                        batch_text_tokens,
+                        text_lengths,
                         codes,
-                        torch.tensor([codes.shape[-1]], device=text_tokens.device),
-                        emo_cond_emb,
-                        cond_mel_lengths=torch.tensor([spk_cond_emb.shape[-1]], device=text_tokens.device),
-                        emo_cond_mel_lengths=torch.tensor([emo_cond_emb.shape[-1]], device=text_tokens.device),
-                        emo_vec=emovec,
-                        use_speed=use_speed,
+                        code_lens,
+                        emovec,
                     )
-                    gpt_forward_time += time.perf_counter() - m_start_time
+                stats["gpt_forward_time"] += time.perf_counter() - m_start_time
 
-                dtype = None
-                with torch.amp.autocast(text_tokens.device.type, enabled=dtype is not None, dtype=dtype):
-                    m_start_time = time.perf_counter()
-                    diffusion_steps = 25
-                    inference_cfg_rate = 0.7
-                    latent = self.s2mel.models['gpt_layer'](latent)
-                    S_infer = self.semantic_codec.quantizer.vq2emb(codes.unsqueeze(1))
-                    S_infer = S_infer.transpose(1, 2)
-                    S_infer = S_infer + latent
-                    target_lengths = (code_lens * 1.72).long()
-
-                    cond = self.s2mel.models['length_regulator'](S_infer,
-                                                                 ylens=target_lengths,
-                                                                 n_quantizers=3,
-                                                                 f0=None)[0]
-                    cat_condition = torch.cat([prompt_condition, cond], dim=1)
-                    vc_target = self.s2mel.models['cfm'].inference(cat_condition,
-                                                                   torch.LongTensor([cat_condition.size(1)]).to(
-                                                                       cond.device),
-                                                                   ref_mel, style, None, diffusion_steps,
-                                                                   inference_cfg_rate=inference_cfg_rate)
-                    vc_target = vc_target[:, :, ref_mel.size(-1):]
-                    s2mel_time += time.perf_counter() - m_start_time
+                vc_target, target_lengths = self._s2mel_batch_stage(codes, code_lens, latent, [conds] * batch_num,
+                                                                    stats, diffusion_steps, inference_cfg_rate,
+                                                                    cancel_token=cancel_token, seeds=bucket_seeds)
 
+                dtype = self.s2mel_dtype
+                with torch.amp.autocast(batch_text_tokens.device.type, enabled=dtype is not None, dtype=dtype):
                     m_start_time = time.perf_counter()
-                    wav = self.bigvgan(vc_target.float()).squeeze().unsqueeze(0)
-                    print(wav.shape)
-                    bigvgan_time += time.perf_counter() - m_start_time
-                    wav = wav.squeeze(1)
-
-                wav = torch.clamp(32767 * wav, -32767.0, 32767.0)
-                if verbose:
-                    print(f"wav shape: {wav.shape}", "min:", wav.min(), "max:", wav.max())
-                # wavs.append(wav[:, :-512])
-                wavs.append(wav.cpu())  # to cpu before saving
+                    if self.bigvgan_tile_frames:
+                        # tiles of all segments of the bucket are vocoded together, without padded frames
+                        wavs = self.bigvgan.inference_tiled(
+                            [vc_target[i, :, :target_lengths[i]].float() for i in range(batch_num)],
+                            tile_frames=self.bigvgan_tile_frames)
+                        wavs = [w.float().squeeze(1) for w in wavs]
+                    else:
+                        # the padded frames hold silence (log(1e-5)), so the whole bucket is vocoded at once
+                        wav = self.bigvgan(vc_target.float()).float().squeeze(1)
+                        wavs = [wav[i:i + 1, :target_lengths[i] * hop_length] for i in range(batch_num)]
+                    stats["bigvgan_time"] += time.perf_counter() - m_start_time
+                    stats["mel_frames"] += int(target_lengths.sum())
+
+                for i, item in enumerate(bucket):
+                    segment_wavs[item["idx"]] = torch.clamp(32767 * wavs[i], -32767.0, 32767.0).cpu()
+            processed_num += batch_num
         end_time = time.perf_counter()
 
-        self._set_gr_progress(0.9, "saving audio...")
-        wavs = self.insert_interval_silence(wavs, sampling_rate=sampling_rate, interval_silence=interval_silence)
-        wav = torch.cat(wavs, dim=1)
+        self._set_gr_progress(0.9, "saving audio...", progress_callback)
+        wavs = [w for w in segment_wavs if w is not None]
+        if not wavs:
+            print(">> WARNING: No wavs generated, returning empty audio")
+            wav = torch.zeros((1, 0), dtype=torch.float32)
+        else:
+            wavs = self.insert_interval_silence(wavs, sampling_rate=sampling_rate, interval_silence=interval_silence)
+            wav = torch.cat(wavs, dim=1)
         wav_length = wav.shape[-1] / sampling_rate
-        print(f">> gpt_gen_time: {gpt_gen_time:.2f} seconds")
-        print(f">> gpt_forward_time: {gpt_forward_time:.2f} seconds")
-        print(f">> s2mel_time: {s2mel_time:.2f} seconds")
-        print(f">> bigvgan_time: {bigvgan_time:.2f} seconds")
-        print(f">> Total inference time: {end_time - start_time:.2f} seconds")
+        print(f">> gpt_gen_time: {stats['gpt_gen_time']:.2f} seconds")
+        print(f">> gpt_forward_time: {stats['gpt_forward_time']:.2f} seconds")
+        print(f">> s2mel_time: {stats['s2mel_time']:.2f} seconds")
+        print(f">> bigvgan_time: {stats['bigvgan_time']:.2f} seconds")
+        print(f">> Total fast inference time: {end_time - start_time:.2f} seconds")
         print(f">> Generated audio length: {wav_length:.2f} seconds")
-        print(f">> RTF: {(end_time - start_time) / wav_length:.4f}")
+        print(f">> [fast] segments: {segments_count} bucket_max_size: {bucket_max_size}",
+              f"bucket_count: {len(buckets)}" if bucket_max_size > 1 else "")
+        if wav_length > 0:
+            print(f">> [fast] RTF: {(end_time - start_time) / wav_length:.4f}")
 
-        # save audio
-        wav = wav.cpu()  # to cpu
-        if output_path:
-            # 直接保存音频到指定路径中
-            if os.path.isfile(output_path):
-                os.remove(output_path)
-                print(">> remove old wav file:", output_path)
-            if os.path.dirname(output_path) != "":
-                os.makedirs(os.path.dirname(output_path), exist_ok=True)
-            torchaudio.save(output_path, wav.type(torch.int16), sampling_rate)
-            print(">> wav file saved to:", output_path)
-            return output_path
-        else:
-            # 返回音频数据
-            wav_data = wav.type(torch.int16)
-            wav_data = wav_data.numpy().T
-            return (sampling_rate, wav_data)
+        return self._save_wav(wav, output_path, sampling_rate)
 
 
 def find_most_similar_cosine(query_vector, matrix):
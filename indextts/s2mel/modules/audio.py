@@ -1,3 +1,5 @@
+import math
+
 import numpy as np
 import torch
 import torch.utils.data
@@ -80,3 +82,19 @@ def mel_spectrogram(y, n_fft, num_mels, sampling_rate, hop_size, win_size, fmin,
     spec = spectral_normalize_torch(spec)
 
     return spec
+
+
+def select_voiced_window(log_mel, max_frames, top_db=40.0):
+    """
+    Start frame of the ``max_frames`` long window of ``log_mel`` (1, num_mels, T), as returned by
+    ``mel_spectrogram``, which holds the most voiced frames (the earliest one on ties).
+    A frame is voiced when its mean log magnitude is within ``top_db`` of the loudest frame.
+    """
+    total_frames = log_mel.size(-1)
+    if total_frames <= max_frames:
+        return 0
+    level = log_mel[0].float().mean(dim=0)
+    voiced = (level > level.max() - top_db / 20.0 * math.log(10)).float()
+    voiced_cumsum = torch.cat([voiced.new_zeros(1), voiced.cumsum(0)])
+    voiced_per_window = voiced_cumsum[max_frames:] - voiced_cumsum[:-max_frames]
+    return int(torch.argmax(voiced_per_window))
@@ -0,0 +1,74 @@
+# Polyphase form of the anti-aliased activation (2x upsample -> Snake/SnakeBeta -> 2x downsample), for CPU.
+
+import torch
+import torch.nn.functional as F
+
+from .act import Activation1d
+
+
+class PolyphaseActivation1d(Activation1d):
+    """
+    Same computation and parameters (state dict) as ``Activation1d``, without materializing the 2x sequence.
+
+    The 12-tap upsampling filter is split into its even and odd phases, so the upsampled sequence is computed as
+    two 6-tap depthwise convolutions on the input (instead of a zero-stuffing ``conv_transpose1d``), the activation
+    runs on both phases as [B, 2C, T], and the stride-2 low-pass filter sums the two phases with their own 6 taps.
+    Replicate padding at both ends is reproduced exactly, so the output equals ``Activation1d`` up to float error.
+
+    Only valid for ``up_ratio == down_ratio == 2`` and 12-tap filters (the BigVGAN setup, like the CUDA kernel).
+    """
+
+    def __init__(
+        self,
+        activation,
+        up_ratio: int = 2,
+        down_ratio: int = 2,
+        up_kernel_size: int = 12,
+        down_kernel_size: int = 12,
+    ):
+        super().__init__(activation, up_ratio, down_ratio, up_kernel_size, down_kernel_size)
+        assert up_ratio == 2 and down_ratio == 2 and up_kernel_size == 12 and down_kernel_size == 12, \
+            "PolyphaseActivation1d only supports 2x resampling with 12-tap filters"
+
+    def _phase_filters(self, channels: int, dtype):
+        up = self.upsample.filter.view(-1).to(dtype)
+        down = self.downsample.lowpass.filter.view(-1).to(dtype)
+        zero = up.new_zeros(1)
+        # upsampled[2i] = sum_s w_even[s] * x[i - 3 + s], upsampled[2i + 1] = sum_s w_odd[s] * x[i - 2 + s]
+        # (x replicate padded, the ratio 2 gain of UpSample1d is folded in)
+        w_even = torch.cat([2 * up[1::2].flip(0), zero])
+        w_odd = torch.cat([zero, 2 * up[0::2].flip(0)])
+        up_weight = torch.stack([w_even, w_odd]).repeat(channels, 1).unsqueeze(1)  # [2C, 1, 7]
+        # out[n] = sum_r down[2r + 1] * even[n + r - 2] + down[2r] * odd[n + r - 3]
+        d_even = torch.cat([zero, down[1::2]])
+        d_odd = torch.cat([down[0::2], zero])
+        down_weight = torch.stack([d_even, d_odd]).unsqueeze(0).expand(channels, -1, -1)  # [C, 2, 7]
+        return up_weight, down_weight
+
+    def _activation_params(self, x):
+        act = self.act
+        alpha = act.alpha
+        # Snake uses the same parameter for the frequency and the magnitude
+        beta = getattr(act, "beta", alpha)
+        if act.alpha_logscale:
+            alpha = torch.exp(alpha)
+            beta = torch.exp(beta)
+        alpha = alpha.to(x.dtype).repeat_interleave(2)[None, :, None]
+        beta = beta.to(x.dtype).repeat_interleave(2)[None, :, None]
+        return alpha, beta, act.no_div_by_zero
+
+    # x: [B,C,T]
+    def forward(self, x):
+        _, C, _ = x.shape
+        up_weight, down_weight = self._phase_filters(C, x.dtype)
+
+        # channels 2c / 2c + 1 hold the even / odd samples of the upsampled channel c
+        phases = F.conv1d(F.pad(x, (3, 3), mode="replicate"), up_weight, groups=C)
+        alpha, beta, eps = self._activation_params(x)
+        phases = phases + (1.0 / (beta + eps)) * torch.sin(phases * alpha).pow(2)
+
+        # DownSample1d replicate-pads the interleaved sequence: its first sample is even[0] and its last odd[-1]
+        left = phases[:, 0::2, :1].repeat_interleave(2, dim=1).expand(-1, -1, 3)
+        right = phases[:, 1::2, -1:].repeat_interleave(2, dim=1).expand(-1, -1, 3)
+        phases = torch.cat([left, phases, right], dim=-1)
+        return F.conv1d(phases, down_weight, groups=C)
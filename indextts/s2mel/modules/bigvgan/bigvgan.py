@@ -6,8 +6,9 @@
 
 import os
 import json
+import math
 from pathlib import Path
-from typing import Optional, Union, Dict
+from typing import Optional, Union, Dict, List
 
 import torch
 import torch.nn as nn
@@ -17,6 +18,7 @@ from torch.nn.utils import weight_norm, remove_weight_norm
 from . import activations
 from .utils import init_weights, get_padding
 from .alias_free_activation.torch.act import Activation1d as TorchActivation1d
+from .alias_free_activation.torch.polyphase import PolyphaseActivation1d
 from .env import AttrDict
 
 from huggingface_hub import PyTorchModelHubMixin, hf_hub_download
@@ -98,6 +100,8 @@ class AMPBlock1(torch.nn.Module):
             )
 
             Activation1d = CudaActivation1d
+        elif self.h.get("use_polyphase_activation", False):
+            Activation1d = PolyphaseActivation1d
         else:
             Activation1d = TorchActivation1d
 
@@ -198,6 +202,8 @@ class AMPBlock2(torch.nn.Module):
             )
 
             Activation1d = CudaActivation1d
+        elif self.h.get("use_polyphase_activation", False):
+            Activation1d = PolyphaseActivation1d
         else:
             Activation1d = TorchActivation1d
 
@@ -257,16 +263,18 @@ class BigVGAN(
     Args:
         h (AttrDict): Hyperparameters.
         use_cuda_kernel (bool): If set to True, loads optimized CUDA kernels for AMP. This should be used for inference only, as training is not supported with CUDA kernels.
+        use_polyphase_activation (bool): If set to True, uses the polyphase form of the anti-aliased activations, which avoids the 2x upsampled temporaries (faster on CPU). Ignored when use_cuda_kernel is set.
 
     Note:
         - The `use_cuda_kernel` parameter should be used for inference only, as training with CUDA kernels is not supported.
         - Ensure that the activation function is correctly specified in the hyperparameters (h.activation).
     """
 
-    def __init__(self, h: AttrDict, use_cuda_kernel: bool = False):
+    def __init__(self, h: AttrDict, use_cuda_kernel: bool = False, use_polyphase_activation: bool = False):
         super().__init__()
         self.h = h
         self.h["use_cuda_kernel"] = use_cuda_kernel
+        self.h["use_polyphase_activation"] = use_polyphase_activation
 
         # Select which Activation1d, lazy-load cuda version to ensure backward compatibility
         if self.h.get("use_cuda_kernel", False):
@@ -275,6 +283,8 @@ class BigVGAN(
             )
 
             Activation1d = CudaActivation1d
+        elif self.h.get("use_polyphase_activation", False):
+            Activation1d = PolyphaseActivation1d
         else:
             Activation1d = TorchActivation1d
 
@@ -385,6 +395,80 @@ class BigVGAN(
 
         return x
 
+    def receptive_field_frames(self) -> int:
+        """
+        One-sided receptive field of the generator in mel frames (upper bound): output samples only
+        depend on the mel frames within this distance.
+        """
+        h = self.h
+        # anti-aliased activations: 12-tap filters at 2x, +-6 samples for up and down sampling
+        act_context = 6
+        context = 3.0  # conv_pre, kernel 7
+        upsample = 1
+        for u, k in zip(h.upsample_rates, h.upsample_kernel_sizes):
+            context += math.ceil(k / u) / upsample
+            upsample *= u
+            block_context = 0
+            for rk, dilations in zip(h.resblock_kernel_sizes, h.resblock_dilation_sizes):
+                # (activation, dilated conv, activation, conv) per dilation
+                block_context = max(block_context,
+                                    sum((rk - 1) // 2 * (d + 1) + 2 * act_context for d in dilations))
+            context += block_context / upsample
+        context += (act_context + 3) / upsample  # activation_post, conv_post
+        return math.ceil(context)
+
+    @torch.no_grad()
+    def inference_tiled(self, mels: Union[torch.Tensor, List[torch.Tensor]], tile_frames: int = 256,
+                        overlap_frames: Optional[int] = None, max_batch_tiles: int = 8):
+        """
+        Vocode mel spectrograms tile by tile to bound the peak memory of long sequences.
+
+        Each tile of ``tile_frames`` mel frames is extended by ``overlap_frames`` on both sides
+        (default: ``receptive_field_frames()``) and only the samples of the tile itself are kept,
+        so the stitched waveform matches ``forward`` on the whole sequence up to floating point error.
+
+        Args:
+            mels: [B, num_mels, T] tensor, or a list of [num_mels, T] / [1, num_mels, T] tensors of different lengths.
+                Tiles of all mels are vocoded together, ``max_batch_tiles`` per call. Only windows of the same
+                length share a batch, so no padding is involved.
+        Returns:
+            [B, 1, T * hop] tensor, or a list of [1, 1, T_i * hop] tensors if ``mels`` is a list.
+        """
+        is_list = isinstance(mels, (list, tuple))
+        if not is_list:
+            mels = list(mels)
+        mels = [mel.reshape(mel.size(-2), mel.size(-1)) for mel in mels]
+        if overlap_frames is None:
+            overlap_frames = self.receptive_field_frames()
+        hop = math.prod(self.h.upsample_rates)
+
+        # 按窗口长度分组, 同长度的 tile 合并为一个 batch
+        groups = {}
+        for i, mel in enumerate(mels):
+            num_frames = mel.size(-1)
+            for start in range(0, num_frames, tile_frames):
+                end = min(start + tile_frames, num_frames)
+                win_start, win_end = max(0, start - overlap_frames), min(num_frames, end + overlap_frames)
+                groups.setdefault(win_end - win_start, []).append((i, start, end, win_start, win_end))
+        pieces = {}
+        for group in groups.values():
+            for first in range(0, len(group), max_batch_tiles):
+                chunk = group[first:first + max_batch_tiles]
+                wavs = self(torch.stack([mels[i][:, ws:we] for i, _, _, ws, we in chunk]))
+                for (i, start, end, ws, _), wav in zip(chunk, wavs):
+                    pieces[(i, start)] = wav[:, (start - ws) * hop:(end - ws) * hop]
+
+        outputs = []
+        for i, mel in enumerate(mels):
+            tiles = [pieces[(i, start)] for start in range(0, mel.size(-1), tile_frames)]
+            if tiles:
+                outputs.append(torch.cat(tiles, dim=-1).unsqueeze(0))
+            else:
+                outputs.append(mel.new_zeros(1, 1, 0))
+        if is_list:
+            return outputs
+        return torch.cat(outputs, dim=0)
+
     def remove_weight_norm(self):
         try:
             print("Removing weight norm...")
@@ -425,6 +509,7 @@ class BigVGAN(
             map_location: str = "cpu",  # Additional argument
             strict: bool = False,  # Additional argument
             use_cuda_kernel: bool = False,
+            use_polyphase_activation: bool = False,
             **model_kwargs,
     ):
         """Load Pytorch pretrained weights and return the loaded model."""
@@ -458,7 +543,7 @@ class BigVGAN(
             print(
                 f"[WARNING] For detail, see the official GitHub repository: https://github.com/NVIDIA/BigVGAN?tab=readme-ov-file#using-custom-cuda-kernel-for-synthesis"
             )
-        model = cls(h, use_cuda_kernel=use_cuda_kernel)
+        model = cls(h, use_cuda_kernel=use_cuda_kernel, use_polyphase_activation=use_polyphase_activation)
 
         # Download and load pretrained generator weight
         if os.path.isdir(model_id):
@@ -181,7 +181,8 @@ class DiT(torch.nn.Module):
             self.style_in = nn.Linear(args.style_encoder.dim, args.DiT.hidden_dim)
 
     def setup_caches(self, max_batch_size, max_seq_length):
-        self.transformer.setup_caches(max_batch_size, max_seq_length, use_kv_cache=False)
+        self.transformer.setup_caches(max_batch_size, max_seq_length, use_kv_cache=False,
+                                      use_causal_mask=self.is_causal)
         
     def forward(self, x, prompt_x, x_lens, t, style, cond, mask_content=False):
         """
@@ -218,7 +219,7 @@ class DiT(torch.nn.Module):
         x_in = torch.cat([x, prompt_x, cond], dim=-1) # 80+80+512=672 [2, 1863, 672]
         
         if self.transformer_style_condition and not self.style_as_token: # True and True
-            x_in = torch.cat([x_in, style[:, None, :].repeat(1, T, 1)], dim=-1) #[2, 1863, 864]
+            x_in = torch.cat([x_in, style[:, None, :].expand(-1, T, -1)], dim=-1) #[2, 1863, 864]
             
         if class_dropout: #False
             x_in[..., self.in_channels:] = x_in[..., self.in_channels:] * 0 # 80维后全置为0
@@ -233,10 +234,17 @@ class DiT(torch.nn.Module):
         if self.time_as_token: # False
             x_in = torch.cat([t1.unsqueeze(1), x_in], dim=1)
             
-        x_mask = sequence_mask(x_lens + self.style_as_token + self.time_as_token).to(x.device).unsqueeze(1) #torch.Size([1, 1, 1863])True
+        x_mask = sequence_mask(x_lens + self.style_as_token + self.time_as_token,
+                               max_length=x_in.size(1)).to(x.device).unsqueeze(1) #torch.Size([1, 1, 1863])True
         input_pos = self.input_pos[:x_in.size(1)]  # (T,) range（0，1863）
-        x_mask_expanded = x_mask[:, None, :].repeat(1, 1, x_in.size(1), 1) if not self.is_causal else None # torch.Size([1, 1, 1863, 1863]
-        x_res = self.transformer(x_in, t1.unsqueeze(1), input_pos, x_mask_expanded) # [2, 1863, 512]
+        # key padding mask only: (B, 1, 1, T) broadcasts over heads and queries in SDPA,
+        # and no mask at all when nothing is padded, so that the flash kernel can be used
+        padded = not bool((x_lens >= T).all())
+        if self.is_causal or not padded:
+            attn_mask = None
+        else:
+            attn_mask = x_mask[:, None, :, :]  # torch.Size([B, 1, 1, 1863])
+        x_res = self.transformer(x_in, t1.unsqueeze(1), input_pos, attn_mask) # [2, 1863, 512]
         x_res = x_res[:, 1:] if self.time_as_token else x_res
         x_res = x_res[:, 1:] if self.style_as_token else x_res
         
@@ -245,6 +253,9 @@ class DiT(torch.nn.Module):
         if self.final_layer_type == 'wavenet':
             x = self.conv1(x_res)
             x = x.transpose(1, 2)
+            if padded:
+                # the first WaveNet conv would otherwise see the padded frames of shorter items
+                x = x * x_mask
             t2 = self.t_embedder2(t)
             x = self.wavenet(x, x_mask, g=t2.unsqueeze(2)).transpose(1, 2) + self.res_projection(
                 x_res)  # long residual connection
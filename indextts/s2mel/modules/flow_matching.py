@@ -28,7 +28,8 @@ class BASECFM(torch.nn.Module, ABC):
             self.zero_prompt_speech_token = False
 
     @torch.inference_mode()
-    def inference(self, mu, x_lens, prompt, style, f0, n_timesteps, temperature=1.0, inference_cfg_rate=0.5):
+    def inference(self, mu, x_lens, prompt, style, f0, n_timesteps, temperature=1.0, inference_cfg_rate=0.5,
+                  prompt_lens=None, cancel_check=None, generators=None):
         """Forward diffusion
 
         Args:
@@ -43,18 +44,33 @@ class BASECFM(torch.nn.Module, ABC):
             f0: None
             n_timesteps (int): number of diffusion steps
             temperature (float, optional): temperature for scaling noise. Defaults to 1.0.
+            prompt_lens (torch.Tensor, optional): prompt frames of each item, when the batch mixes prompts of
+                different lengths (``prompt`` right-padded to the longest one). Defaults to ``prompt.size(-1)``.
+                shape: (batch_size,)
+            cancel_check (callable, optional): called before every Euler step, raises to abort the solve.
+            generators (list of torch.Generator, optional): one generator per item for the initial noise, drawn over
+                the ``x_lens[i]`` frames of the item only, so that it does not depend on the rest of the batch.
 
         Returns:
             sample: generated mel-spectrogram
                 shape: (batch_size, 80, mel_timesteps)
         """
         B, T = mu.size(0), mu.size(1)
-        z = torch.randn([B, self.in_channels, T], device=mu.device) * temperature
+        if generators is None:
+            z = torch.randn([B, self.in_channels, T], device=mu.device) * temperature
+        else:
+            z = torch.zeros([B, self.in_channels, T], device=mu.device)
+            for i, generator in enumerate(generators):
+                n = int(x_lens[i])
+                z[i, :, :n] = torch.randn([self.in_channels, n], device=mu.device, generator=generator)
+            z = z * temperature
         t_span = torch.linspace(0, 1, n_timesteps + 1, device=mu.device)
         # t_span = t_span + (-1) * (torch.cos(torch.pi / 2 * t_span) - 1 + t_span)
-        return self.solve_euler(z, x_lens, prompt, mu, style, f0, t_span, inference_cfg_rate)
+        return self.solve_euler(z, x_lens, prompt, mu, style, f0, t_span, inference_cfg_rate, prompt_lens,
+                                cancel_check)
 
-    def solve_euler(self, x, x_lens, prompt, mu, style, f0, t_span, inference_cfg_rate=0.5):
+    def solve_euler(self, x, x_lens, prompt, mu, style, f0, t_span, inference_cfg_rate=0.5, prompt_lens=None,
+                    cancel_check=None):
         """
         Fixed euler solver for ODEs.
         Args:
@@ -69,6 +85,9 @@ class BASECFM(torch.nn.Module, ABC):
                 shape: (batch_size, 80, 795)
             style (torch.Tensor): reference global style
                 shape: (batch_size, 192)
+            prompt_lens (torch.Tensor, optional): prompt frames of each item
+                shape: (batch_size,)
+            cancel_check (callable, optional): called before every Euler step, raises to abort the solve.
         """
         t, _, _ = t_span[0], t_span[-1], t_span[1] - t_span[0]
 
@@ -79,10 +98,21 @@ class BASECFM(torch.nn.Module, ABC):
         prompt_len = prompt.size(-1)
         prompt_x = torch.zeros_like(x)
         prompt_x[..., :prompt_len] = prompt[..., :prompt_len]
-        x[..., :prompt_len] = 0
-        if self.zero_prompt_speech_token:
-            mu[..., :prompt_len] = 0
+        if prompt_lens is None:
+            prompt_mask = None
+            x[..., :prompt_len] = 0
+            if self.zero_prompt_speech_token:
+                mu[..., :prompt_len] = 0
+        else:
+            # per item prompt: (B, 1, T), True on the prompt frames of each item
+            prompt_mask = sequence_mask(prompt_lens, max_length=x.size(-1)).unsqueeze(1)
+            prompt_x.masked_fill_(~prompt_mask, 0)
+            x.masked_fill_(prompt_mask, 0)
+            if self.zero_prompt_speech_token:
+                mu = mu.masked_fill(prompt_mask.transpose(1, 2), 0)
         for step in tqdm(range(1, len(t_span))):
+            if cancel_check is not None:
+                cancel_check()
             dt = t_span[step] - t_span[step - 1]
             if inference_cfg_rate > 0:
                 # Stack original and CFG (null) inputs for batched processing
@@ -90,11 +120,12 @@ class BASECFM(torch.nn.Module, ABC):
                 stacked_style = torch.cat([style, torch.zeros_like(style)], dim=0)
                 stacked_mu = torch.cat([mu, torch.zeros_like(mu)], dim=0)
                 stacked_x = torch.cat([x, x], dim=0)
-                stacked_t = torch.cat([t.unsqueeze(0), t.unsqueeze(0)], dim=0)
+                stacked_x_lens = torch.cat([x_lens, x_lens], dim=0)
+                stacked_t = t.unsqueeze(0).repeat(stacked_x.size(0))
 
                 # Perform a single forward pass for both original and CFG inputs
                 stacked_dphi_dt = self.estimator(
-                    stacked_x, stacked_prompt_x, x_lens, stacked_t, stacked_style, stacked_mu,
+                    stacked_x, stacked_prompt_x, stacked_x_lens, stacked_t, stacked_style, stacked_mu,
                 )
 
                 # Split the output back into the original and CFG components
@@ -103,14 +134,17 @@ class BASECFM(torch.nn.Module, ABC):
                 # Apply CFG formula
                 dphi_dt = (1.0 + inference_cfg_rate) * dphi_dt - inference_cfg_rate * cfg_dphi_dt
             else:
-                dphi_dt = self.estimator(x, prompt_x, x_lens, t.unsqueeze(0), style, mu)
+                dphi_dt = self.estimator(x, prompt_x, x_lens, t.unsqueeze(0).repeat(x.size(0)), style, mu)
 
             x = x + dt * dphi_dt
             t = t + dt
             sol.append(x)
             if step < len(t_span) - 1:
                 dt = t_span[step + 1] - t
-            x[:, :, :prompt_len] = 0
+            if prompt_mask is None:
+                x[:, :, :prompt_len] = 0
+            else:
+                x.masked_fill_(prompt_mask, 0)
 
         return sol[-1]
     def forward(self, x1, x_lens, prompt_lens, mu, style):
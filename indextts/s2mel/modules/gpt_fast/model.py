@@ -128,10 +128,16 @@ class Transformer(nn.Module):
 
         self.freqs_cis: Optional[Tensor] = None
         self.mask_cache: Optional[Tensor] = None
+        self.causal_mask: Optional[Tensor] = None
         self.max_batch_size = -1
         self.max_seq_length = -1
 
-    def setup_caches(self, max_batch_size, max_seq_length, use_kv_cache=True):
+    def setup_caches(self, max_batch_size, max_seq_length, use_kv_cache=True, use_causal_mask=True):
+        """
+        ``use_causal_mask=False`` for bidirectional models: ``forward(mask=None)`` then attends to every position
+        and the (max_seq_length, max_seq_length) causal mask is never allocated.
+        The causal mask and the rotary table are built lazily, sized to what ``forward`` actually sees.
+        """
         if self.max_seq_length >= max_seq_length and self.max_batch_size >= max_batch_size:
             return
         head_dim = self.config.dim // self.config.n_head
@@ -145,10 +151,13 @@ class Transformer(nn.Module):
             for b in self.layers:
                 b.attention.kv_cache = KVCache(max_batch_size, max_seq_length, self.config.n_local_heads, head_dim, dtype).to(device)
 
-        self.freqs_cis = precompute_freqs_cis(self.config.block_size, self.config.head_dim,
-                                              self.config.rope_base, dtype).to(device)
-        self.causal_mask = torch.tril(torch.ones(self.max_seq_length, self.max_seq_length, dtype=torch.bool)).to(device)
+        # kv cache 模式下位置可能到 max_seq_length, 否则按实际序列长度懒加载
+        self.freqs_cis = None
+        self.causal_mask = None
+        if use_kv_cache:
+            self._ensure_freqs_cis(max_seq_length)
         self.use_kv_cache = use_kv_cache
+        self.use_causal_mask = use_causal_mask
         self.uvit_skip_connection = self.config.uvit_skip_connection
         if self.uvit_skip_connection:
             self.layers_emit_skip = [i for i in range(self.config.n_layer) if i < self.config.n_layer // 2]
@@ -157,6 +166,22 @@ class Transformer(nn.Module):
             self.layers_emit_skip = []
             self.layers_receive_skip = []
 
+    def _ensure_freqs_cis(self, seq_len: int):
+        if self.freqs_cis is not None and self.freqs_cis.size(0) >= seq_len:
+            return
+        # 按 8 的倍数增长, 不超过 block_size
+        seq_len = min(find_multiple(seq_len, 8), self.config.block_size)
+        dtype = self.norm.project_layer.weight.dtype
+        device = self.norm.project_layer.weight.device
+        self.freqs_cis = precompute_freqs_cis(seq_len, self.config.head_dim, self.config.rope_base, dtype).to(device)
+
+    def _get_causal_mask(self, seq_len: int) -> Tensor:
+        if self.causal_mask is None or self.causal_mask.size(0) < seq_len:
+            seq_len = max(find_multiple(seq_len, 8), self.max_seq_length if self.use_kv_cache else 0)
+            device = self.norm.project_layer.weight.device
+            self.causal_mask = torch.tril(torch.ones(seq_len, seq_len, dtype=torch.bool, device=device))
+        return self.causal_mask
+
     def forward(self,
                 x: Tensor,
                 c: Tensor,
@@ -166,12 +191,15 @@ class Transformer(nn.Module):
                 context_input_pos: Optional[Tensor] = None,
                 cross_attention_mask: Optional[Tensor] = None,
                 ) -> Tensor:
-        assert self.freqs_cis is not None, "Caches must be initialized first"
-        if mask is None: # in case of non-causal model
+        assert self.max_seq_length > 0, "Caches must be initialized first"
+        if not self.use_kv_cache:
+            # input_pos is arange(seq_len) when there is no kv cache
+            self._ensure_freqs_cis(input_pos.size(0))
+        if mask is None and self.use_causal_mask:
             if not self.training and self.use_kv_cache:
-                mask = self.causal_mask[None, None, input_pos]
+                mask = self._get_causal_mask(self.max_seq_length)[None, None, input_pos]
             else:
-                mask = self.causal_mask[None, None, input_pos]
+                mask = self._get_causal_mask(input_pos.size(0))[None, None, input_pos]
                 mask = mask[..., input_pos]
         freqs_cis = self.freqs_cis[input_pos]
         if context is not None:
@@ -0,0 +1,65 @@
+import threading
+import time
+from typing import Optional
+
+import torch
+from transformers import StoppingCriteria
+
+
+class SynthesisCancelled(RuntimeError):
+    """Raised inside the synthesis loop when its ``CancellationToken`` is cancelled or past its deadline."""
+
+
+class CancellationToken:
+    """
+    Cancellation flag and optional deadline of a synthesis request, shared between the caller (disconnect handlers,
+    request timeouts) and the worker running ``IndexTTS2.infer``, which checks it between segments, between diffusion
+    steps and every few GPT decode steps.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Args:
+            timeout (None | float): seconds from now after which the token counts as cancelled. None: no deadline.
+        """
+        self.deadline = time.monotonic() + timeout if timeout is not None else None
+        self.reason = None
+        self._event = threading.Event()
+
+    def cancel(self, reason: str = "cancelled"):
+        if not self._event.is_set():
+            self.reason = reason
+            self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if not self._event.is_set() and self.deadline is not None and time.monotonic() >= self.deadline:
+            self.cancel("deadline exceeded")
+        return self._event.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, None without deadline."""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def check(self):
+        if self.cancelled:
+            raise SynthesisCancelled(self.reason)
+
+
+class CancellationStoppingCriteria(StoppingCriteria):
+    """
+    Stops ``generate`` once the token is cancelled, checked every ``check_every`` decode steps.
+    The caller raises with ``token.check()`` after ``generate`` returns.
+    """
+
+    def __init__(self, token: CancellationToken, check_every: int = 8):
+        self.token = token
+        self.check_every = max(1, check_every)
+        self._steps = 0
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        self._steps += 1
+        stop = self._steps % self.check_every == 0 and self.token.cancelled
+        return torch.full((input_ids.shape[0],), stop, dtype=torch.bool, device=input_ids.device)
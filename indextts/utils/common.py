@@ -1,6 +1,7 @@
 import os
 import random
 import re
+from typing import Optional
 
 import torch
 import torchaudio
@@ -119,3 +120,32 @@ def safe_log(x: torch.Tensor, clip_val: float = 1e-7) -> torch.Tensor:
         Tensor: Element-wise logarithm of the input tensor with clipping applied.
     """
     return torch.log(torch.clip(x, min=clip_val))
+
+
+def resolve_autocast_dtype(precision, device) -> Optional[torch.dtype]:
+    """
+    Map a precision name ("fp32" | "fp16" | "bf16" | None) to the autocast dtype usable on ``device``.
+    Returns None (run in fp32) when the device does not support the requested precision.
+    """
+    if precision in (None, "fp32", "float32"):
+        return None
+    device_type = torch.device(device).type
+    if precision in ("fp16", "float16"):
+        if device_type in ("cuda", "xpu"):
+            return torch.float16
+    elif precision in ("bf16", "bfloat16"):
+        if device_type == "cuda" and torch.cuda.is_bf16_supported():
+            return torch.bfloat16
+        if device_type == "xpu":
+            return torch.bfloat16
+        if device_type == "cpu":
+            try:
+                supported = torch.ops.mkldnn._is_mkldnn_bf16_supported()
+            except (AttributeError, RuntimeError):
+                supported = False
+            if supported:
+                return torch.bfloat16
+    else:
+        raise ValueError(f"Unknown precision: {precision}, expected one of fp32, fp16, bf16")
+    print(f">> {precision} is not supported on {device}, falling back to fp32")
+    return None
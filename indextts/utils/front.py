@@ -2,11 +2,53 @@
 import os
 import traceback
 import re
-from typing import List, Union, overload
+from typing import Iterable, Iterator, List, Union, overload
 import warnings
 from indextts.utils.common import tokenize_by_CJK_char, de_tokenized_by_CJK_char
 from sentencepiece import SentencePieceProcessor
 
+# 句末标点之后（英文句号须后跟空白，避免切开小数/缩写中的"."）
+SENTENCE_END_PATTERN = re.compile(r"(?<=[。！？!?…])|(?<=\.)(?=\s)")
+# 以句末标点结尾的行
+SENTENCE_TERMINATED_PATTERN = re.compile(r"[。！？!?….]\s*$")
+
+
+def _split_long_chunk(chunk: str, max_chunk_chars: int) -> Iterator[str]:
+    if len(chunk) <= max_chunk_chars:
+        yield chunk
+        return
+    part = ""
+    for sentence in SENTENCE_END_PATTERN.split(chunk):
+        if part and len(part) + len(sentence) > max_chunk_chars:
+            yield part
+            part = ""
+        part += sentence
+    if part.strip():
+        yield part
+
+
+def iter_text_chunks(text: str, max_chunk_chars: int = 2000) -> Iterator[str]:
+    """
+    逐段产出文本：按行读取，跳过空行；不以句末标点结尾的行与后面的行连接（换行保留，正则化时与整体处理一样变成空格），
+    因此块边界都落在句末，不会在行尾多出句子边界。超过 ``max_chunk_chars`` 的段落在句末标点处
+    再切成不超过该长度的块（没有句末标点时保留整段），未结束的最后一句留到与下一行连接。每块单独做文本正则化和分词。
+    """
+    paragraph = ""
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        paragraph = f"{paragraph}\n{line}" if paragraph else line
+        if SENTENCE_TERMINATED_PATTERN.search(line):
+            yield from _split_long_chunk(paragraph, max_chunk_chars)
+            paragraph = ""
+        elif len(paragraph) > max_chunk_chars:
+            sentences = SENTENCE_END_PATTERN.split(paragraph)
+            head, paragraph = "".join(sentences[:-1]), sentences[-1]
+            if head:
+                yield from _split_long_chunk(head, max_chunk_chars)
+    if paragraph.strip():
+        yield from _split_long_chunk(paragraph, max_chunk_chars)
+
 
 class TextNormalizer:
     def __init__(self):
@@ -351,6 +393,18 @@ class TextTokenizer:
         # 处理特殊情况
         if len(tokenized_str) == 0:
             return []
+        return list(TextTokenizer.merge_segments(
+            TextTokenizer._split_by_token(tokenized_str, split_tokens, max_text_tokens_per_segment),
+            max_text_tokens_per_segment,
+        ))
+
+    @staticmethod
+    def _split_by_token(
+        tokenized_str: List[str], split_tokens: List[str], max_text_tokens_per_segment: int
+    ) -> List[List[str]]:
+        """
+        按特定token切分，不合并相邻的短句
+        """
         segments: List[List[str]] = []
         current_segment = []
         current_segment_tokens_len = 0
@@ -400,18 +454,27 @@ class TextTokenizer:
         if current_segment_tokens_len > 0:
             assert current_segment_tokens_len <= max_text_tokens_per_segment
             segments.append(current_segment)
-        # 如果相邻的句子加起来长度小于最大限制，则合并
-        merged_segments = []
+        return segments
+
+    @staticmethod
+    def merge_segments(segments: Iterable[List[str]], max_text_tokens_per_segment: int) -> Iterator[List[str]]:
+        """
+        如果相邻的句子加起来长度小于最大限制，则合并。
+        逐段产出，原地extend，总耗时与token数成线性关系
+        """
+        current = None
         for segment in segments:
             if len(segment) == 0:
                 continue
-            if len(merged_segments) == 0:
-                merged_segments.append(segment)
-            elif len(merged_segments[-1]) + len(segment) <= max_text_tokens_per_segment:
-                merged_segments[-1] = merged_segments[-1] + segment
+            if current is None:
+                current = list(segment)
+            elif len(current) + len(segment) <= max_text_tokens_per_segment:
+                current.extend(segment)
             else:
-                merged_segments.append(segment)
-        return merged_segments
+                yield current
+                current = list(segment)
+        if current is not None:
+            yield current
 
     punctuation_marks_tokens = [
         ".",
@@ -427,6 +490,21 @@ class TextTokenizer:
             tokenized, self.punctuation_marks_tokens, max_text_tokens_per_segment=max_text_tokens_per_segment
         )
 
+    def iter_segments(self, text: str, max_text_tokens_per_segment=120, max_chunk_chars=2000) -> Iterator[List[str]]:
+        """
+        流式分句：逐段（见 ``iter_text_chunks``）正则化、分词并切分，相邻短句跨段合并后逐句产出，
+        长文本不必整体正则化/分词即可开始合成，内存占用与文本长度无关。
+        块边界都在句末（未结束的行与下一行连接），与 ``split_segments(tokenize(text))`` 的区别在于
+        正则化的语言判断按块进行。
+        """
+        def sentences():
+            for chunk in iter_text_chunks(text, max_chunk_chars):
+                yield from TextTokenizer._split_by_token(
+                    self.tokenize(chunk), self.punctuation_marks_tokens, max_text_tokens_per_segment
+                )
+
+        return TextTokenizer.merge_segments(sentences(), max_text_tokens_per_segment)
+
 
 if __name__ == "__main__":
     # 测试程序
@@ -0,0 +1,141 @@
+import math
+import threading
+from typing import Dict, List, Optional
+
+# semantic codes are 50Hz, mel frames are 22050 / 256 Hz
+CODE_TO_MEL_RATIO = 1.72
+
+# 质量从高到低的候选配置, 延迟预算模式下选择第一个预计能在预算内完成的配置
+QUALITY_TIERS = (
+    {"diffusion_steps": 25, "inference_cfg_rate": 0.7, "num_beams": 3},
+    {"diffusion_steps": 16, "inference_cfg_rate": 0.7, "num_beams": 3},
+    {"diffusion_steps": 16, "inference_cfg_rate": 0.7, "num_beams": 1},
+    {"diffusion_steps": 10, "inference_cfg_rate": 0.7, "num_beams": 1},
+    {"diffusion_steps": 10, "inference_cfg_rate": 0.0, "num_beams": 1},
+    {"diffusion_steps": 6, "inference_cfg_rate": 0.0, "num_beams": 1},
+)
+
+
+def diffusion_evaluations(diffusion_steps: int, inference_cfg_rate: float) -> int:
+    # CFG runs the conditional and the unconditional estimator in one doubled batch
+    return diffusion_steps * (2 if inference_cfg_rate > 0 else 1)
+
+
+class LatencyPlanner:
+    """
+    Cost model of the IndexTTS2 stages on the current hardware, used to pick the generation settings of a request
+    with a latency budget among the fixed ``QUALITY_TIERS``. The model only has per-unit costs, exponential moving
+    averages of the per-stage ``stats`` of finished requests; it assumes the request runs alone on the instance
+    (inference is serialized, callers waiting for the engine subtract their wait from the budget).
+
+    Unit costs (seconds):
+        gpt_step[num_beams]: one autoregressive GPT step
+        gpt_forward: GPT latent pass, per code
+        s2mel: one estimator evaluation, per mel frame (prompt included)
+        bigvgan: per mel frame
+    plus the number of codes generated per text token, to predict the audio length from the text.
+    """
+
+    def __init__(self, smoothing: float = 0.2, headroom: float = 0.8, max_tokens_margin: float = 2.0):
+        """
+        Args:
+            smoothing (float): weight of the newest observation in the moving averages.
+            headroom (float): fraction of the budget the predicted time may use, the rest absorbs the variance
+                of the generation length and keeps the tail latency under the budget.
+            max_tokens_margin (float): ``max_mel_tokens`` is capped to this many times the predicted codes of the
+                longest segment, so a runaway generation cannot blow the budget.
+        """
+        self.smoothing = smoothing
+        self.headroom = headroom
+        self.max_tokens_margin = max_tokens_margin
+        self.gpt_step: Dict[int, float] = {}
+        self.gpt_forward: Optional[float] = None
+        self.s2mel: Optional[float] = None
+        self.bigvgan: Optional[float] = None
+        self.codes_per_text_token: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _update(self, current: Optional[float], value: float) -> float:
+        if current is None:
+            return value
+        return (1 - self.smoothing) * current + self.smoothing * value
+
+    @property
+    def ready(self) -> bool:
+        return self.s2mel is not None and self.bigvgan is not None and bool(self.gpt_step)
+
+    def observe(self, stats: Dict, num_beams: int, diffusion_steps: int, inference_cfg_rate: float):
+        """
+        Update the cost model with the ``stats`` of a finished request.
+        ``stats`` holds the stage times and the work counters filled by ``IndexTTS2``:
+        text_tokens, gpt_steps, codes, s2mel_frames, mel_frames.
+        """
+        with self._lock:
+            if stats.get("gpt_steps"):
+                self.gpt_step[num_beams] = self._update(
+                    self.gpt_step.get(num_beams), stats["gpt_gen_time"] / stats["gpt_steps"])
+            if stats.get("codes"):
+                self.gpt_forward = self._update(self.gpt_forward, stats["gpt_forward_time"] / stats["codes"])
+                if stats.get("text_tokens"):
+                    self.codes_per_text_token = self._update(self.codes_per_text_token,
+                                                             stats["codes"] / stats["text_tokens"])
+            if stats.get("s2mel_frames"):
+                nfe = diffusion_evaluations(diffusion_steps, inference_cfg_rate)
+                self.s2mel = self._update(self.s2mel, stats["s2mel_time"] / (stats["s2mel_frames"] * nfe))
+            if stats.get("mel_frames"):
+                self.bigvgan = self._update(self.bigvgan, stats["bigvgan_time"] / stats["mel_frames"])
+
+    def _gpt_step_cost(self, num_beams: int) -> float:
+        if num_beams in self.gpt_step:
+            return self.gpt_step[num_beams]
+        # beams are decoded as a batch: scale linearly from the closest measured beam count (pessimistic on GPU)
+        measured = min(self.gpt_step, key=lambda b: abs(b - num_beams))
+        return self.gpt_step[measured] * num_beams / measured
+
+    def estimate(self, segment_text_tokens: List[int], prompt_frames: int, num_beams: int, diffusion_steps: int,
+                 inference_cfg_rate: float) -> float:
+        """
+        Predicted synthesis time (seconds) of a request, given the text tokens of each segment.
+        """
+        codes = [n * self.codes_per_text_token for n in segment_text_tokens]
+        mel_frames = sum(c * CODE_TO_MEL_RATIO for c in codes)
+        nfe = diffusion_evaluations(diffusion_steps, inference_cfg_rate)
+        return (
+            sum(codes) * (self._gpt_step_cost(num_beams) + self.gpt_forward)
+            + (mel_frames + prompt_frames * len(codes)) * nfe * self.s2mel
+            + mel_frames * self.bigvgan
+        )
+
+    def plan(self, segment_text_tokens: List[int], prompt_frames: int, latency_budget: float,
+             max_mel_tokens: int = 1500, tiers=QUALITY_TIERS) -> Optional[Dict]:
+        """
+        Pick the highest quality tier whose predicted time fits in ``headroom * latency_budget``
+        (the lowest tier when none fits), and cap ``max_mel_tokens``.
+        Returns None while the cost model has no measurement yet.
+        """
+        with self._lock:
+            if not self.ready or self.codes_per_text_token is None or not segment_text_tokens:
+                return None
+            budget = self.headroom * latency_budget
+            chosen, estimated = None, math.inf
+            for tier in tiers:
+                chosen = tier
+                estimated = self.estimate(segment_text_tokens, prompt_frames, tier["num_beams"],
+                                          tier["diffusion_steps"], tier["inference_cfg_rate"])
+                if estimated <= budget:
+                    break
+            max_codes = max(segment_text_tokens) * self.codes_per_text_token
+            plan = dict(chosen)
+            plan["max_mel_tokens"] = max(1, min(max_mel_tokens, math.ceil(self.max_tokens_margin * max_codes)))
+            plan["estimated_time"] = estimated
+            return plan
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {
+                "gpt_step": dict(self.gpt_step),
+                "gpt_forward": self.gpt_forward,
+                "s2mel": self.s2mel,
+                "bigvgan": self.bigvgan,
+                "codes_per_text_token": self.codes_per_text_token,
+            }
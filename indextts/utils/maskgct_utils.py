@@ -84,8 +84,25 @@ class JsonHParams:
         return self.__dict__.__repr__()
 
 
-def build_semantic_model(path_='./models/tts/maskgct/ckpt/wav2vec2bert_stats.pt'):
+def truncate_semantic_model(semantic_model, output_layer):
+    """
+    Drop the w2v-bert encoder layers above ``output_layer``, so that the model output
+    ``last_hidden_state`` equals ``hidden_states[output_layer]`` of the full model.
+    """
+    encoder = semantic_model.encoder
+    assert 0 < output_layer <= len(encoder.layers), f"output_layer {output_layer} out of range"
+    assert semantic_model.adapter is None and getattr(semantic_model, "intermediate_ffn", None) is None, \
+        "early exit is only valid without adapter / intermediate_ffn"
+    encoder.layers = encoder.layers[:output_layer]
+    semantic_model.config.num_hidden_layers = output_layer
+    return semantic_model
+
+
+def build_semantic_model(path_='./models/tts/maskgct/ckpt/wav2vec2bert_stats.pt', output_layer=None):
     semantic_model = Wav2Vec2BertModel.from_pretrained("facebook/w2v-bert-2.0")
+    if output_layer is not None:
+        # 只保留实际使用到的层, 上层不再计算也不占显存
+        semantic_model = truncate_semantic_model(semantic_model, output_layer)
     semantic_model.eval()
     stat_mean_var = torch.load(path_)
     semantic_mean = stat_mean_var["mean"]
@@ -0,0 +1,235 @@
+import math
+import re
+import threading
+from typing import Dict, Iterable, List, Optional
+
+import torch
+from transformers import LogitsProcessor
+
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+# 每个文本token生成的语义码数（50Hz）的先验，按语言；之后由实际生成长度在线校准
+DEFAULT_CODES_PER_TEXT_TOKEN = {"zh": 11.0, "en": 12.0}
+
+
+def _token_list(text_tokens) -> List[int]:
+    if torch.is_tensor(text_tokens):
+        return text_tokens.flatten().tolist()
+    return list(text_tokens)
+
+
+class MelTokenBudget:
+    """
+    Per-segment ``max_mel_tokens``, predicted from the number of text tokens and the language of the segment instead
+    of a fixed cap, so a runaway generation that never emits ``stop_mel_token`` stops after about ``slack`` times
+    the expected length, and batches can be sized from the predicted lengths.
+
+    The codes generated per text token start from a per-language prior and are refined from the segments that end
+    with ``stop_mel_token`` (exponential moving average of every speaker and request, within ``[0.5, 2]`` times the
+    prior). The calibrated rate only ever raises a budget: it is floored at the prior, so a fast speaker cannot
+    tighten the budget of a slower one below ``slack`` times the prior. ``predict(calibrated=False)`` uses the
+    priors alone, for requests that must render the same on every instance (seeded requests, cached results).
+    """
+
+    def __init__(self, cjk_token_ids: Iterable[int] = (), slack: float = 2.0, min_tokens: int = 50,
+                 smoothing: float = 0.1, codes_per_text_token: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            cjk_token_ids: ids of the text tokens holding CJK characters, a segment with at least half of them
+                counts as "zh", otherwise as "en".
+            slack (float): budget = ``slack`` * predicted codes + ``min_tokens``.
+            min_tokens (int): codes added to every budget, covers the pauses of very short segments.
+            smoothing (float): weight of the newest observation in the moving averages.
+            codes_per_text_token: priors per language, default ``DEFAULT_CODES_PER_TEXT_TOKEN``.
+        """
+        self.cjk_token_ids = frozenset(cjk_token_ids)
+        self.slack = slack
+        self.min_tokens = min_tokens
+        self.smoothing = smoothing
+        self.priors = dict(codes_per_text_token or DEFAULT_CODES_PER_TEXT_TOKEN)
+        self.codes_per_text_token = dict(self.priors)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_tokenizer(cls, tokenizer, **kwargs) -> "MelTokenBudget":
+        """Build the CJK token set from the vocabulary of a ``TextTokenizer``."""
+        cjk_token_ids = [i for i in range(tokenizer.vocab_size)
+                         if CJK_PATTERN.search(tokenizer.convert_ids_to_tokens(i))]
+        return cls(cjk_token_ids, **kwargs)
+
+    def language(self, text_tokens) -> str:
+        tokens = _token_list(text_tokens)
+        cjk = sum(1 for t in tokens if t in self.cjk_token_ids)
+        return "zh" if tokens and 2 * cjk >= len(tokens) else "en"
+
+    @property
+    def settings(self) -> Dict:
+        """Everything an uncalibrated budget depends on, for cache keys."""
+        return {"slack": self.slack, "min_tokens": self.min_tokens, "priors": dict(self.priors)}
+
+    def predict(self, text_tokens, max_mel_tokens: Optional[int] = None, calibrated: bool = True) -> int:
+        """
+        Budget of a segment (number of codes), capped to ``max_mel_tokens``.
+        ``calibrated``: use the calibrated rate (never below the prior), else the prior of the segment language.
+        """
+        tokens = _token_list(text_tokens)
+        lang = self.language(tokens)
+        rate = self.priors[lang]
+        if calibrated:
+            with self._lock:
+                rate = max(rate, self.codes_per_text_token[lang])
+        budget = math.ceil(self.slack * rate * len(tokens)) + self.min_tokens
+        if max_mel_tokens is not None:
+            budget = min(budget, max_mel_tokens)
+        return max(1, budget)
+
+    def observe(self, text_tokens, codes: int):
+        """Update the rate of the segment language with a generation that ended with ``stop_mel_token``."""
+        tokens = _token_list(text_tokens)
+        if not tokens or codes <= 0:
+            return
+        lang = self.language(tokens)
+        prior = self.priors[lang]
+        value = min(max(codes / len(tokens), 0.5 * prior), 2.0 * prior)
+        with self._lock:
+            current = self.codes_per_text_token[lang]
+            self.codes_per_text_token[lang] = (1 - self.smoothing) * current + self.smoothing * value
+
+    def summary(self) -> Dict:
+        with self._lock:
+            return {"slack": self.slack, "min_tokens": self.min_tokens,
+                    "codes_per_text_token": dict(self.codes_per_text_token)}
+
+
+def repetition_start(codes: torch.Tensor, min_span: int = 150, max_period: int = 25, max_distinct: int = 8,
+                     ignore_token: Optional[int] = None, max_ignore_ratio: float = 0.8) -> Optional[int]:
+    """
+    Start of the degenerate tail of a 1-D code sequence, or None:
+    - an exact loop: the last ``min_span`` or more codes repeat with a period of at most ``max_period``
+      (one period is kept, the rest is cut), or
+    - a near loop: the last ``min_span`` codes hold at most ``max_distinct`` distinct values.
+    Tails made mostly (more than ``max_ignore_ratio``) of ``ignore_token`` are pauses, not loops: silence is
+    shortened by ``remove_long_silence`` and a long pause may hold a few breath/noise codes.
+    """
+    n = codes.numel()
+    if n < min_span:
+        return None
+    tail = codes[-min_span:]
+    if ignore_token is not None and (tail == ignore_token).float().mean().item() > max_ignore_ratio:
+        return None
+    for period in range(1, min(max_period, n - 1) + 1):
+        same = codes[period:] == codes[:-period]
+        # 末尾连续满足 codes[t] == codes[t - period] 的长度
+        run = int(same.flip(0).int().cumprod(0).sum()) + period
+        if run >= min_span:
+            return n - run + period
+    if int(tail.unique().numel()) <= max_distinct:
+        return n - min_span
+    return None
+
+
+class MelBudgetLogitsProcessor(LogitsProcessor):
+    """
+    Forces ``stop_token`` on the rows of ``generate`` that generated their own mel token budget, so every segment
+    of a batch stops at its budget, with sampling as with beam search (a stopping criterion only ends a beam search
+    once every beam is stopped, i.e. at the largest budget of the batch).
+    One instance per ``generate`` call: the prompt length is taken from the first call.
+
+    ``budgets``: budget of every batch item, repeated for the beams / returned sequences of the item.
+    """
+
+    def __init__(self, stop_token: int, budgets: List[int]):
+        self.stop_token = stop_token
+        self.budgets = budgets
+        self._prompt_length = None
+        self._budgets = None
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prompt_length is None:
+            self._prompt_length = input_ids.shape[1]
+        if self._budgets is None:
+            budgets = torch.tensor(self.budgets, device=input_ids.device)
+            self._budgets = budgets.repeat_interleave(max(1, input_ids.shape[0] // budgets.numel()))
+        over = (input_ids.shape[1] - self._prompt_length) >= self._budgets
+        if over.any():
+            forced = torch.full_like(scores[over], -float("inf"))
+            forced[:, self.stop_token] = 0
+            scores = scores.clone()
+            scores[over] = forced
+        return scores
+
+
+class DegenerateDecodeLogitsProcessor(LogitsProcessor):
+    """
+    Forces ``stop_token`` on the rows of ``generate`` that fell into a repetition loop (see ``repetition_start``),
+    instead of letting them run to their mel token budget or the global ``max_length``. A logits processor rather
+    than a stopping criterion, which would only end a beam search (or a batch) once every row is stopped.
+    One instance per ``generate`` call: the prompt length is taken from the first call.
+
+    ``stop_token``: ``stop_mel_token``, also the padding of the finished rows.
+    ``batch_size``: number of batch items, the rows of an item (beams / returned sequences) are consecutive.
+    The loop check runs every ``check_every`` decode steps on the last ``min_span`` codes of every row; under beam
+    search the rows are reordered between steps, so a row is only forced on the step its loop is detected.
+    """
+
+    def __init__(self, stop_token: int, batch_size: int = 1, min_span: int = 150, max_period: int = 25,
+                 max_distinct: int = 8, ignore_token: Optional[int] = None, max_ignore_ratio: float = 0.8,
+                 check_every: int = 4):
+        self.stop_token = stop_token
+        self.batch_size = max(1, batch_size)
+        self.min_span = min_span
+        self.max_period = max_period
+        self.max_distinct = max_distinct
+        self.ignore_token = ignore_token
+        self.max_ignore_ratio = max_ignore_ratio
+        self.check_every = max(1, check_every)
+        self._prompt_length = None
+        self._looped_items = torch.zeros(self.batch_size, dtype=torch.bool)
+
+    @property
+    def loops(self) -> int:
+        """Number of batch items (segments) with at least one row stopped in a repetition loop."""
+        return int(self._looped_items.sum())
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor) -> torch.FloatTensor:
+        if self._prompt_length is None:
+            self._prompt_length = input_ids.shape[1]
+        generated = input_ids.shape[1] - self._prompt_length
+        if generated < self.min_span or generated % self.check_every != 0:
+            return scores
+        tail = input_ids[:, -self.min_span:]
+        looping = torch.zeros(input_ids.shape[0], dtype=torch.bool, device=input_ids.device)
+        for period in range(1, self.max_period + 1):
+            looping |= (tail[:, period:] == tail[:, :-period]).all(dim=1)
+        distinct = (tail.sort(dim=1).values.diff(dim=1) != 0).sum(dim=1) + 1
+        looping |= distinct <= self.max_distinct
+        if self.ignore_token is not None:
+            looping &= (tail == self.ignore_token).float().mean(dim=1) <= self.max_ignore_ratio
+        # 已结束的行之后填充的是 stop_token，不算循环
+        looping &= input_ids[:, -1] != self.stop_token
+        if not looping.any():
+            return scores
+        rows_per_item = max(1, input_ids.shape[0] // self.batch_size)
+        self._looped_items |= looping.view(-1, rows_per_item).any(dim=1).cpu()
+        forced = torch.full_like(scores[looping], -float("inf"))
+        forced[:, self.stop_token] = 0
+        scores = scores.clone()
+        scores[looping] = forced
+        return scores
+
+    def trim(self, codes: torch.Tensor) -> torch.Tensor:
+        """
+        Cut the repetition loop at the end of every row of the generated ``codes`` [B, T] (the rows end at their
+        first ``stop_token``), by overwriting it with ``stop_token``. No-op when no loop was detected.
+        """
+        if not self.loops:
+            return codes
+        codes = codes.clone()
+        is_stop = codes == self.stop_token
+        lens = torch.where(is_stop.any(dim=1), is_stop.int().argmax(dim=1), codes.size(1)).tolist()
+        for i, length in enumerate(lens):
+            start = repetition_start(codes[i, :length], self.min_span, self.max_period, self.max_distinct,
+                                     self.ignore_token, self.max_ignore_ratio)
+            if start is not None:
+                codes[i, start:] = self.stop_token
+        return codes
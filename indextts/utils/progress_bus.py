@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import threading
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+SendProgress = Callable[[float, str], Awaitable]
+
+
+class _TaskProgress:
+    __slots__ = ("loop", "send", "pending", "scheduled", "last_sent", "last_progress")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, send: SendProgress):
+        self.loop = loop
+        self.send = send
+        self.pending: Optional[Tuple[float, str]] = None
+        self.scheduled = False
+        self.last_sent = float("-inf")
+        self.last_progress = float("-inf")
+
+
+class ProgressBus:
+    """
+    Progress updates from the synthesis threads to the event loop that owns the WebSockets.
+
+    ``publisher(task_id, send)`` returns a plain callable that any thread (e.g. the executor running
+    ``IndexTTS2.infer``) can call: it only records the latest update of the task and, if no delivery is pending,
+    schedules one with ``loop.call_soon_threadsafe``. Deliveries run on the loop at most every ``min_interval``
+    seconds per task and one at a time, so a burst of updates collapses into its latest value instead of a
+    message storm, and a slow client never blocks the inference thread. Updates that go backwards are dropped.
+    """
+
+    def __init__(self, min_interval: float = 0.2):
+        self.min_interval = min_interval
+        self.published = 0
+        self.delivered = 0
+        self._tasks: Dict[str, _TaskProgress] = {}
+        self._lock = threading.Lock()
+
+    def publisher(self, task_id: str, send: SendProgress) -> Callable[[float, str], None]:
+        """
+        Register a task and return its thread-safe progress callback ``(progress, message)``.
+        Must be called from the event loop thread; ``send(progress, message)`` is awaited there.
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._tasks[task_id] = _TaskProgress(loop, send)
+
+        def publish(progress: float, message: str = "") -> None:
+            self.publish(task_id, progress, message)
+
+        return publish
+
+    def publish(self, task_id: str, progress: float, message: str = "") -> None:
+        """Thread-safe, never blocks on the delivery."""
+        with self._lock:
+            state = self._tasks.get(task_id)
+            if state is None or progress < state.last_progress:
+                return
+            self.published += 1
+            state.last_progress = progress
+            state.pending = (progress, message)
+            if state.scheduled:
+                return
+            state.scheduled = True
+        try:
+            state.loop.call_soon_threadsafe(self._schedule, task_id, state)
+        except RuntimeError:
+            # 事件循环已关闭
+            self.discard(task_id)
+
+    def _schedule(self, task_id: str, state: _TaskProgress):
+        delay = max(0.0, state.last_sent + self.min_interval - state.loop.time())
+        state.loop.call_later(delay, lambda: state.loop.create_task(self._deliver(task_id, state)))
+
+    async def _deliver(self, task_id: str, state: _TaskProgress):
+        with self._lock:
+            update, state.pending = state.pending, None
+        if update is not None and self._tasks.get(task_id) is state:
+            state.last_sent = state.loop.time()
+            try:
+                await state.send(*update)
+                self.delivered += 1
+            except Exception as e:
+                logger.warning(f"progress delivery failed: {task_id}: {e}")
+        with self._lock:
+            # 发送期间到达的更新：再调度一次，保证同一任务的消息按顺序、一次一条
+            if state.pending is None or self._tasks.get(task_id) is not state:
+                state.scheduled = False
+                return
+        self._schedule(task_id, state)
+
+    def discard(self, task_id: str):
+        """Unregister a task and drop its pending update."""
+        with self._lock:
+            self._tasks.pop(task_id, None)
+
+    async def close(self, task_id: str, flush: bool = True):
+        """
+        Unregister a task, e.g. before its completion/error message. With ``flush``, its last pending update is
+        delivered first.
+        """
+        with self._lock:
+            state = self._tasks.pop(task_id, None)
+            update = state.pending if state is not None else None
+            if state is not None:
+                state.pending = None
+        if flush and update is not None:
+            try:
+                await state.send(*update)
+                self.delivered += 1
+            except Exception as e:
+                logger.warning(f"progress delivery failed: {task_id}: {e}")
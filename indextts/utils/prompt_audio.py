@@ -0,0 +1,104 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import librosa
+import numpy as np
+import torch
+import torchaudio
+
+
+def trim_silence(audio: np.ndarray, sr: int, top_db: float = 40.0, margin_s: float = 0.1) -> np.ndarray:
+    """
+    Remove the leading and trailing silence (frames more than ``top_db`` below the peak) of a mono signal,
+    keeping ``margin_s`` seconds on each side. Silence inside the utterance is kept.
+    """
+    if audio.size == 0:
+        return audio
+    _, (start, end) = librosa.effects.trim(audio, top_db=top_db)
+    margin = int(margin_s * sr)
+    return audio[max(0, start - margin):min(audio.size, end + margin)]
+
+
+def normalize_loudness(audio: np.ndarray, target_dbfs: float = -20.0, peak: float = 0.95,
+                       max_gain_db: float = 20.0, top_db: float = 40.0) -> np.ndarray:
+    """
+    Scale a mono signal so that the RMS of its active frames (within ``top_db`` of the loudest frame) is
+    ``target_dbfs``. The gain is limited to ``max_gain_db`` (no noise floor blow-up) and to keep the peak under ``peak``.
+    """
+    if audio.size == 0:
+        return audio
+    frame_rms = librosa.feature.rms(y=audio)[0]
+    if frame_rms.max() <= 0:
+        return audio
+    active = frame_rms[frame_rms >= frame_rms.max() * 10 ** (-top_db / 20)]
+    rms = float(np.sqrt(np.mean(active ** 2)))
+    gain_db = min(target_dbfs - 20 * np.log10(rms), max_gain_db)
+    gain = 10 ** (gain_db / 20)
+    audio_peak = float(np.abs(audio).max())
+    if audio_peak * gain > peak:
+        gain = peak / audio_peak
+    return (audio * gain).astype(np.float32)
+
+
+def prepare_prompt_audio(audio: np.ndarray, sr: int, trim: bool = True, normalize: bool = True,
+                         max_seconds: Optional[float] = None) -> np.ndarray:
+    if trim:
+        audio = trim_silence(audio, sr)
+    if normalize:
+        audio = normalize_loudness(audio)
+    if max_seconds is not None:
+        audio = audio[:int(max_seconds * sr)]
+    return audio
+
+
+def prepare_prompt_file(src_path: str, dst_path: Optional[str] = None, trim: bool = True,
+                        normalize: bool = True) -> str:
+    """
+    Ingest a reference audio: trim the leading/trailing silence, normalize the loudness and write it as a
+    mono wav at its original sampling rate. Without ``dst_path``, the source is replaced by a ``.wav`` file
+    with the same stem. Returns the path of the prepared file.
+    """
+    audio, sr = librosa.load(src_path, sr=None, mono=True)
+    audio = prepare_prompt_audio(audio, sr, trim=trim, normalize=normalize)
+    replace_src = dst_path is None
+    if replace_src:
+        dst_path = os.path.splitext(src_path)[0] + ".wav"
+    torchaudio.save(dst_path, torch.from_numpy(np.ascontiguousarray(audio)).unsqueeze(0), sr)
+    if replace_src and os.path.abspath(dst_path) != os.path.abspath(src_path):
+        os.remove(src_path)
+    return dst_path
+
+
+class PromptAudioCache:
+    """
+    LRU cache of prepared reference audios, keyed by (path, modification time, sampling rate), so the decoding,
+    resampling, trimming and loudness normalization of a prompt run once however often it is used.
+    """
+
+    def __init__(self, max_entries: int = 32, trim: bool = True, normalize: bool = True):
+        self.max_entries = max_entries
+        self.trim = trim
+        self.normalize = normalize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def load(self, audio_path: str, sr: int = 22050, max_seconds: Optional[float] = None) -> torch.Tensor:
+        """
+        Returns the prepared audio as a float tensor of shape (1, samples) at ``sr``.
+        """
+        stat = os.stat(audio_path)
+        key = (os.path.abspath(audio_path), stat.st_mtime_ns, stat.st_size, sr, max_seconds)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        audio, _ = librosa.load(audio_path, sr=sr)
+        audio = prepare_prompt_audio(audio, sr, trim=self.trim, normalize=self.normalize, max_seconds=max_seconds)
+        audio = torch.from_numpy(np.ascontiguousarray(audio)).unsqueeze(0)
+        with self._lock:
+            self._entries[key] = audio
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return audio
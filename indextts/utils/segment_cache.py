@@ -0,0 +1,113 @@
+import hashlib
+import json
+import os
+import threading
+from typing import Optional
+
+import numpy as np
+import torch
+
+
+def tensor_digest(*tensors) -> str:
+    """
+    Content hash of tensors (shape, dtype and values), e.g. of the speaker/emotion conditionings of a request.
+    """
+    h = hashlib.sha256()
+    for t in tensors:
+        if t is None:
+            h.update(b"none")
+            continue
+        t = t.detach().cpu().contiguous()
+        h.update(f"{tuple(t.shape)}{t.dtype}".encode())
+        h.update(t.float().numpy().tobytes())
+    return h.hexdigest()
+
+
+def derive_seed(seed: int, *parts) -> int:
+    """
+    Seed derived from a base seed and the content of a unit of work (e.g. the text tokens of a segment), so that
+    the same segment gets the same seed wherever it appears in a document.
+    """
+    payload = json.dumps([seed, *parts], sort_keys=True, default=str).encode()
+    return int.from_bytes(hashlib.sha256(payload).digest()[:8], "little") & ((1 << 63) - 1)
+
+
+class SegmentAudioCache:
+    """
+    On-disk cache of the waveform of synthesized segments, so that re-rendering an edited document only
+    synthesizes the changed segments. Each entry is an int16 ``.npy`` file of shape (1, samples) at 22050 Hz,
+    stored under ``<cache_dir>/<key[:2]>/<key>.npy``. With ``max_bytes``, the least recently used entries
+    (by file modification time, refreshed on every hit) are removed once the cache grows past it.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._entries())
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        payload = json.dumps(parts, sort_keys=True, default=str).encode()
+        return hashlib.sha256(payload).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key + ".npy")
+
+    def _entries(self):
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith(".npy"):
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def get(self, key: str) -> Optional[torch.Tensor]:
+        """
+        Returns the cached waveform as a float tensor of shape (1, samples) in int16 range, or None.
+        """
+        path = self._path(key)
+        try:
+            wav = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return torch.from_numpy(wav.astype(np.float32))
+
+    def put(self, key: str, wav: torch.Tensor):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        data = wav.detach().cpu().type(torch.int16).numpy()
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, data)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path)
+            if self.max_bytes is not None and self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # 按修改时间淘汰到上限的 90%，避免每次写入都扫描目录
+        entries = sorted(self._entries(), key=lambda e: e[2])
+        size = sum(e[1] for e in entries)
+        target = int(self.max_bytes * 0.9)
+        for path, entry_size, _ in entries:
+            if size <= target:
+                break
+            try:
+                os.remove(path)
+                size -= entry_size
+            except OSError:
+                continue
+        self._size = size